@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+劳动法维权举证指导 - 离线批量推理导出/导入
+
+将多案例对话数据集转换为OpenAI兼容的批量请求文件（JSONL，每行一次阶段调用），
+并将服务端返回的批量结果文件解析回流水线的结构化输出，用于大规模归档处理。
+
+流水线各阶段存在依赖，因此按阶段依次进行：
+1. analysis：案例分析（输入为对话数据集）
+2. extraction：证据清单提取（输入为第1步导入的分析结果）
+3. key_points：证据关键要点分析（输入为第2步导入的证据清单）
+
+custom_id 形如 case-000001-analysis / case-000001-key_points-002，
+由案例序号、阶段与证据序号确定，对同一输入重复导出时保持稳定。
+"""
+
+import json
+import argparse
+from typing import List, Dict, Any, Optional, Callable, Tuple, Iterable, Iterator
+
+from labor_law_guidance import (
+    LaborLawGuidance, DEFAULT_EVIDENCE_ITEMS, ANALYSIS_FAILED_PREFIX, STAGE_ANALYSIS, STAGE_EXTRACTION,
+    STAGE_KEY_POINTS, is_failed_analysis
+)
+from conversation_dataset import iter_conversation_records
+from stage_profiler import StageProfiler, DEFAULT_SAMPLE_EVERY, print_profile_summary
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# 可通过批量接口离线处理的环节
+STAGES = [STAGE_ANALYSIS, STAGE_EXTRACTION, STAGE_KEY_POINTS]
+
+
+def make_custom_id(case_index: int, stage: str, item_index: Optional[int] = None) -> str:
+    """生成稳定的custom_id"""
+    custom_id = f"case-{case_index:06d}-{stage}"
+    if item_index is not None:
+        custom_id += f"-{item_index:03d}"
+    return custom_id
+
+
+def parse_custom_id(custom_id: str) -> Tuple[int, str, Optional[int]]:
+    """解析custom_id，返回 (案例序号, 阶段, 证据序号或None)"""
+    parts = custom_id.split("-")
+    if len(parts) < 3 or parts[0] != "case":
+        raise ValueError(f"无法识别的custom_id: {custom_id}")
+    case_index = int(parts[1])
+    if parts[-1].isdigit() and len(parts) > 3:
+        return case_index, "-".join(parts[2:-1]), int(parts[-1])
+    return case_index, "-".join(parts[2:]), None
+
+
+def write_jsonl(lines: Iterable[Dict], file_path: str) -> int:
+    """写出JSONL文件，返回写出行数"""
+    count = 0
+    with open(file_path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def read_jsonl(file_path: str) -> List[Dict]:
+    """读取JSONL文件（忽略空行）"""
+    lines = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                lines.append(json.loads(line))
+    return lines
+
+
+def load_stage_outputs(file_path: str) -> Dict[int, Any]:
+    """读取导入后保存的阶段输出（JSON对象的键为案例序号）"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {int(k): v for k, v in data.items()}
+
+
+def save_stage_outputs(outputs: Dict[int, Any], file_path: str):
+    """保存阶段输出，供下一阶段导出使用"""
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump({str(k): v for k, v in sorted(outputs.items())}, f, ensure_ascii=False, indent=2)
+
+
+def iter_dataset_cases(dataset_file: str, errors: List[str]) -> Iterator[Optional[List[Dict]]]:
+    """流式读取数据集用于导出
+
+    格式错误的记录不中断导出：错误信息（含案例序号）追加到errors，并以None占位，
+    使后续案例的序号与custom_id仍与源文件中的位置一致。
+    """
+    for conversations, error in iter_conversation_records(dataset_file):
+        if error:
+            errors.append(error)
+        yield conversations
+
+
+class LaborLawBatchInference:
+    """离线批量推理：批量请求文件导出与结果文件导入"""
+
+    def __init__(self, guidance: Optional[LaborLawGuidance] = None):
+        """初始化
+
+        Args:
+            guidance: 用于构建请求与解析结果的指导系统实例；离线使用无需配置API密钥
+        """
+        self.guidance = guidance or LaborLawGuidance()
+
+    def _batch_line(self, custom_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": request,
+        }
+
+    # ---------- 导出 ----------
+
+    def build_analysis_requests(self, cases: Iterable[List[Dict]]) -> Iterator[Dict]:
+        """案例分析阶段：每个案例一条请求（cases可为流式读取的迭代器；为空或None的案例跳过，不影响后续序号）"""
+        for case_index, conversation in enumerate(cases):
+            if not conversation:
+                continue
+            request = self.guidance.build_case_analysis_request(conversation)
+            yield self._batch_line(make_custom_id(case_index, STAGE_ANALYSIS), request)
+
+    def build_extraction_requests(self, analyses: Dict[int, str]) -> Iterator[Dict]:
+        """证据清单提取阶段：每个分析结果一条请求（分析失败的案例不导出，导入时使用保底清单）"""
+        for case_index, ai_analysis in sorted(analyses.items()):
+            if is_failed_analysis(ai_analysis):
+                continue
+            request = self.guidance.build_evidence_extraction_request(ai_analysis)
+            request["response_format"] = {"type": "json_object"}
+            yield self._batch_line(make_custom_id(case_index, STAGE_EXTRACTION), request)
+
+    def build_key_points_requests(self, evidence_lists: Dict[int, List[Dict]]) -> Iterator[Dict]:
+        """关键要点分析阶段：每个案例的每项证据一条请求"""
+        for case_index, evidence_list in sorted(evidence_lists.items()):
+            for item_index, evidence in enumerate(evidence_list):
+                request = self.guidance.build_key_points_request(evidence['evidence_type'], evidence)
+                custom_id = make_custom_id(case_index, STAGE_KEY_POINTS, item_index)
+                yield self._batch_line(custom_id, request)
+
+    def export_batch_requests(self, stage: str, source: Any, output_file: str) -> int:
+        """导出指定阶段的批量请求文件
+
+        Args:
+            stage: analysis | extraction | key_points
+            source: analysis阶段为案例迭代器（如iter_dataset_cases），extraction阶段为{案例序号: 分析文本}，
+                    key_points阶段为{案例序号: 证据清单}
+            output_file: 输出的JSONL文件路径
+
+        Returns:
+            写出的请求条数
+        """
+        builders = {
+            STAGE_ANALYSIS: self.build_analysis_requests,
+            STAGE_EXTRACTION: self.build_extraction_requests,
+            STAGE_KEY_POINTS: self.build_key_points_requests,
+        }
+        if stage not in builders:
+            raise ValueError(f"未知阶段: {stage}，可选值: {STAGES}")
+        return write_jsonl(builders[stage](source), output_file)
+
+    # ---------- 导入 ----------
+
+    def read_batch_results(self, results_file: str) -> Dict[str, Optional[str]]:
+        """读取批量结果文件，返回 {custom_id: 模型输出文本}，失败的请求为None"""
+        results: Dict[str, Optional[str]] = {}
+        for line in read_jsonl(results_file):
+            custom_id = line.get("custom_id")
+            if not custom_id:
+                continue
+            content = None
+            response = line.get("response") or {}
+            if not line.get("error") and response.get("status_code", 200) == 200:
+                try:
+                    content = response["body"]["choices"][0]["message"]["content"]
+                except (KeyError, IndexError, TypeError):
+                    content = None
+            results[custom_id] = content
+        return results
+
+    def import_analysis_results(self, results: Dict[str, Optional[str]]) -> Dict[int, str]:
+        """导入案例分析结果：{案例序号: 分析文本}"""
+        analyses: Dict[int, str] = {}
+        for custom_id, content in results.items():
+            case_index, stage, _ = parse_custom_id(custom_id)
+            if stage != STAGE_ANALYSIS:
+                continue
+            analyses[case_index] = content if content is not None else f"{ANALYSIS_FAILED_PREFIX}: 批量请求未返回结果"
+        return analyses
+
+    def import_extraction_results(self, results: Dict[str, Optional[str]],
+                                  analyses: Dict[int, str]) -> Dict[int, List[Dict]]:
+        """导入证据清单提取结果：{案例序号: 规范化证据清单}
+
+        缺失或解析失败的结果与同步流程一致，回退到从分析文本回溯解析及保底清单；
+        分析失败的案例没有提取请求，直接使用保底清单。
+        """
+        evidence_lists: Dict[int, List[Dict]] = {}
+        for case_index, ai_analysis in analyses.items():
+            if is_failed_analysis(ai_analysis):
+                evidence_lists[case_index] = self.guidance._normalize_evidence_items(DEFAULT_EVIDENCE_ITEMS)
+                continue
+            content = results.get(make_custom_id(case_index, STAGE_EXTRACTION))
+            evidence_lists[case_index] = self.guidance.parse_evidence_extraction_result(content, ai_analysis)
+        return evidence_lists
+
+    def import_key_points_results(self, results: Dict[str, Optional[str]],
+                                  evidence_lists: Dict[int, List[Dict]]) -> Dict[int, Dict[str, str]]:
+        """导入关键要点分析结果：{案例序号: {证据类型: 关键要点}}
+
+        缺失的结果使用默认关键要点分析。
+        """
+        key_points: Dict[int, Dict[str, str]] = {}
+        for case_index, evidence_list in evidence_lists.items():
+            case_points: Dict[str, str] = {}
+            for item_index, evidence in enumerate(evidence_list):
+                evidence_type = evidence['evidence_type']
+                content = results.get(make_custom_id(case_index, STAGE_KEY_POINTS, item_index))
+                case_points[evidence_type] = content or self.guidance._default_key_points(evidence_type)
+            key_points[case_index] = case_points
+        return key_points
+
+    def import_batch_results(self, stage: str, results_file: str, source: Any = None) -> Dict[int, Any]:
+        """导入指定阶段的批量结果文件
+
+        Args:
+            stage: analysis | extraction | key_points
+            results_file: 批量结果JSONL文件路径
+            source: extraction阶段为{案例序号: 分析文本}，key_points阶段为{案例序号: 证据清单}
+
+        Returns:
+            {案例序号: 阶段结构化输出}
+        """
+        results = self.read_batch_results(results_file)
+        if stage == STAGE_ANALYSIS:
+            return self.import_analysis_results(results)
+        if stage == STAGE_EXTRACTION:
+            return self.import_extraction_results(results, source or {})
+        if stage == STAGE_KEY_POINTS:
+            return self.import_key_points_results(results, source or {})
+        raise ValueError(f"未知阶段: {stage}，可选值: {STAGES}")
+
+
+def _default_stub_responder(request_line: Dict) -> str:
+    """本地替身的默认应答：按阶段返回固定内容"""
+    _, stage, _ = parse_custom_id(request_line["custom_id"])
+    if stage == STAGE_EXTRACTION:
+        return json.dumps(DEFAULT_EVIDENCE_ITEMS, ensure_ascii=False)
+    if stage == STAGE_KEY_POINTS:
+        return "重点关注证据的真实性、完整性及与争议事实的关联性。"
+    return "\n".join(f"- **{item['evidence_type']}**：{item['description']}" for item in DEFAULT_EVIDENCE_ITEMS)
+
+
+def write_stub_results(requests_file: str, results_file: str,
+                       responder: Optional[Callable[[Dict], Optional[str]]] = None) -> int:
+    """根据批量请求文件生成本地替身结果文件（格式与OpenAI兼容批量结果一致）
+
+    Args:
+        requests_file: 批量请求JSONL文件
+        results_file: 输出的结果JSONL文件
+        responder: 接收请求行、返回模型输出文本的函数；返回None表示该请求失败
+
+    Returns:
+        写出的结果条数
+    """
+    responder = responder or _default_stub_responder
+    lines = []
+    for i, request_line in enumerate(read_jsonl(requests_file)):
+        content = responder(request_line)
+        if content is None:
+            lines.append({
+                "id": f"batch_req_{i:06d}",
+                "custom_id": request_line["custom_id"],
+                "response": None,
+                "error": {"code": "stub_error", "message": "本地替身模拟的失败请求"},
+            })
+            continue
+        lines.append({
+            "id": f"batch_req_{i:06d}",
+            "custom_id": request_line["custom_id"],
+            "response": {
+                "status_code": 200,
+                "request_id": f"stub-{i:06d}",
+                "body": {
+                    "object": "chat.completion",
+                    "model": request_line["body"].get("model"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                },
+            },
+            "error": None,
+        })
+    return write_jsonl(lines, results_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="劳动法维权举证指导 - 离线批量推理导出/导入")
+    parser.add_argument("--profile-dir", help="环节剖析报告目录；提供时记录构建请求与解析结果的本地CPU与内存开销")
+    parser.add_argument("--profile-every", type=int, default=DEFAULT_SAMPLE_EVERY, help="每个环节每N次调用剖析一次")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="抽样调用时同时用tracemalloc统计分配（全进程快照，开销较大）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="导出批量请求文件")
+    export_parser.add_argument("stage", choices=STAGES)
+    export_parser.add_argument("source", help="analysis阶段为对话数据集，其余阶段为上一阶段导入的输出")
+    export_parser.add_argument("output", help="批量请求JSONL文件路径")
+
+    import_parser = subparsers.add_parser("import", help="导入批量结果文件")
+    import_parser.add_argument("stage", choices=STAGES)
+    import_parser.add_argument("results", help="批量结果JSONL文件路径")
+    import_parser.add_argument("output", help="阶段结构化输出JSON文件路径")
+    import_parser.add_argument("--source", help="extraction阶段为分析输出，key_points阶段为证据清单输出")
+
+    stub_parser = subparsers.add_parser("stub", help="生成本地替身结果文件")
+    stub_parser.add_argument("requests", help="批量请求JSONL文件路径")
+    stub_parser.add_argument("results", help="替身结果JSONL文件路径")
+
+    args = parser.parse_args()
+    profiler = (StageProfiler(args.profile_dir, sample_every=args.profile_every, trace_memory=args.profile_memory)
+                if args.profile_dir else None)
+    batch = LaborLawBatchInference(LaborLawGuidance(profiler=profiler))
+
+    if args.command == "export":
+        errors: List[str] = []
+        if args.stage == STAGE_ANALYSIS:
+            source = iter_dataset_cases(args.source, errors)
+        else:
+            source = load_stage_outputs(args.source)
+        count = batch.export_batch_requests(args.stage, source, args.output)
+        print(f"✅ 已导出 {count} 条 {args.stage} 批量请求至 {args.output}")
+        if errors:
+            print(f"⚠️  跳过 {len(errors)} 条格式错误的记录：")
+            for error in errors:
+                print(f"❌ {error}")
+    elif args.command == "import":
+        if args.stage != STAGE_ANALYSIS and not args.source:
+            parser.error(f"{args.stage} 阶段导入需要 --source")
+        source = load_stage_outputs(args.source) if args.source else None
+        outputs = batch.import_batch_results(args.stage, args.results, source)
+        save_stage_outputs(outputs, args.output)
+        print(f"✅ 已导入 {len(outputs)} 个案例的 {args.stage} 结果至 {args.output}")
+    elif args.command == "stub":
+        count = write_stub_results(args.requests, args.results)
+        print(f"✅ 已生成 {count} 条替身结果至 {args.results}")
+
+    if profiler is not None:
+        profiler.dump()
+        profiler.close()
+        print_profile_summary(profiler)
+
+
+if __name__ == "__main__":
+    main()
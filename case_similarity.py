@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+近似案例检索索引
+
+对已分析过的对话计算字符n-gram的MinHash签名，并用LSH分桶检索近似案例：
+- 相似度达到 threshold 时直接复用已存储的案例分析与证据清单；
+- 相似度介于 warm_start_threshold 与 threshold 之间时，将已存储的证据清单
+  作为参考提供给案例分析调用（热启动）。
+索引以JSON文件保存在本地（每新增 save_every 个案例保存一次，运行结束时调用 flush()），
+并统计命中率等指标。
+"""
+
+import os
+import re
+import json
+import zlib
+import random
+import threading
+from typing import List, Dict, Optional, Tuple
+
+
+REUSE_SERVE = "serve"
+REUSE_WARM_START = "warm_start"
+
+INDEX_VERSION = 1
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# 计算签名前去除空白与常见标点，避免格式差异影响相似度
+_IGNORED_CHARS = re.compile(r"[\s，,。.；;：:！!？?、“”\"'‘’（）()《》【】\[\]…~～-]+")
+
+
+class CaseSimilarityIndex:
+    """基于MinHash/LSH的近似案例检索索引"""
+
+    def __init__(self, index_file: Optional[str] = None, threshold: float = 0.85,
+                 warm_start_threshold: float = 0.6, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 3, seed: int = 1229, save_every: int = 20):
+        """初始化索引
+
+        Args:
+            index_file: 索引文件路径；存在时自动加载
+            threshold: 直接复用已存储分析的最低相似度
+            warm_start_threshold: 作为热启动参考的最低相似度
+            num_perm: MinHash签名长度
+            bands: LSH分段数，需整除num_perm
+            shingle_size: 字符n-gram长度
+            seed: 生成哈希参数的随机种子（同一索引文件需保持一致）
+            save_every: 每新增多少个案例自动保存一次索引文件，0表示只在flush()时保存
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm必须能被bands整除")
+        self.index_file = index_file
+        self.threshold = threshold
+        self.warm_start_threshold = warm_start_threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self.save_every = save_every
+
+        rng = random.Random(seed)
+        self._permutations = [
+            (rng.randint(1, _MERSENNE_PRIME - 1), rng.randint(0, _MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+        self.entries: Dict[str, Dict] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = {}
+        self.metrics = {"lookups": 0, "served": 0, "warm_starts": 0, "misses": 0}
+        # 并发处理多个案例时保护索引与指标
+        self._lock = threading.RLock()
+        # 写文件单独加锁，序列化过程不阻塞检索；_generation为索引的修改次数
+        self._save_lock = threading.Lock()
+        self._generation = 0
+        self._saved_generation = 0
+
+        if index_file and os.path.exists(index_file):
+            self.load(index_file)
+
+    # ---------- 签名 ----------
+
+    def _case_text(self, conversation_data: List[Dict]) -> str:
+        # 以用户陈述的案情为准，律师回复的措辞差异不影响相似度
+        text = "".join(msg.get('value', '') for msg in conversation_data if msg.get('from') == 'human')
+        if not text:
+            text = "".join(msg.get('value', '') for msg in conversation_data)
+        return _IGNORED_CHARS.sub("", text)
+
+    def signature(self, conversation_data: List[Dict]) -> List[int]:
+        """计算对话的MinHash签名"""
+        text = self._case_text(conversation_data)
+        n = self.shingle_size
+        shingles = {text[i:i + n] for i in range(max(len(text) - n + 1, 1))}
+        hashes = [zlib.crc32(s.encode('utf-8')) for s in shingles if s]
+        if not hashes:
+            return [_MAX_HASH] * self.num_perm
+        return [
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._permutations
+        ]
+
+    def similarity(self, sig_a: List[int], sig_b: List[int]) -> float:
+        """由MinHash签名估计Jaccard相似度"""
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / self.num_perm
+
+    def _band_keys(self, sig: List[int]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [(b, tuple(sig[b * self.rows:(b + 1) * self.rows])) for b in range(self.bands)]
+
+    # ---------- 检索与写入 ----------
+
+    def lookup(self, conversation_data: List[Dict]) -> Optional[Dict]:
+        """检索最相似的已分析案例
+
+        Returns:
+            相似度不低于warm_start_threshold时返回
+            {case_id, similarity, reuse, analysis, evidence_list}，reuse为serve或warm_start；否则返回None
+        """
+        sig = self.signature(conversation_data)
+        with self._lock:
+            return self._lookup_signature(sig)
+
+    def _lookup_signature(self, sig: List[int]) -> Optional[Dict]:
+        self.metrics["lookups"] += 1
+        candidates = set()
+        for key in self._band_keys(sig):
+            candidates.update(self._buckets.get(key, ()))
+
+        best_id, best_sim = None, 0.0
+        for case_id in candidates:
+            sim = self.similarity(sig, self.entries[case_id]["signature"])
+            if sim > best_sim:
+                best_id, best_sim = case_id, sim
+
+        if best_id is None or best_sim < self.warm_start_threshold:
+            self.metrics["misses"] += 1
+            return None
+
+        reuse = REUSE_SERVE if best_sim >= self.threshold else REUSE_WARM_START
+        self.metrics["served" if reuse == REUSE_SERVE else "warm_starts"] += 1
+        entry = self.entries[best_id]
+        return {
+            "case_id": best_id,
+            "similarity": best_sim,
+            "reuse": reuse,
+            "analysis": entry["analysis"],
+            "evidence_list": [dict(item) for item in entry["evidence_list"]],
+        }
+
+    def add(self, conversation_data: List[Dict], analysis: str, evidence_list: List[Dict],
+            case_id: Optional[str] = None) -> str:
+        """写入一条已分析案例，返回其case_id（每新增save_every个案例自动保存一次）"""
+        sig = self.signature(conversation_data)
+        autosave = False
+        with self._lock:
+            case_id = case_id or f"case-{len(self.entries):06d}"
+            if case_id in self.entries:
+                self._unbucket(case_id)
+            self.entries[case_id] = {
+                "signature": sig,
+                "analysis": analysis,
+                "evidence_list": evidence_list,
+            }
+            for key in self._band_keys(sig):
+                self._buckets.setdefault(key, []).append(case_id)
+            self._generation += 1
+            autosave = (bool(self.index_file) and self.save_every > 0
+                        and self._generation - self._saved_generation >= self.save_every)
+        if autosave:
+            self.save(self.index_file)
+        return case_id
+
+    def _unbucket(self, case_id: str):
+        for key in self._band_keys(self.entries[case_id]["signature"]):
+            bucket = self._buckets.get(key, [])
+            if case_id in bucket:
+                bucket.remove(case_id)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    # ---------- 指标 ----------
+
+    def stats(self) -> Dict[str, float]:
+        """检索指标：检索次数、直接复用/热启动/未命中次数及命中率"""
+        lookups = self.metrics["lookups"]
+        return {
+            **self.metrics,
+            "cases": len(self.entries),
+            "hit_rate": self.metrics["served"] / lookups if lookups else 0.0,
+            "warm_start_rate": self.metrics["warm_starts"] / lookups if lookups else 0.0,
+        }
+
+    # ---------- 持久化 ----------
+
+    def save(self, index_file: str):
+        """保存索引（先写临时文件再替换，避免中断时损坏）
+
+        在锁内只复制条目，序列化与写文件在锁外进行，不阻塞并发的检索与写入。
+        """
+        with self._lock:
+            generation = self._generation
+            entries = dict(self.entries)
+        tmp_file = index_file + ".tmp"
+        with self._save_lock:
+            # 其他线程已写出更新的索引时不再用旧快照覆盖
+            if index_file == self.index_file and generation < self._saved_generation:
+                return
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "version": INDEX_VERSION,
+                    "num_perm": self.num_perm,
+                    "bands": self.bands,
+                    "shingle_size": self.shingle_size,
+                    "seed": self.seed,
+                    "entries": entries,
+                }, f, ensure_ascii=False)
+            os.replace(tmp_file, index_file)
+            if index_file == self.index_file:
+                self._saved_generation = generation
+
+    def flush(self):
+        """将尚未保存的新增案例写入索引文件（运行结束时调用）"""
+        if self.index_file and self._generation != self._saved_generation:
+            self.save(self.index_file)
+
+    def load(self, index_file: str):
+        """加载索引；签名参数与当前配置不一致时拒绝加载"""
+        with open(index_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        params = (data.get("num_perm"), data.get("bands"), data.get("shingle_size"), data.get("seed"))
+        if params != (self.num_perm, self.bands, self.shingle_size, self.seed):
+            raise ValueError(f"索引文件 {index_file} 的签名参数与当前配置不一致")
+        self.entries = data.get("entries", {})
+        self._buckets = {}
+        for case_id, entry in self.entries.items():
+            for key in self._band_keys(entry["signature"]):
+                self._buckets.setdefault(key, []).append(case_id)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+案例类型分类与证据清单模板
+
+多数劳动争议属于少数几种类型。classify_case 基于用户陈述中的关键词对案例分类，
+build_template_checklist 将命中的类型映射为预置的证据清单模板（字段由默认证据信息补全），
+使证据清单可以立即展示，再由模型分析结果异步补充或修正。
+修正时按证据别名（如“书面劳动合同”与“劳动合同”）对应模板条目，避免同一证据重复出现。
+"""
+
+import re
+from typing import List, Dict, Tuple, Set
+
+
+TEMPLATE_VERSION = "1.0"
+
+CASE_ILLEGAL_TERMINATION = "违法解除"
+CASE_UNPAID_WAGES = "拖欠工资"
+CASE_OVERTIME = "加班费"
+CASE_ANNUAL_LEAVE = "未休年假"
+CASE_NO_CONTRACT = "未签合同双倍工资"
+
+# 各类型的关键词及权重；同一关键词在用户陈述中多次出现按出现次数累计
+CASE_TYPE_KEYWORDS: Dict[str, Dict[str, float]] = {
+    CASE_ILLEGAL_TERMINATION: {
+        "解除": 2.0, "开除": 2.0, "辞退": 2.0, "解雇": 2.0, "不能胜任": 3.0,
+        "通知书": 1.0, "赔偿金": 1.0, "违法": 1.0, "裁员": 2.0,
+    },
+    CASE_UNPAID_WAGES: {
+        "拖欠": 3.0, "欠薪": 3.0, "欠工资": 3.0, "没发工资": 3.0, "未发工资": 3.0,
+        "工资没发": 3.0, "克扣": 2.0, "扣工资": 2.0,
+    },
+    CASE_OVERTIME: {
+        "加班费": 3.0, "加班": 2.0, "周末": 1.0, "节假日": 1.0, "996": 2.0, "调休": 1.0,
+    },
+    CASE_ANNUAL_LEAVE: {
+        "年假": 3.0, "年休假": 3.0, "带薪年假": 1.0, "没休": 1.0, "未休": 1.0,
+    },
+    CASE_NO_CONTRACT: {
+        "没签合同": 3.0, "未签合同": 3.0, "没有签合同": 3.0, "未签订": 2.0, "没签劳动合同": 3.0,
+        "双倍工资": 3.0, "二倍工资": 3.0,
+    },
+}
+
+# 各类型的证据清单模板（evidence_type取自默认证据信息，便于补全法律要件与取证方法）
+CASE_TEMPLATES: Dict[str, List[Dict[str, str]]] = {
+    CASE_ILLEGAL_TERMINATION: [
+        {"evidence_type": "劳动合同", "description": "证明劳动关系存在的基础文件"},
+        {"evidence_type": "解除劳动合同通知书", "description": "证明解除事实与理由的核心文件"},
+        {"evidence_type": "工资发放记录", "description": "证明工资标准与已发放情况"},
+        {"evidence_type": "社保缴纳记录", "description": "辅助证明劳动关系与用工主体"},
+        {"evidence_type": "绩效考核记录", "description": "反驳“不能胜任”或证明绩效水平"},
+        {"evidence_type": "培训或调岗记录", "description": "证明单位是否履行培训或调岗程序"},
+    ],
+    CASE_UNPAID_WAGES: [
+        {"evidence_type": "劳动合同", "description": "证明劳动关系及约定的工资标准"},
+        {"evidence_type": "工资发放记录", "description": "证明已发放工资与拖欠金额"},
+        {"evidence_type": "考勤记录", "description": "证明拖欠期间实际出勤"},
+        {"evidence_type": "聊天记录", "description": "证明单位认可欠薪或承诺支付"},
+    ],
+    CASE_OVERTIME: [
+        {"evidence_type": "劳动合同", "description": "证明约定的工作时间与工资标准"},
+        {"evidence_type": "考勤记录", "description": "证明加班时间与时长"},
+        {"evidence_type": "工资发放记录", "description": "证明加班费未足额支付"},
+        {"evidence_type": "公司内部文件", "description": "证明加班安排或审批制度"},
+        {"evidence_type": "聊天记录", "description": "证明单位安排加班的沟通事实"},
+    ],
+    CASE_ANNUAL_LEAVE: [
+        {"evidence_type": "入职证明", "description": "证明工作年限以确定年假天数"},
+        {"evidence_type": "未休年假记录", "description": "证明未休天数与期间"},
+        {"evidence_type": "年假政策文件", "description": "证明单位年假制度"},
+        {"evidence_type": "月工资证明", "description": "计算未休年假工资报酬的基数"},
+    ],
+    CASE_NO_CONTRACT: [
+        {"evidence_type": "入职证明", "description": "证明用工起始时间"},
+        {"evidence_type": "工资发放记录", "description": "证明劳动关系与工资标准"},
+        {"evidence_type": "社保缴纳记录", "description": "辅助证明劳动关系与用工主体"},
+        {"evidence_type": "考勤记录", "description": "证明实际提供劳动"},
+        {"evidence_type": "聊天记录", "description": "证明单位未与劳动者签订书面合同"},
+    ],
+}
+
+
+# 常见证据别名（用于解析用户回答与对应模板条目，不改变证据清单本身）
+EVIDENCE_ALIASES: Dict[str, List[str]] = {
+    "劳动合同": ["书面劳动合同", "劳动合同书", "合同", "劳动协议", "聘用合同", "入职合同"],
+    "解除劳动合同通知书": ["解雇通知", "解除通知", "辞退通知", "解除劳动合同通知", "解聘通知", "开除通知"],
+    "工资条": ["工资发放记录", "薪资条", "工资单", "薪资单", "发薪记录", "薪酬记录", "工资条截图",
+              "银行流水", "工资流水", "银行工资流水"],
+    "社保缴纳记录": ["社保记录", "社保缴费记录", "社保明细", "社保清单", "五险缴费记录", "参保记录"],
+    "考勤记录": ["打卡记录", "门禁记录", "排班记录", "出勤记录", "工时记录", "加班记录"],
+    "培训或调岗记录": ["培训记录", "培训证明", "调岗通知", "岗位调整记录", "岗位变更记录", "调岗函"],
+    "未休年假记录": ["年假记录", "年休假记录", "带薪年假记录", "年假余额", "假期记录"],
+}
+
+# 合称证据名称中的分隔符（如“工资条/银行流水”）
+_NAME_SEPARATORS = re.compile(r"[/／、]")
+
+
+def evidence_aliases(name: str) -> List[str]:
+    """证据名称的别名：原名称、去掉常见后缀的简化名及预置别名，按长度降序（优先匹配更具体的别名）"""
+    base = [name]
+    simplified = name
+    for suf in ["书", "通知书", "证明", "记录", "材料", "清单", "合同书", "协议书", "说明"]:
+        simplified = simplified.replace(suf, "")
+    simplified = simplified.strip()
+    if simplified and simplified != name:
+        base.append(simplified)
+    if name in EVIDENCE_ALIASES:
+        base.extend(EVIDENCE_ALIASES[name])
+    # 预置别名反查：如“工资发放记录”对应“工资条”
+    for canonical, aliases in EVIDENCE_ALIASES.items():
+        if name in aliases:
+            base.append(canonical)
+            base.extend(aliases)
+    dedup = []
+    seen = set()
+    for a in base:
+        a = a.strip()
+        if a and a not in seen:
+            seen.add(a)
+            dedup.append(a)
+    dedup.sort(key=len, reverse=True)
+    return dedup
+
+
+def _alias_set(name: str) -> Set[str]:
+    parts = [p.strip() for p in _NAME_SEPARATORS.split(name) if p.strip()]
+    aliases = set(evidence_aliases(name))
+    if len(parts) > 1:
+        for part in parts:
+            aliases.update(evidence_aliases(part))
+    return aliases
+
+
+def classify_case(conversation_data: List[Dict], min_score: float = 3.0,
+                  min_ratio: float = 0.5) -> List[Tuple[str, float]]:
+    """对案例分类
+
+    仅统计用户陈述，避免律师提问中的关键词（如“有没有加班”）干扰分类。
+    得分最高的类型需达到min_score；其余类型还需达到最高得分的min_ratio，
+    避免顺带提及的关键词（如违法解除案情中的一句“年假”）带入整套无关模板。
+
+    Returns:
+        [(案例类型, 得分)]，按得分降序；无法分类时为空列表
+    """
+    text = "".join(msg.get('value', '') for msg in conversation_data if msg.get('from') == 'human')
+    scores = []
+    for case_type, keywords in CASE_TYPE_KEYWORDS.items():
+        score = sum(weight * text.count(keyword) for keyword, weight in keywords.items())
+        if score >= min_score:
+            scores.append((case_type, score))
+    scores.sort(key=lambda item: item[1], reverse=True)
+    if not scores:
+        return []
+    top = scores[0][1]
+    return [(case_type, score) for case_type, score in scores if score >= top * min_ratio]
+
+
+def build_template_checklist(case_types: List[str]) -> List[Dict[str, str]]:
+    """合并各类型的证据清单模板（按类型顺序，去重保序）"""
+    items: List[Dict[str, str]] = []
+    seen = set()
+    for case_type in case_types:
+        for item in CASE_TEMPLATES.get(case_type, []):
+            if item["evidence_type"] in seen:
+                continue
+            seen.add(item["evidence_type"])
+            items.append(dict(item))
+    return items
+
+
+def _match_template_items(template: List[Dict], refined: List[Dict]) -> Dict[int, int]:
+    """将模型清单条目对应到模板条目：先按名称完全一致，再按别名交集；返回 {模型条目序号: 模板条目序号}"""
+    matches: Dict[int, int] = {}
+    used = set()
+    index_by_type = {item["evidence_type"]: i for i, item in enumerate(template)}
+    for r, item in enumerate(refined):
+        t = index_by_type.get(item["evidence_type"])
+        if t is not None and t not in used:
+            matches[r] = t
+            used.add(t)
+    template_aliases = [_alias_set(item["evidence_type"]) for item in template]
+    for r, item in enumerate(refined):
+        if r in matches:
+            continue
+        aliases = _alias_set(item["evidence_type"])
+        for t, candidates in enumerate(template_aliases):
+            if t not in used and aliases & candidates:
+                matches[r] = t
+                used.add(t)
+                break
+    return matches
+
+
+def merge_refined_checklist(template: List[Dict], refined: List[Dict]) -> Tuple[List[Dict], Dict[str, List[str]]]:
+    """用模型生成的证据清单修正模板清单
+
+    模型条目按名称或别名（如“书面劳动合同”“工资条/银行流水”）对应到模板条目：
+    - changed：对应条目的重要性不同，采纳模型条目的字段，但保留模板的证据名称，
+      以免用户已作答的证据改名；作用、要件等措辞差异不视为变化（模板字段为人工整理）；
+    - added：无法对应任何模板条目的新证据；
+    模板中已有而模型未列出的证据保留。
+
+    Returns:
+        (合并后的清单, {"added": [...], "changed": [...]})，changed中为模板中的证据名称
+    """
+    matches = _match_template_items(template, refined)
+    refined_for_template = {t: refined[r] for r, t in matches.items()}
+    diff: Dict[str, List[str]] = {"added": [], "changed": []}
+    merged: List[Dict] = []
+    for t, item in enumerate(template):
+        refined_item = refined_for_template.get(t)
+        if refined_item and refined_item.get("importance") != item.get("importance"):
+            diff["changed"].append(item["evidence_type"])
+            merged.append({**refined_item, "evidence_type": item["evidence_type"]})
+        else:
+            merged.append(item)
+    for r, item in enumerate(refined):
+        if r not in matches:
+            diff["added"].append(item["evidence_type"])
+            merged.append(item)
+    return merged, diff
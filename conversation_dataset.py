@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+劳动争议对话数据集的流式读取
+
+支持 ShareGPT 风格的 [{"conversations": [...]}, ...] JSON数组与每行一个记录的JSONL，
+通过内存映射逐条扫描记录边界，仅在产出时解码单个案例，不会将整个数据集载入内存。
+可选构建字节偏移索引（可保存为旁路文件），按案例序号随机访问。
+"""
+
+import os
+import re
+import json
+import mmap
+from typing import List, Dict, Iterator, Optional, Tuple
+
+
+FORMAT_ARRAY = "array"
+FORMAT_JSONL = "jsonl"
+
+_UTF8_BOM = b"\xef\xbb\xbf"
+# JSON数组扫描时关心的结构字符（字符串内部的括号由 _skip_string 跳过）
+_ARRAY_TOKEN = re.compile(rb'[\[\]{}"]')
+# 顶层还需识别数字、null、true等标量元素，使其占据自己的案例序号
+_ARRAY_TOP_TOKEN = re.compile(rb'[\[\]{}"]|[^\s,\[\]{}"]+')
+_STRING_TOKEN = re.compile(rb'["\\]')
+_NON_WHITESPACE = re.compile(rb'\S')
+
+
+class ConversationFormatError(ValueError):
+    """对话数据集格式错误"""
+
+
+def validate_case(record: object, case_index: int) -> List[Dict]:
+    """校验单条记录并返回其conversations列表
+
+    要求记录为包含conversations列表的对象，每条消息含字符串类型的from与value字段。
+    """
+    if not isinstance(record, dict):
+        raise ConversationFormatError(f"第{case_index}个案例不是JSON对象")
+    conversations = record.get('conversations')
+    if not isinstance(conversations, list):
+        raise ConversationFormatError(f"第{case_index}个案例缺少conversations列表")
+    for i, msg in enumerate(conversations):
+        if not isinstance(msg, dict):
+            raise ConversationFormatError(f"第{case_index}个案例的第{i}条消息不是JSON对象")
+        if not isinstance(msg.get('from'), str) or not msg['from']:
+            raise ConversationFormatError(f"第{case_index}个案例的第{i}条消息缺少from字段")
+        if not isinstance(msg.get('value'), str):
+            raise ConversationFormatError(f"第{case_index}个案例的第{i}条消息缺少value字段")
+    return conversations
+
+
+def _skip_string(buf, pos: int) -> int:
+    """从字符串开引号之后的位置跳到闭引号之后"""
+    while True:
+        m = _STRING_TOKEN.search(buf, pos)
+        if not m:
+            raise ConversationFormatError("JSON字符串未闭合")
+        if m.group() == b'\\':
+            pos = m.end() + 1
+            continue
+        return m.end()
+
+
+def _iter_array_spans(buf, start: int) -> Iterator[Tuple[int, int]]:
+    """扫描JSON数组的顶层元素，产出每个元素的 (起始, 结束) 字节偏移
+
+    标量元素同样产出偏移（解码校验时报告为无效记录），保证案例序号与源文件中的位置一致。
+    """
+    pos = start + 1
+    depth = 0
+    elem_start = 0
+    while True:
+        m = (_ARRAY_TOP_TOKEN if depth == 0 else _ARRAY_TOKEN).search(buf, pos)
+        if not m:
+            raise ConversationFormatError("JSON数组未闭合")
+        ch = m.group()
+        pos = m.end()
+        if len(ch) > 1 or ch not in b'[]{}"':
+            yield m.start(), pos
+        elif ch == b'"':
+            string_start = m.start()
+            pos = _skip_string(buf, pos)
+            if depth == 0:
+                yield string_start, pos
+        elif ch in b'[{':
+            if depth == 0:
+                elem_start = m.start()
+            depth += 1
+        else:
+            if depth == 0:
+                if ch == b']':
+                    return
+                raise ConversationFormatError(f"JSON数组在偏移{m.start()}处括号不匹配")
+            depth -= 1
+            if depth == 0:
+                yield elem_start, pos
+
+
+def _iter_jsonl_spans(buf, start: int) -> Iterator[Tuple[int, int]]:
+    """扫描JSONL的非空行，产出每行的 (起始, 结束) 字节偏移"""
+    size = len(buf)
+    pos = start
+    while pos < size:
+        end = buf.find(b'\n', pos)
+        if end == -1:
+            end = size
+        m = _NON_WHITESPACE.search(buf, pos, end)
+        if m:
+            yield m.start(), end
+        pos = end + 1
+
+
+class ConversationDataset:
+    """内存映射的多案例对话数据集
+
+    用法：
+        with ConversationDataset("archive.jsonl") as dataset:
+            for conversations in dataset:
+                ...
+            case = dataset.get_case(1024)
+    """
+
+    def __init__(self, file_path: str, validate: bool = True, index_file: Optional[str] = None):
+        """打开数据集
+
+        Args:
+            file_path: JSON数组或JSONL文件路径
+            validate: 是否逐条校验消息的from/value字段
+            index_file: 偏移索引旁路文件；存在且与数据文件匹配时直接加载，
+                        否则在首次随机访问时构建并写入
+        """
+        self.file_path = file_path
+        self.validate = validate
+        self.index_file = index_file
+        self._file = open(file_path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        # 空文件无法映射，按空数据集处理
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._offsets: Optional[List[Tuple[int, int]]] = None
+        self.format, self._data_start = self._detect_format()
+
+    def _detect_format(self) -> Tuple[str, int]:
+        start = len(_UTF8_BOM) if self._buf[:len(_UTF8_BOM)] == _UTF8_BOM else 0
+        m = _NON_WHITESPACE.search(self._buf, start)
+        if m and self._buf[m.start():m.start() + 1] == b'[':
+            return FORMAT_ARRAY, m.start()
+        return FORMAT_JSONL, start
+
+    def close(self):
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def iter_spans(self) -> Iterator[Tuple[int, int]]:
+        """逐条产出记录的字节偏移，不解码内容"""
+        if not self._buf:
+            return iter(())
+        if self.format == FORMAT_ARRAY:
+            return _iter_array_spans(self._buf, self._data_start)
+        return _iter_jsonl_spans(self._buf, self._data_start)
+
+    def _decode(self, span: Tuple[int, int], case_index: int) -> List[Dict]:
+        start, end = span
+        try:
+            record = json.loads(self._buf[start:end])
+        except ValueError as e:
+            raise ConversationFormatError(f"第{case_index}个案例JSON解析失败: {e}") from e
+        if self.validate:
+            return validate_case(record, case_index)
+        return record.get('conversations', []) if isinstance(record, dict) else []
+
+    def __iter__(self) -> Iterator[List[Dict]]:
+        """逐条产出每个案例的conversations列表"""
+        for case_index, span in enumerate(self.iter_spans()):
+            yield self._decode(span, case_index)
+
+    def iter_records(self) -> Iterator[Tuple[Optional[List[Dict]], Optional[str]]]:
+        """逐条产出 (conversations, 错误信息)，单条记录解码或校验失败时不中断读取
+
+        记录边界扫描失败（如数组未闭合）时无法定位后续记录，仍抛出ConversationFormatError。
+        """
+        for case_index, span in enumerate(self.iter_spans()):
+            try:
+                yield self._decode(span, case_index), None
+            except ConversationFormatError as e:
+                yield None, str(e)
+
+    # ---------- 偏移索引 ----------
+
+    def _index_signature(self) -> Dict[str, object]:
+        stat = os.fstat(self._file.fileno())
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def build_index(self) -> List[Tuple[int, int]]:
+        """扫描全部记录边界构建偏移索引，若配置了index_file则一并写出"""
+        self._offsets = list(self.iter_spans())
+        if self.index_file:
+            self.save_index(self.index_file)
+        return self._offsets
+
+    def save_index(self, index_file: str):
+        """保存偏移索引"""
+        if self._offsets is None:
+            self.build_index()
+        with open(index_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                **self._index_signature(),
+                "format": self.format,
+                "offsets": self._offsets,
+            }, f)
+
+    def load_index(self, index_file: str) -> bool:
+        """加载偏移索引；索引与当前数据文件不匹配时返回False"""
+        try:
+            with open(index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        signature = self._index_signature()
+        if data.get("size") != signature["size"] or data.get("mtime") != signature["mtime"]:
+            return False
+        self._offsets = [tuple(span) for span in data.get("offsets", [])]
+        return True
+
+    def _ensure_index(self) -> List[Tuple[int, int]]:
+        if self._offsets is None:
+            if not (self.index_file and self.load_index(self.index_file)):
+                self.build_index()
+        return self._offsets
+
+    def __len__(self) -> int:
+        return len(self._ensure_index())
+
+    def get_case(self, case_index: int) -> List[Dict]:
+        """按案例序号随机访问"""
+        offsets = self._ensure_index()
+        if not 0 <= case_index < len(offsets):
+            raise IndexError(f"案例序号超出范围: {case_index}（共{len(offsets)}个案例）")
+        return self._decode(offsets[case_index], case_index)
+
+
+def iter_conversation_cases(file_path: str, validate: bool = True) -> Iterator[List[Dict]]:
+    """流式读取数据集，逐条产出每个案例的conversations列表"""
+    with ConversationDataset(file_path, validate=validate) as dataset:
+        yield from dataset
+
+
+def iter_conversation_records(file_path: str, validate: bool = True) -> Iterator[Tuple[Optional[List[Dict]], Optional[str]]]:
+    """流式读取数据集，逐条产出 (conversations, 错误信息)，格式错误的记录不中断读取"""
+    with ConversationDataset(file_path, validate=validate) as dataset:
+        yield from dataset.iter_records()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多轮证据核查状态
+
+用户往往分多次补充证据（如“还有考勤截图”）。EvidenceState 保存当前持有情况，
+每轮只解析新的回答并与现有持有情况比对，仅对状态发生变化的证据项重新分析，
+其余关键要点与个性化建议沿用上一轮的结果。
+"""
+
+from typing import List, Dict, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from labor_law_guidance import LaborLawGuidance
+
+
+class EvidenceState:
+    """多轮证据核查的持有状态"""
+
+    def __init__(self, guidance: "LaborLawGuidance", evidence_list: List[Dict]):
+        """初始化
+
+        Args:
+            guidance: 提供解析与模型分析能力的指导系统实例
+            evidence_list: 证据清单
+        """
+        self.guidance = guidance
+        self.evidence_list = evidence_list
+        self.rounds = 0
+        self.answers: List[str] = []
+        # 当前持有的证据：{证据类型: {status, evidence_info, details}}，格式与单轮解析结果一致
+        self.holdings: Dict[str, Dict] = {}
+        # 关键要点只与证据本身有关，按证据类型缓存，跨轮次复用
+        self.key_points: Dict[str, str] = {}
+        self.metrics = {"key_points_computed": 0, "key_points_reused": 0}
+        # 本轮新分析的证据（展示时不计为复用）
+        self._fresh_key_points = set()
+
+    @property
+    def user_evidence(self) -> Dict[str, Dict]:
+        """当前持有情况（供取证指导与个性化建议使用）"""
+        return dict(self.holdings)
+
+    def apply_answer(self, user_input: str) -> Dict[str, List[str]]:
+        """解析一轮新的回答并合并到当前持有情况
+
+        只解析本轮回答；后出现的表述覆盖之前的状态，明确否定的证据从持有中移除。
+
+        Returns:
+            本轮变化：{"added": [...], "changed": [...], "removed": [...]}
+        """
+        self.rounds += 1
+        self.answers.append(user_input)
+        self._fresh_key_points = set()
+        diff: Dict[str, List[str]] = {"added": [], "changed": [], "removed": []}
+
+        parsed = self.guidance._parse_user_evidence_input(user_input, self.evidence_list, include_negated=True)
+        negated = {k for k, v in parsed.items() if v['status'] == '否'}
+        owned = {k: v for k, v in parsed.items() if v['status'] != '否'}
+
+        # LLM只需判断尚未完整持有的证据
+        candidates = [e for e in self.evidence_list
+                      if self.holdings.get(e['evidence_type'], {}).get('status') != '是']
+        if candidates:
+            try:
+                llm_parsed = self.guidance._parse_user_evidence_with_llm(user_input, candidates)
+            except Exception as e:
+                self.guidance._mark_degraded("evidence_parse", e)
+                llm_parsed = {}
+            owned.update(llm_parsed)
+            negated -= set(llm_parsed)
+
+        for evidence_type, entry in owned.items():
+            previous = self.holdings.get(evidence_type)
+            if previous is None:
+                diff["added"].append(evidence_type)
+            elif previous['status'] != entry['status']:
+                diff["changed"].append(evidence_type)
+            else:
+                continue
+            self.holdings[evidence_type] = entry
+
+        for evidence_type in negated:
+            if evidence_type in self.holdings:
+                del self.holdings[evidence_type]
+                diff["removed"].append(evidence_type)
+
+        return diff
+
+    def prefetch_key_points(self, evidence_types: List[str]):
+        """批量分析尚未分析过的证据关键要点（合并为一次请求）"""
+        pending = [t for t in evidence_types if t not in self.key_points and t in self.holdings]
+        if not pending:
+            return
+        items = [self.holdings[t]['evidence_info'] for t in pending]
+        for evidence_type, analysis in self.guidance._analyze_evidence_key_points_batch(items).items():
+            self.key_points[evidence_type] = analysis
+            self.metrics["key_points_computed"] += 1
+            self._fresh_key_points.add(evidence_type)
+
+    def key_points_for(self, evidence_type: str) -> str:
+        """获取证据的关键要点，已分析过的直接复用"""
+        if evidence_type in self.key_points:
+            if evidence_type not in self._fresh_key_points:
+                self.metrics["key_points_reused"] += 1
+            return self.key_points[evidence_type]
+        evidence_info = self.holdings[evidence_type]['evidence_info']
+        analysis = self.guidance._analyze_evidence_key_points(evidence_type, evidence_info)
+        self.key_points[evidence_type] = analysis
+        self.metrics["key_points_computed"] += 1
+        return analysis
+
+    def missing_evidence(self) -> List[Dict]:
+        """当前仍缺失的证据"""
+        return [e for e in self.evidence_list if e['evidence_type'] not in self.holdings]
+
+    def status_of(self, evidence_type: str) -> Optional[str]:
+        entry = self.holdings.get(evidence_type)
+        return entry['status'] if entry else None
@@ -1,79 +1,515 @@
 import os
 import json
 import re
-from openai import OpenAI
-from typing import List, Dict, Any
+import time
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from openai import OpenAI, APIStatusError
+from typing import List, Dict, Any, Optional, Tuple
+
+from conversation_dataset import ConversationDataset
+from case_similarity import CaseSimilarityIndex, REUSE_SERVE, REUSE_WARM_START
+from session_budget import SessionDeadline, CircuitBreaker, DegradedModeError
+from evidence_state import EvidenceState
+from output_budget import OutputLengthBudget
+from case_templates import (
+    classify_case, build_template_checklist, merge_refined_checklist, evidence_aliases, TEMPLATE_VERSION
+)
+from stage_profiler import StageProfiler, DEFAULT_SAMPLE_EVERY, print_profile_summary
+
+
+MODEL_NAME = "qwen-max-latest"
+
+# 流水线中调用模型的各个环节
+STAGE_ANALYSIS = "analysis"
+STAGE_EXTRACTION = "extraction"
+STAGE_EVIDENCE_PARSE = "evidence_parse"
+STAGE_KEY_POINTS = "key_points"
+STAGE_ADVICE = "advice"
+
+# 案例分析失败时返回文本的前缀
+ANALYSIS_FAILED_PREFIX = "AI分析失败"
+
+
+def is_failed_analysis(ai_analysis: Optional[str]) -> bool:
+    """分析文本是否为空或分析失败的占位文本"""
+    return not ai_analysis or ai_analysis.startswith(ANALYSIS_FAILED_PREFIX)
+
+# 模型提取失败且无法从分析文本回溯解析时使用的保底证据清单
+DEFAULT_EVIDENCE_ITEMS: List[Dict[str, str]] = [
+    {
+        "evidence_type": "劳动合同",
+        "description": "证明劳动关系存在的基础文件",
+        "legal_requirements": "需双方签字盖章、LOADED/签署，真实性、合法性、关联性",
+        "importance": "关键证据",
+        "collection_method": "保留原件与清晰复印/扫描件；重点页拍照备份"
+    },
+    {
+        "evidence_type": "解除劳动合同通知书",
+        "description": "证明解除事实与理由的核心文件",
+        "legal_requirements": "应LOADED解除依据、理由、日期并加盖公司公章；保留送达凭证",
+        "importance": "关键证据",
+        "collection_method": "保留原件/邮寄凭证；如为邮件/系统通知，保留完整截图与元数据"
+    },
+    {
+        "evidence_type": "工资发放记录",
+        "description": "证明工资标准与已发放情况",
+        "legal_requirements": "银行流水/工资条与期间一致，能够对应至个人账户及发薪主体",
+        "importance": "重要证据",
+        "collection_method": "下载银行流水、保存工资条/邮件，必要时向财务索取盖章证明"
+    },
+    {
+        "evidence_type": "社保缴纳记录",
+        "description": "辅助证明劳动关系与用工主体",
+        "legal_requirements": "社保缴费明细与任职期间对应，显示单位名称与缴费基数",
+        "importance": "重要证据",
+        "collection_method": "人社App/线下大厅打印缴费明细，保留电子与纸质版"
+    },
+    {
+        "evidence_type": "绩效考核记录",
+        "description": "反驳“不能胜任”或证明绩效水平",
+        "legal_requirements": "来源客观、形成于争议前，能对应期间与岗位",
+        "importance": "重要证据",
+        "collection_method": "导出系统记录、保存邮件与截图，标注日期与来源"
+    },
+]
+
+# 常见证据类型的默认重要性、法律要件与取证方法，用于补全缺失字段
+DEFAULT_EVIDENCE_FIELDS: Dict[str, Dict[str, str]] = {
+    "劳动合同": {
+        "importance": "关键证据",
+        "legal_requirements": "需双方签字盖章、条款完整，真实性、合法性、关联性",
+        "collection_method": "保留原件与复印件，关键页拍照留存"
+    },
+    "解除劳动合同通知书": {
+        "importance": "关键证据",
+        "legal_requirements": "写明理由/依据/日期并加盖公章，保留送达凭证",
+        "collection_method": "保留原件/截图与邮件头信息，保存邮寄凭证"
+    },
+    "社保缴纳记录": {
+        "importance": "重要证据",
+        "legal_requirements": "明示单位名称、基数与缴费期间，能对应任职时段",
+        "collection_method": "人社App/大厅打印缴费明细"
+    },
+    "工资发放记录": {
+        "importance": "重要证据",
+        "legal_requirements": "银行流水与发薪记录一致，能对应个人账户与发薪主体",
+        "collection_method": "下载流水/保存工资条，必要时开具收入证明"
+    },
+    "绩效考核记录": {
+        "importance": "重要证据",
+        "legal_requirements": "来源客观、形成于争议前，能对应期间与岗位",
+        "collection_method": "导出系统记录、保存邮件与截图"
+    },
+    "培训或调岗记录": {
+        "importance": "重要证据",
+        "legal_requirements": "LOADED培训/调岗时间、原因、岗位及确认方式",
+        "collection_method": "保留OA/邮件/通知截图，向HR索取相关记录"
+    },
+    "入职证明": {
+        "importance": "辅助证据",
+        "legal_requirements": "能反映入职日期与岗位信息",
+        "collection_method": "用人单位开具，或以合同首页/登记表替代"
+    },
+    "月工资证明": {
+        "importance": "重要证据",
+        "legal_requirements": "能反映最近12个月平均工资及构成",
+        "collection_method": "银行流水+工资条/HR盖章证明"
+    },
+    "年假政策文件": {
+        "importance": "辅助证据",
+        "legal_requirements": "公司正式制度/员工手册生效并公示",
+        "collection_method": "下载制度/手册PDF或盖章纸质版"
+    },
+    "未休年假记录": {
+        "importance": "重要证据",
+        "legal_requirements": "能反映未休天数、期间与审批状态",
+        "collection_method": "系统截图/考勤导出，邮件确认"
+    },
+    "考勤记录": {
+        "importance": "重要证据",
+        "legal_requirements": "能反映出勤与加班时间，来源于单位系统或经单位确认",
+        "collection_method": "导出打卡/考勤系统记录，保存排班表与加班审批截图"
+    },
+    "聊天记录": {
+        "importance": "辅助证据",
+        "legal_requirements": "来源真实、未篡改，能反映沟通事实",
+        "collection_method": "导出微信/企微聊天，保留原文件与时间戳"
+    },
+    "公司内部文件": {
+        "importance": "辅助证据",
+        "legal_requirements": "与岗位/考核/制度直接相关，来源可追溯",
+        "collection_method": "保存岗位说明书、考核标准等，并注明来源"
+    },
+}
+
+# 未知证据类型的默认字段
+GENERIC_EVIDENCE_FIELDS: Dict[str, str] = {
+    "importance": "重要证据",
+    "legal_requirements": "满足真实性、合法性、关联性三性，注意形成时间与来源",
+    "collection_method": "保留原件/截图与电子版备份，必要时向单位申请证明"
+}
+
+# 关键要点分析调用失败时使用的默认分析
+DEFAULT_KEY_POINTS: Dict[str, str] = {
+    '劳动合同': '重点关注工作岗位、工资标准、工作时间、合同期限等条款是否明确，以及双方签字盖章是否完整',
+    '解除劳动合同通知书': '重点关注解除理由是否合法、程序是否规范、是否提及经济补偿等关键信息',
+    '工资条': '重点关注工资构成、发放时间、扣款项目是否合理，以及是否能证明实际工资水平',
+    '考勤记录': '重点关注工作时间、加班情况、请假记录是否真实完整，能否证明实际工作状况'
+}
+
+# 本地证据提取：分析文本中的证据条目（“- **证据名**：描述”或“1. **证据名**”）及其下级字段行
+_EVIDENCE_ITEM_PATTERN = re.compile(
+    r"^(\s*)(?:[-*\u2022]|\d+[.、)）])?\s*\*\*(.+?)\*\*\s*(?:[:：]\s*(.*?))?\s*$")
+_EVIDENCE_FIELD_PATTERN = re.compile(
+    r"^(\s*)[-*\u2022]\s*(?:\*\*)?([^:：*]{1,12}?)(?:\*\*)?\s*[:：]\s*(?:\*\*)?\s*(.+?)\s*$")
+_EVIDENCE_SECTION_PATTERN = re.compile(r"证据.*(清单|材料)|(清单|材料).*证据")
+# 证据名称中常见的字样，用于区分证据条目与“争议焦点”等其他加粗条目
+_EVIDENCE_NAME_HINT = re.compile(
+    r"合同|协议|通知|记录|证明|流水|工资|薪|社保|考勤|打卡|聊天|文件|截图|邮件|凭证|证据|表|单|书|制度|手册|录音|照片|证人")
+# 加粗且名称含上述字样、但描述的是证明标准或法律要件等而非证据本身的条目
+_NON_EVIDENCE_NAME = re.compile(r"证明标准|证明责任|举证责任|法律要件|争议焦点|法律依据|仲裁时效")
+# 证据小节之后的下一个标题：Markdown标题或行首的编号标题（非加粗条目）
+_MARKDOWN_HEADING = re.compile(r"^\s*(#{1,6})\s")
+_NUMBERED_HEADING = re.compile(r"^(?:\d+|[一二三四五六七八九十]+)[.、)）]\s*[^*\s]")
+# 简单要点解析（无结构化条目时）的置信度上限，低于默认阈值，因此仍会调用模型
+_FALLBACK_MAX_CONFIDENCE = 0.5
+# 下级字段名称到证据字段的映射（按顺序匹配）
+_EVIDENCE_FIELD_KEYWORDS = [
+    ("legal_requirements", ["要件", "标准", "要求", "效力"]),
+    ("collection_method", ["取证", "收集", "获取", "方法"]),
+    ("importance", ["重要", "等级", "优先"]),
+    ("description", ["作用", "证明", "目的", "内容", "说明"]),
+]
 
 
 class LaborLawGuidance:
     """劳动法维权举证指导系统"""
     
-    def __init__(self):
-        """初始化系统"""
-        self.client = OpenAI(
-            api_key=os.getenv("DASHSCOPE_API_KEY"),
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-        )
+    def __init__(self, client: Optional[OpenAI] = None, case_index: Optional[CaseSimilarityIndex] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None, local_extraction_threshold: float = 0.75,
+                 batch_key_points: bool = True, output_budget: Optional[OutputLengthBudget] = None,
+                 use_case_templates: bool = True, profiler: Optional[StageProfiler] = None):
+        """初始化系统
+
+        Args:
+            client: 可选的OpenAI兼容客户端；未提供时在首次调用模型时按环境变量创建，
+                    因此仅构建请求/解析结果的离线用法无需配置API密钥
+            case_index: 可选的近似案例索引，命中时复用已存储的案例分析与证据清单
+            circuit_breaker: 模型接口熔断器，默认每个实例一个
+            local_extraction_threshold: 本地证据提取的置信度阈值，达到时跳过提取调用；
+                                        设为大于1的值可始终调用模型
+            batch_key_points: 是否将多项证据的关键要点分析合并为一次请求
+            output_budget: 各环节输出长度预算，默认使用仅在内存中学习的预算
+            use_case_templates: 是否先按案例类型展示模板证据清单，再由模型分析异步修正
+            profiler: 可选的环节剖析器，提供时包装本实例的各环节方法并记录本地CPU与内存开销
+        """
+        self._client = client
+        # fork()得到的实例在首次调用模型时复用该实例的客户端
+        self._parent: Optional["LaborLawGuidance"] = None
+        self._client_lock = threading.Lock()
+        self.case_index = case_index
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.deadline: Optional[SessionDeadline] = None
+        # 本次会话中改用本地默认结果的环节：{环节: 原因}
+        self.degraded_stages: Dict[str, str] = {}
+        self.evidence_state: Optional[EvidenceState] = None
+        # 后台线程中暂存的提示信息，避免打断主线程的输入提示
+        self._output = threading.local()
+        self._advice_cache: Dict[str, str] = {}
+        self.local_extraction_threshold = local_extraction_threshold
+        # 证据清单来源统计：本地提取 / 模型提取
+        self.extraction_metrics = {"local": 0, "llm": 0}
+        self.batch_key_points = batch_key_points
+        self.output_budget = output_budget or OutputLengthBudget()
+        self.use_case_templates = use_case_templates
+        # 关键要点批量分析统计：批量请求数、批量覆盖项数、回退单项数、预计节省的提示词token数
+        self.key_points_metrics = {
+            "batched_requests": 0, "batched_items": 0, "fallback_items": 0, "prompt_tokens_saved": 0
+        }
+        self.matched_case: Optional[Dict] = None
         self.conversation_history = []
         self.user_evidence = {}
         self.required_evidence = []
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.attach(self)
+
+    @property
+    def client(self) -> OpenAI:
+        """OpenAI兼容客户端（惰性创建）"""
+        if self._client is None:
+            # 多个工作线程可能同时首次调用模型，只创建一个客户端
+            with self._client_lock:
+                if self._client is None and self._parent is not None:
+                    self._client = self._parent.client
+                if self._client is None:
+                    self._client = OpenAI(
+                        api_key=os.getenv("DASHSCOPE_API_KEY"),
+                        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+                    )
+        return self._client
+
+    @client.setter
+    def client(self, value: OpenAI):
+        self._client = value
+
+    def _create_completion(self, stage: str, output_scale: int = 1, **request):
+        """经会话预算与熔断器检查后调用模型
+
+        剩余预算不足或熔断打开时抛出DegradedModeError，调用方应改用本地默认结果；
+        设置了会话预算时，单次调用的超时不超过剩余预算且不由客户端自动重试
+        （每次重试都会重新获得全部剩余时间），失败交由熔断与降级处理。
+        按环节的输出长度预算设置max_tokens（output_scale为一次请求包含的输出项数），
+        输出因长度被截断时以两倍上限重试一次。
+        """
+        if self.deadline is not None and not self.deadline.allows(stage):
+            raise DegradedModeError(f"会话剩余时间不足（{self.deadline.remaining():.1f}秒）")
+        if not self.circuit_breaker.allow():
+            raise DegradedModeError("模型服务连续失败，已熔断")
+
+        max_tokens = None
+        if "max_tokens" not in request:
+            max_tokens = self.output_budget.max_tokens_for(stage, output_scale)
+            if max_tokens:
+                request["max_tokens"] = max_tokens
+
+        completion = self._send_completion(stage, request)
+        if max_tokens and self._finish_reason(completion) == "length":
+            self.output_budget.observe_truncation(stage)
+            if self.deadline is None or self.deadline.allows(stage):
+                request["max_tokens"] = max_tokens * 2
+                completion = self._send_completion(stage, request)
+
+        completion_tokens = getattr(getattr(completion, "usage", None), "completion_tokens", None)
+        if completion_tokens and self._finish_reason(completion) != "length":
+            self.output_budget.observe(stage, completion_tokens, output_scale)
+        return completion
+
+    def _send_completion(self, stage: str, request: Dict[str, Any]):
+        """发送一次模型请求，记录熔断器状态与延迟"""
+        client = self.client
+        if self.deadline is not None:
+            request["timeout"] = self.deadline.remaining()
+            client = client.with_options(max_retries=0)
+        start = time.monotonic()
+        try:
+            completion = client.chat.completions.create(**request)
+        except APIStatusError as e:
+            # 4xx（超时与限流除外）是请求本身的问题，服务可正常应答，不计为熔断失败
+            if 400 <= e.status_code < 500 and e.status_code not in (408, 429):
+                self.circuit_breaker.record_success()
+            else:
+                self.circuit_breaker.record_failure()
+            raise
+        except Exception:
+            self.circuit_breaker.record_failure()
+            raise
+        self.circuit_breaker.record_success()
+        self.output_budget.observe_latency(stage, time.monotonic() - start, capped="max_tokens" in request)
+        return completion
+
+    def _finish_reason(self, completion: Any) -> Optional[str]:
+        try:
+            return completion.choices[0].finish_reason
+        except (AttributeError, IndexError):
+            return None
+
+    def fork(self) -> "LaborLawGuidance":
+        """创建共享客户端、近似案例索引、熔断器、输出长度预算与各项配置，
+        但会话状态独立的实例，用于并发处理多个案例
+
+        客户端尚未创建时保持惰性：首次调用模型时才创建并与本实例共享。
+        """
+        forked = LaborLawGuidance(
+            client=self._client,
+            case_index=self.case_index,
+            circuit_breaker=self.circuit_breaker,
+            local_extraction_threshold=self.local_extraction_threshold,
+            batch_key_points=self.batch_key_points,
+            output_budget=self.output_budget,
+            use_case_templates=self.use_case_templates,
+            profiler=self.profiler,
+        )
+        forked._advice_cache = self._advice_cache
+        forked._parent = self
+        return forked
+
+    def _mark_degraded(self, stage: str, reason: Exception):
+        """记录环节已降级为本地默认结果"""
+        self.degraded_stages.setdefault(stage, str(reason))
+
+    def _notify(self, message: str):
+        """输出提示信息；在后台分析线程中则暂存，由主线程稍后统一打印"""
+        buffer = getattr(self._output, "buffer", None)
+        if buffer is not None:
+            buffer.append(message)
+        else:
+            print(message)
         
-    def load_conversation_history(self, file_path: str) -> bool:
-        """加载对话历史文件"""
+    def load_conversation_history(self, file_path: str, case_index: int = 0) -> bool:
+        """加载对话历史文件
+
+        Args:
+            file_path: JSON数组或JSONL格式的对话数据集
+            case_index: 要加载的案例序号，默认为第一个案例
+        """
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if isinstance(data, list) and len(data) > 0:
-                    self.conversation_history = data[0].get('conversations', [])
-                    return True
-                return False
+            with ConversationDataset(file_path) as dataset:
+                if case_index == 0:
+                    # 仅需第一个案例时无需扫描整个文件构建索引
+                    conversations = next(iter(dataset), None)
+                    if conversations is None:
+                        return False
+                else:
+                    conversations = dataset.get_case(case_index)
+                self.conversation_history = conversations
+                return True
         except Exception as e:
             print(f"加载对话历史失败: {e}")
             return False
     
+    def build_case_analysis_request(self, conversation_data: List[Dict],
+                                    reference_evidence: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """构建案例分析调用的请求参数（chat.completions.create的关键字参数）
+
+        Args:
+            conversation_data: 对话历史
+            reference_evidence: 相似案例的证据清单，作为热启动参考附在用户消息后
+        """
+        # 构建对话内容
+        conversation_text = ""
+        for msg in conversation_data:
+            role = "用户" if msg['from'] == 'human' else "律师"
+            conversation_text += f"{role}: {msg['value']}\n\n"
+
+        user_content = f"请分析以下劳动争议对话：\n\n{conversation_text}"
+        if reference_evidence:
+            reference_text = "\n".join(
+                f"- {e['evidence_type']}：{e.get('description', '')}" for e in reference_evidence
+            )
+            user_content += f"\n相似案例的证据清单（仅供参考，请结合本案情况增删调整）：\n{reference_text}"
+        
+        system_prompt = """
+        你是一位专业的劳动法律师，请基于以下劳动争议对话历史，分析案例并提供以下信息：
+        
+        1. 案例类型和争议焦点
+        2. 劳动者申请仲裁或诉讼时需要准备的具体证据材料清单
+        3. 每类证据的法律要件和证明标准
+        
+        请以结构化的方式回答，便于后续的交互式指导。
+        """
+        
+        return {
+            "model": MODEL_NAME,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content}
+            ],
+            "temperature": 0.3
+        }
+
     def analyze_case_with_ai(self, conversation_data: List[Dict]) -> str:
-        """使用AI分析劳动争议案例"""
+        """使用AI分析劳动争议案例
+
+        配置了近似案例索引时，先检索相似案例：足够相似则直接复用已存储的分析，
+        否则以相似案例的证据清单作为参考进行分析。
+        """
+        self.matched_case = None
+        reference_evidence = None
+        if self.case_index is not None:
+            self.matched_case = self.case_index.lookup(conversation_data)
+            if self.matched_case and self.matched_case["reuse"] == REUSE_SERVE:
+                return self.matched_case["analysis"]
+            if self.matched_case and self.matched_case["reuse"] == REUSE_WARM_START:
+                reference_evidence = self.matched_case["evidence_list"]
+
         try:
-            # 构建对话内容
-            conversation_text = ""
-            for msg in conversation_data:
-                role = "用户" if msg['from'] == 'human' else "律师"
-                conversation_text += f"{role}: {msg['value']}\n\n"
-            
-            system_prompt = """
-            你是一位专业的劳动法律师，请基于以下劳动争议对话历史，分析案例并提供以下信息：
-            
-            1. 案例类型和争议焦点
-            2. 劳动者申请仲裁或诉讼时需要准备的具体证据材料清单
-            3. 每类证据的法律要件和证明标准
-            
-            请以结构化的方式回答，便于后续的交互式指导。
-            """
-            
-            completion = self.client.chat.completions.create(
-                model="qwen-max-latest",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"请分析以下劳动争议对话：\n\n{conversation_text}"}
-                ],
-                temperature=0.3
+            completion = self._create_completion(
+                STAGE_ANALYSIS, **self.build_case_analysis_request(conversation_data, reference_evidence)
             )
             
             return completion.choices[0].message.content
             
         except Exception as e:
-            return f"AI分析失败: {e}"
+            self._mark_degraded(STAGE_ANALYSIS, e)
+            return f"{ANALYSIS_FAILED_PREFIX}: {e}"
     
+    def build_evidence_extraction_request(self, ai_analysis: str) -> Dict[str, Any]:
+        """构建证据清单提取调用的请求参数（强约束仅返回JSON）"""
+        system_prompt = (
+            "你是资深劳动法证据清单解析器。请从输入的分析文本中提取证据清单，"
+            "并且‘只返回’一个JSON数组，不要任何其他文字、解释或Markdown。"
+            "数组元素字段：evidence_type, description, legal_requirements, importance, collection_method。"
+            "importance 取值限定：'关键证据' | '重要证据' | '辅助证据'。"
+        )
+
+        return {
+            "model": MODEL_NAME,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": ai_analysis}
+            ],
+            "temperature": 0.1
+        }
+
     def extract_required_evidence(self, ai_analysis: str) -> List[Dict]:
         """从AI分析结果中提取所需证据清单
         目标：确保尽可能解析出“全部”证据项，而不是退回单一默认项。
         策略：
-        1) 先请求模型“只返回JSON数组”，并尽量用response_format强制JSON；
+        0) 先在本地解析分析文本中的证据条目，置信度达到阈值时直接返回，不调用模型；
+        1) 否则请求模型“只返回JSON数组”，并尽量用response_format强制JSON；
         2) 解析返回文本中的JSON代码块或方括号片段；
         3) 如果仍失败，则从ai_analysis原始分析文本中回溯解析要点条目，构造结构化清单。
+        若分析结果来自近似案例索引的直接复用，则同时复用其证据清单；
+        模型调用失败、会话预算不足或熔断时直接使用第3步的本地解析并标记为降级；
+        分析文本为空或为分析失败的占位文本时直接返回保底证据清单，不再调用模型
+        （只看本次的分析文本，同一实例此前某个案例的降级不影响后续案例）。
         """
-        import re
+        if (self.matched_case and self.matched_case["reuse"] == REUSE_SERVE
+                and self.matched_case["analysis"] == ai_analysis):
+            return [dict(item) for item in self.matched_case["evidence_list"]]
+
+        if is_failed_analysis(ai_analysis):
+            self._mark_degraded(STAGE_EXTRACTION, "案例分析未完成，使用保底证据清单")
+            return self._normalize_evidence_items(DEFAULT_EVIDENCE_ITEMS)
+
+        local_items, confidence = self._local_extract_evidence(ai_analysis)
+        if local_items and confidence >= self.local_extraction_threshold:
+            self.extraction_metrics["local"] += 1
+            return local_items
+
+        self.extraction_metrics["llm"] += 1
+        request = self.build_evidence_extraction_request(ai_analysis)
+        try:
+            # 尝试使用response_format强制JSON（若不支持将抛错，进入fallback）
+            try:
+                completion = self._create_completion(
+                    STAGE_EXTRACTION,
+                    **request,
+                    response_format={"type": "json_object"}  # 期望返回一个对象或数组
+                )
+            except DegradedModeError:
+                raise
+            except Exception:
+                completion = self._create_completion(STAGE_EXTRACTION, **request)
+            result_text = completion.choices[0].message.content
+        except Exception as e:
+            self._notify(f"提取证据清单失败，改用本地解析: {e}")
+            self._mark_degraded(STAGE_EXTRACTION, e)
+            result_text = None
 
+        try:
+            return self.parse_evidence_extraction_result(result_text, ai_analysis)
+        except Exception as e:
+            self._notify(f"提取证据清单失败: {e}")
+            return []
+
+    def parse_evidence_extraction_result(self, result_text: Optional[str], ai_analysis: str) -> List[Dict]:
+        """将证据清单提取调用的返回文本解析为规范化证据清单
+
+        result_text 为 None（调用失败）时直接进入回溯解析与保底清单。
+        """
         def _extract_json_from_text(text: str) -> str | None:
             # 优先提取```json ... ```代码块
             code_block = re.search(r"```json\s*(\[.*?\])\s*```",
@@ -93,37 +529,7 @@ class LaborLawGuidance:
                 return candidate
             return None
 
-        try:
-            # 使用AI提取结构化的证据清单（强约束仅返回JSON）
-            system_prompt = (
-                "你是资深劳动法证据清单解析器。请从输入的分析文本中提取证据清单，"
-                "并且‘只返回’一个JSON数组，不要任何其他文字、解释或Markdown。"
-                "数组元素字段：evidence_type, description, legal_requirements, importance, collection_method。"
-                "importance 取值限定：'关键证据' | '重要证据' | '辅助证据'。"
-            )
-
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": ai_analysis}
-            ]
-
-            # 尝试使用response_format强制JSON（若不支持将抛错，进入fallback）
-            try:
-                completion = self.client.chat.completions.create(
-                    model="qwen-max-latest",
-                    messages=messages,
-                    temperature=0.1,
-                    response_format={"type": "json_object"}  # 期望返回一个对象或数组
-                )
-                result_text = completion.choices[0].message.content
-            except Exception:
-                completion = self.client.chat.completions.create(
-                    model="qwen-max-latest",
-                    messages=messages,
-                    temperature=0.1
-                )
-                result_text = completion.choices[0].message.content
-
+        if result_text:
             # 先直接尝试解析
             try:
                 parsed = json.loads(result_text)
@@ -148,57 +554,114 @@ class LaborLawGuidance:
                 except Exception:
                     pass
 
-            # 兜底：直接从原始分析文本中解析（通常为Markdown要点列表）
-            fallback_items = self._fallback_parse_evidence_from_text(ai_analysis)
-            if fallback_items:
-                return self._normalize_evidence_items(fallback_items)
-
-            # 仍失败，保底返回多项常见证据而非单项
-            return self._normalize_evidence_items([
-                {
-                    "evidence_type": "劳动合同",
-                    "description": "证明劳动关系存在的基础文件",
-                    "legal_requirements": "需双方签字盖章、LOADED/签署，真实性、合法性、关联性",
-                    "importance": "关键证据",
-                    "collection_method": "保留原件与清晰复印/扫描件；重点页拍照备份"
-                },
-                {
-                    "evidence_type": "解除劳动合同通知书",
-                    "description": "证明解除事实与理由的核心文件",
-                    "legal_requirements": "应LOADED解除依据、理由、日期并加盖公司公章；保留送达凭证",
-                    "importance": "关键证据",
-                    "collection_method": "保留原件/邮寄凭证；如为邮件/系统通知，保留完整截图与元数据"
-                },
-                {
-                    "evidence_type": "工资发放记录",
-                    "description": "证明工资标准与已发放情况",
-                    "legal_requirements": "银行流水/工资条与期间一致，能够对应至个人账户及发薪主体",
-                    "importance": "重要证据",
-                    "collection_method": "下载银行流水、保存工资条/邮件，必要时向财务索取盖章证明"
-                },
-                {
-                    "evidence_type": "社保缴纳记录",
-                    "description": "辅助证明劳动关系与用工主体",
-                    "legal_requirements": "社保缴费明细与任职期间对应，显示单位名称与缴费基数",
-                    "importance": "重要证据",
-                    "collection_method": "人社App/线下大厅打印缴费明细，保留电子与纸质版"
-                },
-                {
-                    "evidence_type": "绩效考核记录",
-                    "description": "反驳“不能胜任”或证明绩效水平",
-                    "legal_requirements": "来源客观、形成于争议前，能对应期间与岗位",
-                    "importance": "重要证据",
-                    "collection_method": "导出系统记录、保存邮件与截图，标注日期与来源"
-                }
-            ])
+        # 兜底：直接从原始分析文本中解析（通常为Markdown要点列表）
+        fallback_items, _ = self._local_extract_evidence(ai_analysis)
+        if fallback_items:
+            return fallback_items
 
-        except Exception as e:
-            print(f"提取证据清单失败: {e}")
-            return []
+        # 仍失败，保底返回多项常见证据而非单项
+        return self._normalize_evidence_items(DEFAULT_EVIDENCE_ITEMS)
+
+    # 辅助：本地解析分析文本中的证据清单并给出置信度
+    def _local_extract_evidence(self, text: str) -> Tuple[List[Dict], float]:
+        """在本地从分析文本中提取证据清单
+
+        识别证据小节中的加粗条目及其下级字段行（法律要件、取证方法等），
+        同名条目的字段合并，缺失字段由默认证据字段补全；无法识别时退回简单要点解析。
+
+        Returns:
+            (规范化证据清单, 置信度0~1)。置信度综合条目数量、条目名称像证据的比例
+            以及作用与法律要件字段的覆盖率；退回简单要点解析时不超过_FALLBACK_MAX_CONFIDENCE。
+        """
+        lines = (text or "").splitlines()
+        start, end = 0, len(lines)
+        for i, line in enumerate(lines):
+            heading_item = _EVIDENCE_ITEM_PATTERN.match(line)
+            if _EVIDENCE_SECTION_PATTERN.search(line) and not (heading_item and heading_item.group(3)):
+                start = i + 1
+                end = self._evidence_section_end(lines, i)
+                break
+
+        items: Dict[str, Dict[str, str]] = {}
+        rejected = set()
+        current: Optional[Dict[str, str]] = None
+        current_indent = -1
+        for line in lines[start:end]:
+            if not line.strip():
+                continue
+            field_match = _EVIDENCE_FIELD_PATTERN.match(line)
+            if current is not None and field_match and len(field_match.group(1)) > current_indent:
+                key, value = field_match.group(2), field_match.group(3).strip('*').strip()
+                for field, keywords in _EVIDENCE_FIELD_KEYWORDS:
+                    if any(k in key for k in keywords):
+                        if field == "importance":
+                            value = next((f"{level}证据" for level in ("关键", "重要", "辅助") if level in value), "")
+                        if value and not current.get(field):
+                            current[field] = value
+                        break
+                continue
+
+            item_match = _EVIDENCE_ITEM_PATTERN.match(line)
+            if not item_match:
+                continue
+            name = item_match.group(2).strip().strip('：:').strip().strip('《》')
+            name = re.sub(r"^\d+[.、]\s*", "", name)
+            if not self._looks_like_evidence_name(name):
+                rejected.add(name)
+                current = None
+                continue
+            current = items.setdefault(name, {"evidence_type": name})
+            current_indent = len(item_match.group(1))
+            desc = (item_match.group(3) or "").strip()
+            if desc and not current.get("description"):
+                current["description"] = desc
+
+        parsed = list(items.values())
+        max_confidence = 1.0
+        if not parsed:
+            # 简单要点解析无法区分证据与“案例类型”“争议焦点”等要点，同样过滤名称并限制置信度
+            rejected = set()
+            for item in self._fallback_parse_evidence_from_text(text or ""):
+                if self._looks_like_evidence_name(item["evidence_type"]):
+                    parsed.append(item)
+                else:
+                    rejected.add(item["evidence_type"])
+            max_confidence = _FALLBACK_MAX_CONFIDENCE
+        if not parsed:
+            return [], 0.0
+
+        count_factor = min(1.0, len(parsed) / 3)
+        name_ratio = len(parsed) / (len(parsed) + len(rejected))
+        field_coverage = sum(
+            (1 if it.get("description") else 0)
+            + (1 if it.get("legal_requirements") or it["evidence_type"] in DEFAULT_EVIDENCE_FIELDS else 0)
+            for it in parsed
+        ) / (2 * len(parsed))
+        confidence = min(max_confidence, count_factor * name_ratio * (0.6 + 0.4 * field_coverage))
+        return self._normalize_evidence_items(parsed), confidence
+
+    def _looks_like_evidence_name(self, name: str) -> bool:
+        """条目名称是否像证据（而非争议焦点、证明标准等分析要点）"""
+        if not name or len(name) > 20 or _NON_EVIDENCE_NAME.search(name):
+            return False
+        return name in DEFAULT_EVIDENCE_FIELDS or bool(_EVIDENCE_NAME_HINT.search(name))
+
+    def _evidence_section_end(self, lines: List[str], section_line: int) -> int:
+        """证据小节的结束行：同级或更高级的下一个Markdown标题，或行首的编号标题"""
+        heading = _MARKDOWN_HEADING.match(lines[section_line])
+        level = len(heading.group(1)) if heading else None
+        for i in range(section_line + 1, len(lines)):
+            line = lines[i]
+            next_heading = _MARKDOWN_HEADING.match(line)
+            if next_heading:
+                if level is None or len(next_heading.group(1)) <= level:
+                    return i
+            elif _NUMBERED_HEADING.match(line):
+                return i
+        return len(lines)
 
     # 辅助：从自然语言/Markdown分析文本中回溯解析证据项
     def _fallback_parse_evidence_from_text(self, text: str) -> List[Dict]:
-        import re
         items: List[Dict] = []
 
         # 通过常见模式提取形如 “- **证据名**：描述” 的条目
@@ -231,74 +694,7 @@ class LaborLawGuidance:
     def _normalize_evidence_items(self, items: List[Dict]) -> List[Dict]:
         def default_by_type(name: str) -> Dict[str, str]:
             name = name.strip().strip('《》')
-            mapping = {
-                "劳动合同": {
-                    "importance": "关键证据",
-                    "legal_requirements": "需双方签字盖章、条款完整，真实性、合法性、关联性",
-                    "collection_method": "保留原件与复印件，关键页拍照留存"
-                },
-                "解除劳动合同通知书": {
-                    "importance": "关键证据",
-                    "legal_requirements": "写明理由/依据/日期并加盖公章，保留送达凭证",
-                    "collection_method": "保留原件/截图与邮件头信息，保存邮寄凭证"
-                },
-                "社保缴纳记录": {
-                    "importance": "重要证据",
-                    "legal_requirements": "明示单位名称、基数与缴费期间，能对应任职时段",
-                    "collection_method": "人社App/大厅打印缴费明细"
-                },
-                "工资发放记录": {
-                    "importance": "重要证据",
-                    "legal_requirements": "银行流水与发薪记录一致，能对应个人账户与发薪主体",
-                    "collection_method": "下载流水/保存工资条，必要时开具收入证明"
-                },
-                "绩效考核记录": {
-                    "importance": "重要证据",
-                    "legal_requirements": "来源客观、形成于争议前，能对应期间与岗位",
-                    "collection_method": "导出系统记录、保存邮件与截图"
-                },
-                "培训或调岗记录": {
-                    "importance": "重要证据",
-                    "legal_requirements": "LOADED培训/调岗时间、原因、岗位及确认方式",
-                    "collection_method": "保留OA/邮件/通知截图，向HR索取相关记录"
-                },
-                "入职证明": {
-                    "importance": "辅助证据",
-                    "legal_requirements": "能反映入职日期与岗位信息",
-                    "collection_method": "用人单位开具，或以合同首页/登记表替代"
-                },
-                "月工资证明": {
-                    "importance": "重要证据",
-                    "legal_requirements": "能反映最近12个月平均工资及构成",
-                    "collection_method": "银行流水+工资条/HR盖章证明"
-                },
-                "年假政策文件": {
-                    "importance": "辅助证据",
-                    "legal_requirements": "公司正式制度/员工手册生效并公示",
-                    "collection_method": "下载制度/手册PDF或盖章纸质版"
-                },
-                "未休年假记录": {
-                    "importance": "重要证据",
-                    "legal_requirements": "能反映未休天数、期间与审批状态",
-                    "collection_method": "系统截图/考勤导出，邮件确认"
-                },
-                "聊天记录": {
-                    "importance": "辅助证据",
-                    "legal_requirements": "来源真实、未篡改，能反映沟通事实",
-                    "collection_method": "导出微信/企微聊天，保留原文件与时间戳"
-                },
-                "公司内部文件": {
-                    "importance": "辅助证据",
-                    "legal_requirements": "与岗位/考核/制度直接相关，来源可追溯",
-                    "collection_method": "保存岗位说明书、考核标准等，并注明来源"
-                },
-            }
-            base = mapping.get(name, {
-                "importance": "重要证据",
-                "legal_requirements": "满足真实性、合法性、关联性三性，注意形成时间与来源",
-                "collection_method": "保留原件/截图与电子版备份，必要时向单位申请证明"
-            })
-            return base
+            return DEFAULT_EVIDENCE_FIELDS.get(name, GENERIC_EVIDENCE_FIELDS)
 
         normalized: List[Dict] = []
         for raw in items:
@@ -327,8 +723,23 @@ class LaborLawGuidance:
         return deduped
 
 
-    def interactive_evidence_check(self, evidence_list: List[Dict]) -> Dict:
-        """交互式证据核查 - 专业化两轮律师对话流程"""
+    def remember_case(self, conversation_data: List[Dict], ai_analysis: str, evidence_list: List[Dict]):
+        """将新分析的案例写入近似案例索引（直接复用的案例与分析失败的结果不写入）"""
+        if self.case_index is None or not evidence_list or is_failed_analysis(ai_analysis):
+            return
+        if self.matched_case and self.matched_case["reuse"] == REUSE_SERVE:
+            return
+        self.case_index.add(conversation_data, ai_analysis, evidence_list)
+
+    def interactive_evidence_check(self, evidence_list: List[Dict], max_rounds: int = 5,
+                                   refinement: Optional[Future] = None) -> Dict:
+        """交互式证据核查 - 专业化多轮律师对话流程
+
+        第一轮回答后可继续补充（直接回车结束）；每轮只解析新的回答，
+        仅对新增或状态变化的证据进行分析，其余结果沿用上一轮。
+        refinement 为 _start_checklist_refinement 启动的后台案例分析：用户作答期间模型在后台分析，
+        作答后用其结果修正模板清单，再解析回答。最终清单保存在 required_evidence。
+        """
         
         # 第一轮对话：律师列出证据清单并询问用户持有情况
         print("\n=== 律师证据指导 ===")
@@ -344,22 +755,121 @@ class LaborLawGuidance:
         
         print("律师：请问您目前手上有哪些证据材料？")
         print("（请直接输入您持有的证据材料，例如：我目前持有书面劳动合同、解除劳动合同通知书）")
-        
-        # 用户自由输入持有的证据
-        user_input = input("\n您的回答：").strip()
-        
-        # 解析用户输入，匹配证据类型
-        # 解析用户输入，匹配证据类型
-        # 原有规则解析
-        rule_parsed = self._parse_user_evidence_input(user_input, evidence_list)
-        # 补充：调用LLM解析并与规则结果合并（LLM识别优先）
+
+        state = EvidenceState(self, evidence_list)
+        self.evidence_state = state
+        prompt = "\n您的回答："
+        while state.rounds < max_rounds:
+            user_input = self._read_user_input(prompt)
+            if state.rounds > 0 and not user_input:
+                break
+
+            if refinement is not None:
+                evidence_list = self._apply_checklist_refinement(evidence_list, refinement)
+                state.evidence_list = evidence_list
+                refinement = None
+
+            # 解析本轮回答并与已有持有情况比对
+            diff = state.apply_answer(user_input)
+            if state.rounds == 1:
+                self._print_evidence_review(state)
+            else:
+                self._print_evidence_update(state, diff)
+
+            prompt = "\n还有其他证据需要补充或更正吗？（直接回车结束）："
+
+        self.required_evidence = state.evidence_list
+        return state.user_evidence
+
+    def _start_checklist_refinement(self, conversation_data: List[Dict]) -> Future:
+        """在后台线程中用fork()得到的实例进行案例分析并提取证据清单
+
+        后台实例拥有独立的会话状态（降级环节、相似案例命中、提取统计），结果在主线程取回时才合并，
+        超时被丢弃的结果不会写入本实例。线程为守护线程，退出时不等待尚未返回的模型调用。
+        Future的结果为 (分析文本, 证据清单, 提示信息, 后台实例)。
+        """
+        worker = self.fork()
+        worker.deadline = self.deadline
+        refinement: Future = Future()
+
+        def run():
+            try:
+                result = (*worker._analyze_and_extract(conversation_data), worker)
+            except Exception as e:
+                if refinement.set_running_or_notify_cancel():
+                    refinement.set_exception(e)
+                return
+            # 主线程已放弃等待（cancel）时丢弃结果
+            if refinement.set_running_or_notify_cancel():
+                refinement.set_result(result)
+
+        threading.Thread(target=run, name="checklist-refinement", daemon=True).start()
+        return refinement
+
+    def _analyze_and_extract(self, conversation_data: List[Dict]) -> Tuple[str, List[Dict], List[str]]:
+        """案例分析并提取证据清单（用于后台修正模板清单）
+
+        运行期间的提示信息不直接打印（主线程可能正在等待用户输入），随结果一并返回。
+        """
+        self._output.buffer = []
         try:
-            llm_parsed = self._parse_user_evidence_with_llm(user_input, evidence_list)
-        except Exception:
-            llm_parsed = {}
-        user_evidence = {**rule_parsed, **llm_parsed}
-        
-        # 第二轮对话：律师确认并分析现有证据，提供缺失证据的取证建议
+            ai_analysis = self.analyze_case_with_ai(conversation_data)
+            evidence_list = self.extract_required_evidence(ai_analysis)
+            self.remember_case(conversation_data, ai_analysis, evidence_list)
+            return ai_analysis, evidence_list, self._output.buffer
+        finally:
+            self._output.buffer = None
+
+    def _apply_checklist_refinement(self, template: List[Dict], refinement: Future) -> List[Dict]:
+        """等待后台分析完成，仅在其新增或修改证据项时更新模板清单"""
+        timeout = self.deadline.remaining() if self.deadline is not None else None
+        try:
+            ai_analysis, refined, messages, worker = refinement.result(timeout=timeout)
+        except FutureTimeoutError:
+            refinement.cancel()
+            self._mark_degraded(STAGE_ANALYSIS, "后台案例分析超出会话预算")
+            return template
+        except Exception as e:
+            self._mark_degraded(STAGE_ANALYSIS, e)
+            return template
+
+        for stage, reason in worker.degraded_stages.items():
+            self.degraded_stages.setdefault(stage, reason)
+        for key, value in worker.extraction_metrics.items():
+            self.extraction_metrics[key] = self.extraction_metrics.get(key, 0) + value
+        self.matched_case = worker.matched_case
+        for message in messages:
+            print(message)
+        if is_failed_analysis(ai_analysis):
+            # 分析降级时得到的是保底清单，不用其覆盖模板清单
+            return template
+
+        print("\n=== 案例分析结果 ===")
+        print(ai_analysis)
+        if not refined:
+            return template
+
+        merged, diff = merge_refined_checklist(template, refined)
+        if diff["added"] or diff["changed"]:
+            print("\n律师：结合案情分析，证据清单有以下更新：")
+            by_type = {e['evidence_type']: e for e in merged}
+            for evidence_type in diff["added"]:
+                evidence = by_type[evidence_type]
+                print(f"   • 新增：{evidence_type} ({evidence['importance']}) - {evidence['description']}")
+            for evidence_type in diff["changed"]:
+                print(f"   • 调整：{evidence_type} 调整为{by_type[evidence_type]['importance']}")
+        return merged
+
+    def _read_user_input(self, prompt: str) -> str:
+        """读取用户输入（等待输入期间不计入会话预算）"""
+        if self.deadline is not None:
+            with self.deadline.paused():
+                return input(prompt).strip()
+        return input(prompt).strip()
+
+    def _print_evidence_review(self, state: EvidenceState):
+        """第二轮对话：律师确认并分析现有证据，提供缺失证据的取证建议"""
+        user_evidence = state.holdings
         print("\n" + "=" * 60)
         print("\n律师：已确认您现有的证据材料。让我为您进行专业分析：\n")
         
@@ -374,18 +884,38 @@ class LaborLawGuidance:
         
         # 针对现有证据进行关键条款分析
         if owned_evidence:
+            state.prefetch_key_points(owned_evidence)
             print("📋 针对这些材料，需要重点关注：")
             for evidence_type in owned_evidence:
-                evidence_info = user_evidence[evidence_type]['evidence_info']
-                analysis = self._analyze_evidence_key_points(evidence_type, evidence_info)
+                analysis = state.key_points_for(evidence_type)
                 print(f"\n• {evidence_type}中的关键要点：")
                 print(f"  {analysis}")
         
-        # 对于缺失的证据，提供具体取证方法
-        missing_evidence = [evidence for evidence in evidence_list 
-                          if evidence['evidence_type'] not in user_evidence 
-                          or user_evidence[evidence['evidence_type']]['status'] == '否']
+        self._print_missing_evidence(state.missing_evidence())
         
+        print("\n律师：以上是基于您案件情况的专业建议，建议优先收集关键证据以提高维权成功率。")
+
+    def _print_evidence_update(self, state: EvidenceState, diff: Dict[str, List[str]]):
+        """补充回答后的增量反馈：只分析新增或变化的证据"""
+        print("\n" + "=" * 60)
+        if not any(diff.values()):
+            print("\n律师：没有识别到新的证据变化，您的持有情况保持不变。")
+            return
+
+        print("\n律师：已根据您的补充更新证据情况：\n")
+        state.prefetch_key_points(diff["added"] + diff["changed"])
+        for evidence_type in diff["added"] + diff["changed"]:
+            status_text = "完整" if state.status_of(evidence_type) == '是' else "部分"
+            label = "新增" if evidence_type in diff["added"] else "更新"
+            print(f"✅ {label}：{evidence_type} ({status_text})")
+            print(f"  关键要点：{state.key_points_for(evidence_type)}")
+        for evidence_type in diff["removed"]:
+            print(f"❌ 移除：{evidence_type}")
+
+        self._print_missing_evidence(state.missing_evidence())
+
+    def _print_missing_evidence(self, missing_evidence: List[Dict]):
+        """对于缺失的证据，提供具体取证方法"""
         if missing_evidence:
             print("\n⚠️  对于缺失的证据，建议通过以下方式收集：")
             for evidence in missing_evidence:
@@ -399,16 +929,14 @@ class LaborLawGuidance:
                     icon = "🟡" if evidence['importance'] == '重要证据' else "🟢"
                     print(f"\n{icon} {evidence['evidence_type']} ({evidence['importance']})")
                     print(f"   取证方法：{evidence['collection_method']}")
-        
-        print("\n律师：以上是基于您案件情况的专业建议，建议优先收集关键证据以提高维权成功率。")
-        
-        return user_evidence
 
-    def _parse_user_evidence_input(self, user_input: str, evidence_list: List[Dict]) -> Dict:
+    def _parse_user_evidence_input(self, user_input: str, evidence_list: List[Dict],
+                                   include_negated: bool = False) -> Dict:
         """解析用户输入的证据材料，仅从用户输入中提取其“已持有/部分持有”的证据。
         - 仅返回用户声称持有（完整或部分）的证据项；不为未提及或明确否定的证据填充“否”，
           以便后续通过“未在字典中”判定为缺失并提供取证建议。
         - 具备更稳健的否定、部分与肯定识别，避免“没有劳动合同”被误判为持有。
+        - include_negated为True时，明确否定的证据以“否”状态返回（多轮核查中用于撤销之前的持有）。
         """
         result: Dict[str, Dict] = {}
         text = (user_input or "").strip()
@@ -431,40 +959,6 @@ class LaborLawGuidance:
         partial_markers = ["部分", "不完整", "缺少", "只有", "复印件", "电子版", "截图", "影印件", "缺页", "仅有", "照片", "部分月份", "部分记录"]
         positive_markers = ["有", "持有", "在手上", "拿到", "收到", "保存", "留存", "具备", "已经", "已", "现有", "手里有", "手上有", "可以提供"]
 
-        # 常见证据别名映射（在不改变 evidence_list 的前提下增强匹配能力）
-        alias_map: Dict[str, List[str]] = {
-            "劳动合同": ["书面劳动合同", "劳动合同书", "合同", "劳动协议", "聘用合同", "入职合同"],
-            "解除劳动合同通知书": ["解雇通知", "解除通知", "辞退通知", "解除劳动合同通知", "解聘通知", "开除通知"],
-            "工资条": ["工资发放记录", "薪资条", "工资单", "薪资单", "发薪记录", "薪酬记录", "工资条截图"],
-            "社保缴纳记录": ["社保记录", "社保缴费记录", "社保明细", "社保清单", "五险缴费记录", "参保记录"],
-            "考勤记录": ["打卡记录", "门禁记录", "排班记录", "出勤记录", "工时记录", "加班记录"],
-            "培训或调岗记录": ["培训记录", "培训证明", "调岗通知", "岗位调整记录", "岗位变更记录", "调岗函"],
-            "未休年假记录": ["年假记录", "年休假记录", "带薪年假记录", "年假余额", "假期记录"],
-        }
-
-        def gen_aliases(name: str) -> List[str]:
-            # 基于原名称生成一些简化别名
-            base = [name]
-            simplified = name
-            for suf in ["书", "通知书", "证明", "记录", "材料", "清单", "合同书", "协议书", "说明"]:
-                simplified = simplified.replace(suf, "")
-            simplified = simplified.strip()
-            if simplified and simplified != name:
-                base.append(simplified)
-            # 合并预置别名
-            if name in alias_map:
-                base.extend(alias_map[name])
-            # 去重并按长度降序，优先匹配更长更具体的别名
-            dedup = []
-            seen = set()
-            for a in base:
-                a = a.strip()
-                if a and a not in seen:
-                    seen.add(a)
-                    dedup.append(a)
-            dedup.sort(key=len, reverse=True)
-            return dedup
-
         def sentence_has_marker(sent: str, markers: List[str]) -> bool:
             return any(m in sent for m in markers)
 
@@ -472,9 +966,10 @@ class LaborLawGuidance:
             etype = evidence.get("evidence_type", "").strip()
             if not etype:
                 continue
-            aliases = gen_aliases(etype)
+            aliases = evidence_aliases(etype)
             status_for_item = None  # None/"是"/"部分"
             matched_sentence = None
+            negated_sentence = None
 
             for sent in sentences:
                 # 如果该句未涉及任何别名则跳过
@@ -488,7 +983,11 @@ class LaborLawGuidance:
 
                 # 若出现明确否定，且无明显肯定，视为未持有（不记录到结果中）
                 neg = sentence_has_marker(sent, negative_markers)
-                pos = sentence_has_marker(sent, positive_markers)
+                # 肯定词需排除否定词中的字面重叠（如“没有”中的“有”）
+                sent_without_neg = sent
+                for m in sorted(negative_markers, key=len, reverse=True):
+                    sent_without_neg = sent_without_neg.replace(m, "")
+                pos = sentence_has_marker(sent_without_neg, positive_markers)
                 part = sentence_has_marker(sent, partial_markers)
 
                 # 更细的就近否定判断：别名前 6 个字符内若出现否定词，也视为否定
@@ -502,6 +1001,7 @@ class LaborLawGuidance:
 
                 if neg and not pos:
                     # 明确表示没有该证据 -> 不纳入已持有清单
+                    negated_sentence = negated_sentence or sent
                     continue
 
                 # 有肯定或未否定且被提及，结合是否部分的描述
@@ -518,6 +1018,12 @@ class LaborLawGuidance:
                     "evidence_info": evidence,
                     "details": f"从用户输入中识别：{matched_sentence or ''}".strip()
                 }
+            elif include_negated and negated_sentence:
+                result[etype] = {
+                    "status": "否",
+                    "evidence_info": evidence,
+                    "details": f"从用户输入中识别：{negated_sentence}"
+                }
 
         return result
 
@@ -553,8 +1059,9 @@ class LaborLawGuidance:
         )
 
         try:
-            completion = self.client.chat.completions.create(
-                model="qwen-max-latest",
+            completion = self._create_completion(
+                STAGE_EVIDENCE_PARSE,
+                model=MODEL_NAME,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_msg},
@@ -563,9 +1070,12 @@ class LaborLawGuidance:
                 response_format={"type": "json_object"}
             )
             result_text = completion.choices[0].message.content
+        except DegradedModeError:
+            raise
         except Exception:
-            completion = self.client.chat.completions.create(
-                model="qwen-max-latest",
+            completion = self._create_completion(
+                STAGE_EVIDENCE_PARSE,
+                model=MODEL_NAME,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_msg},
@@ -606,37 +1116,128 @@ class LaborLawGuidance:
             }
         return result
 
+    def build_key_points_request(self, evidence_type: str, evidence_info: Dict) -> Dict[str, Any]:
+        """构建证据关键要点分析调用的请求参数"""
+        system_prompt = f"""
+        你是专业的劳动法律师，请针对{evidence_type}这类证据，分析其关键法律要点。
+        
+        证据信息：{evidence_info}
+        
+        请简要说明在审查这类证据时需要重点关注的条款或要点，
+        以及这些要点对案件的重要意义。回答要专业但通俗易懂，不超过100字。
+        """
+        
+        return {
+            "model": MODEL_NAME,
+            "messages": [
+                {"role": "system", "content": system_prompt}
+            ],
+            "temperature": 0.2
+        }
+
     def _analyze_evidence_key_points(self, evidence_type: str, evidence_info: Dict) -> str:
         """分析证据的关键要点"""
         try:
-            system_prompt = f"""
-            你是专业的劳动法律师，请针对{evidence_type}这类证据，分析其关键法律要点。
-            
-            证据信息：{evidence_info}
-            
-            请简要说明在审查这类证据时需要重点关注的条款或要点，
-            以及这些要点对案件的重要意义。回答要专业但通俗易懂，不超过100字。
-            """
-            
-            completion = self.client.chat.completions.create(
-                model="qwen-max-latest",
-                messages=[
-                    {"role": "system", "content": system_prompt}
-                ],
-                temperature=0.2
+            completion = self._create_completion(
+                STAGE_KEY_POINTS, **self.build_key_points_request(evidence_type, evidence_info)
             )
             
             return completion.choices[0].message.content
             
         except Exception as e:
             # 提供默认的关键要点分析
-            default_analysis = {
-                '劳动合同': '重点关注工作岗位、工资标准、工作时间、合同期限等条款是否明确，以及双方签字盖章是否完整',
-                '解除劳动合同通知书': '重点关注解除理由是否合法、程序是否规范、是否提及经济补偿等关键信息',
-                '工资条': '重点关注工资构成、发放时间、扣款项目是否合理，以及是否能证明实际工资水平',
-                '考勤记录': '重点关注工作时间、加班情况、请假记录是否真实完整，能否证明实际工作状况'
-            }
-            return default_analysis.get(evidence_type, f'重点关注{evidence_type}的真实性、完整性和法律效力')
+            self._mark_degraded(STAGE_KEY_POINTS, e)
+            return self._default_key_points(evidence_type)
+
+    def build_key_points_batch_request(self, evidence_items: List[Dict]) -> Dict[str, Any]:
+        """构建多项证据关键要点合并分析的请求参数（返回 证据类型 → 关键要点 的JSON对象）"""
+        system_prompt = (
+            "你是专业的劳动法律师。请针对用户给出的每一类证据，分别简要说明审查时需要重点关注的条款或要点，"
+            "以及这些要点对案件的重要意义。回答要专业但通俗易懂，每项不超过100字。\n"
+            "只返回一个JSON对象（不要任何其他文字），键为evidence_type（必须与给定完全一致），值为该证据的关键要点文字。"
+        )
+        return {
+            "model": MODEL_NAME,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": json.dumps(evidence_items, ensure_ascii=False)}
+            ],
+            "temperature": 0.2,
+            "response_format": {"type": "json_object"}
+        }
+
+    def _analyze_evidence_key_points_batch(self, evidence_items: List[Dict]) -> Dict[str, str]:
+        """一次请求分析多项证据的关键要点
+
+        逐项校验返回结果，缺失或无效的条目改为单项分析（单项分析失败时使用默认要点）；
+        预算不足或熔断时全部使用默认要点。
+        """
+        if len(evidence_items) < 2 or not self.batch_key_points:
+            return {e['evidence_type']: self._analyze_evidence_key_points(e['evidence_type'], e)
+                    for e in evidence_items}
+
+        request = self.build_key_points_batch_request(evidence_items)
+        result: Dict[str, str] = {}
+        try:
+            completion = self._create_completion(STAGE_KEY_POINTS, output_scale=len(evidence_items), **request)
+            parsed = self._parse_json_object(completion.choices[0].message.content)
+            for evidence in evidence_items:
+                value = parsed.get(evidence['evidence_type'])
+                if isinstance(value, str) and 0 < len(value.strip()) <= 300:
+                    result[evidence['evidence_type']] = value.strip()
+            resolved = [e for e in evidence_items if e['evidence_type'] in result]
+            self._record_key_points_batch(request, resolved, completion)
+        except DegradedModeError as err:
+            self._mark_degraded(STAGE_KEY_POINTS, err)
+            return {e['evidence_type']: self._default_key_points(e['evidence_type']) for e in evidence_items}
+        except Exception:
+            pass
+
+        for evidence in evidence_items:
+            if evidence['evidence_type'] not in result:
+                self.key_points_metrics["fallback_items"] += 1
+                result[evidence['evidence_type']] = self._analyze_evidence_key_points(
+                    evidence['evidence_type'], evidence)
+        return result
+
+    def _record_key_points_batch(self, request: Dict[str, Any], resolved_items: List[Dict], completion: Any):
+        """统计批量请求相对逐项请求节省的提示词token数
+
+        只与批量请求实际覆盖的条目对应的逐项请求比较（回退条目仍需单项请求）；
+        逐项请求的token数按字符数比例由本次批量请求的实际用量估算（无用量信息时按字符数估算）。
+        """
+        batch_chars = sum(len(m["content"]) for m in request["messages"])
+        per_item_chars = sum(
+            len(m["content"])
+            for e in resolved_items
+            for m in self.build_key_points_request(e['evidence_type'], e)["messages"]
+        )
+        usage = getattr(completion, "usage", None)
+        batch_tokens = getattr(usage, "prompt_tokens", None) or batch_chars
+        per_item_tokens = batch_tokens * per_item_chars / max(batch_chars, 1)
+        self.key_points_metrics["batched_requests"] += 1
+        self.key_points_metrics["batched_items"] += len(resolved_items)
+        self.key_points_metrics["prompt_tokens_saved"] += int(per_item_tokens - batch_tokens)
+
+    def _parse_json_object(self, text: Optional[str]) -> Dict:
+        """解析模型返回的JSON对象，失败时截取第一个'{'到最后一个'}'重试"""
+        text = text or ""
+        try:
+            parsed = json.loads(text)
+        except Exception:
+            start = text.find('{')
+            end = text.rfind('}')
+            if start == -1 or end <= start:
+                return {}
+            try:
+                parsed = json.loads(text[start:end+1])
+            except Exception:
+                return {}
+        return parsed if isinstance(parsed, dict) else {}
+
+    def _default_key_points(self, evidence_type: str) -> str:
+        """默认的关键要点分析（模型不可用时使用）"""
+        return DEFAULT_KEY_POINTS.get(evidence_type, f'重点关注{evidence_type}的真实性、完整性和法律效力')
     
     def provide_collection_guidance(self, user_evidence: Dict, evidence_list: List[Dict]):
         """提供取证指导"""
@@ -673,58 +1274,126 @@ class LaborLawGuidance:
     def provide_personalized_advice(self, user_evidence: Dict, evidence_list: List[Dict]):
         """提供个性化建议"""
         try:
-            # 构建用户证据情况描述
-            evidence_summary = ""
-            for evidence_type, info in user_evidence.items():
-                evidence_summary += f"{evidence_type}: {info['status']}"
-                if 'details' in info:
-                    evidence_summary += f" ({info['details']})"
-                evidence_summary += "\n"
-            
-            system_prompt = """
-            基于用户当前的证据持有情况，请提供个性化的维权建议：
-            1. 优先级最高的取证任务
-            2. 注意事项和风险提示
+            advice = self._request_personalized_advice(user_evidence)
             
-            请用通俗易懂的语言，给出实用的建议。（不超过200个字）
-            """
+            print("\n=== 个性化维权建议 ===")
+            print(advice)
             
-            completion = self.client.chat.completions.create(
-                model="qwen-max-latest",
+        except Exception as e:
+            print(f"\n生成个性化建议失败: {e}")
+            self._mark_degraded(STAGE_ADVICE, e)
+            print("\n=== 个性化维权建议（本地默认） ===")
+            print(self._default_personalized_advice(user_evidence, evidence_list))
+
+    def generate_personalized_advice(self, user_evidence: Dict, evidence_list: List[Dict]) -> str:
+        """生成个性化建议文本（不打印）；模型不可用时返回本地默认建议并标记降级"""
+        try:
+            return self._request_personalized_advice(user_evidence)
+        except Exception as e:
+            self._mark_degraded(STAGE_ADVICE, e)
+            return self._default_personalized_advice(user_evidence, evidence_list)
+
+    def _request_personalized_advice(self, user_evidence: Dict) -> str:
+        """调用模型生成个性化建议"""
+        # 构建用户证据情况描述
+        evidence_summary = ""
+        for evidence_type, info in user_evidence.items():
+            evidence_summary += f"{evidence_type}: {info['status']}"
+            if 'details' in info:
+                evidence_summary += f" ({info['details']})"
+            evidence_summary += "\n"
+        
+        system_prompt = """
+        基于用户当前的证据持有情况，请提供个性化的维权建议：
+        1. 优先级最高的取证任务
+        2. 注意事项和风险提示
+        
+        请用通俗易懂的语言，给出实用的建议。（不超过200个字）
+        """
+        
+        # 证据情况与之前一致时（如多轮核查中无变化）直接复用已生成的建议
+        advice = self._advice_cache.get(evidence_summary)
+        if advice is None:
+            completion = self._create_completion(
+                STAGE_ADVICE,
+                model=MODEL_NAME,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": f"用户证据情况：\n{evidence_summary}"}
                 ],
                 temperature=0.3
             )
-            
-            print("\n=== 个性化维权建议 ===")
-            print(completion.choices[0].message.content)
-            
-        except Exception as e:
-            print(f"\n生成个性化建议失败: {e}")
+            advice = completion.choices[0].message.content
+            self._advice_cache[evidence_summary] = advice
+        return advice
+
+    def _default_personalized_advice(self, user_evidence: Dict, evidence_list: List[Dict]) -> str:
+        """默认的个性化建议（模型不可用时使用）：按重要性列出待收集的证据"""
+        pending = [e for e in evidence_list
+                   if e['evidence_type'] not in user_evidence
+                   or user_evidence[e['evidence_type']]['status'] != '是']
+        order = {'关键证据': 0, '重要证据': 1, '辅助证据': 2}
+        pending.sort(key=lambda e: order.get(e['importance'], 1))
+        if not pending:
+            return "您已持有清单中的全部证据，请妥善保管原件并备份电子版，注意仲裁时效（一般为一年）。"
+        lines = ["优先收集以下证据："]
+        for e in pending[:3]:
+            lines.append(f"• {e['evidence_type']}（{e['importance']}）：{e['collection_method']}")
+        lines.append("注意保留原件与形成时间、来源等信息，并注意仲裁时效（一般为一年）。")
+        return "\n".join(lines)
     
-    def run_guidance_session(self, conversation_file: str = "conversation.json"):
-        """运行完整的指导会话"""
+    def run_guidance_session(self, conversation_file: str = "conversation.json",
+                             deadline_seconds: Optional[float] = None, case_index: int = 0):
+        """运行完整的指导会话
+
+        Args:
+            conversation_file: 对话历史文件路径
+            deadline_seconds: 会话内模型调用的总时间预算（秒，不含等待用户输入的时间）；
+                              预算不足时各环节改用本地默认结果
+            case_index: 多案例数据集中要处理的案例序号
+        """
+        self.deadline = SessionDeadline(deadline_seconds) if deadline_seconds else None
+        self.degraded_stages = {}
+        self.matched_case = None
+        try:
+            self._run_guidance_session(conversation_file, case_index)
+        finally:
+            self.deadline = None
+
+    def _run_guidance_session(self, conversation_file: str, case_index: int = 0):
         print("=" * 60)
         print("         劳动法维权举证指导系统")
         print("=" * 60)
         
         # 1. 加载对话历史
         print("\n正在加载案例数据...")
-        if not self.load_conversation_history(conversation_file):
+        if not self.load_conversation_history(conversation_file, case_index):
             print("❌ 无法加载对话历史文件，请检查文件路径")
             return
         
         print("✅ 案例数据加载成功")
+
+        # 2. 案例分类：命中常见类型时立即展示模板证据清单，模型分析在用户作答期间后台进行
+        case_types = classify_case(self.conversation_history) if self.use_case_templates else []
+        if case_types:
+            template = self._normalize_evidence_items(build_template_checklist([t for t, _ in case_types]))
+            print(f"\n案例类型：{'、'.join(t for t, _ in case_types)}（证据清单模板 v{TEMPLATE_VERSION}）")
+            print("正在后台进行详细分析，请先核对以下证据清单...")
+            refinement = self._start_checklist_refinement(self.conversation_history)
+            user_evidence = self.interactive_evidence_check(template, refinement=refinement)
+            self.provide_collection_guidance(user_evidence, self.required_evidence)
+            self._print_session_summary()
+            return
         
-        # 2. AI分析案例
+        # 3. AI分析案例
         print("\n正在分析案例...")
         ai_analysis = self.analyze_case_with_ai(self.conversation_history)
+        if self.matched_case and self.matched_case["reuse"] == REUSE_SERVE:
+            print(f"✅ 命中相似案例（相似度 {self.matched_case['similarity']:.2f}），复用已有分析")
         print("\n=== 案例分析结果 ===")
         print(ai_analysis)
         
-        # 3. 提取证据清单
+        # 4. 提取证据清单
         print("\n正在生成证据清单...")
         evidence_list = self.extract_required_evidence(ai_analysis)
         print(evidence_list)
@@ -732,22 +1401,49 @@ class LaborLawGuidance:
         if not evidence_list:
             print("❌ 无法生成证据清单")
             return
+
+        self.remember_case(self.conversation_history, ai_analysis, evidence_list)
         
-        # 4. 交互式证据核查
+        # 5. 交互式证据核查
         user_evidence = self.interactive_evidence_check(evidence_list)
         
-        # 5. 提供取证指导
+        # 6. 提供取证指导
         self.provide_collection_guidance(user_evidence, evidence_list)
+        self._print_session_summary()
+
+    def _print_session_summary(self):
+        """会话结束时的统计与降级提示"""
+        if self.key_points_metrics["batched_requests"]:
+            m = self.key_points_metrics
+            print(f"\n关键要点批量分析：{m['batched_items']}项合并为{m['batched_requests']}次请求，"
+                  f"回退单项{m['fallback_items']}项，预计节省提示词约{m['prompt_tokens_saved']} tokens")
+
+        if self.degraded_stages:
+            print("\n⚠️  以下环节因超时或服务异常改用了本地默认结果：")
+            for stage, reason in self.degraded_stages.items():
+                print(f"   • {stage}: {reason}")
         
         print("\n=== 指导会话结束 ===")
         print("如需进一步咨询，建议联系专业律师。")
 
 
-def labor_law_guidance_main(conversation_file: str = "conversation.json"):
+def labor_law_guidance_main(conversation_file: str = "conversation.json",
+                            case_index_file: Optional[str] = None,
+                            deadline_seconds: Optional[float] = None,
+                            output_budget_file: Optional[str] = None,
+                            profile_dir: Optional[str] = None,
+                            profile_every: int = DEFAULT_SAMPLE_EVERY,
+                            profile_memory: bool = False):
     """劳动法维权举证指导主函数
     
     Args:
         conversation_file: 对话历史文件路径，默认为当前目录下的conversation.json
+        case_index_file: 近似案例索引文件路径；提供时复用相似案例的已有分析
+        deadline_seconds: 会话时间预算（秒）；超出预算的环节改用本地默认结果
+        output_budget_file: 输出长度预算的观测数据文件；提供时跨会话学习各环节的max_tokens
+        profile_dir: 环节剖析报告目录；提供时记录各环节的本地CPU与内存开销并在会话结束后写出
+        profile_every: 每个环节每N次调用剖析一次
+        profile_memory: 抽样调用时是否同时用tracemalloc统计分配（开销较大）
     
     Returns:
         None
@@ -774,10 +1470,37 @@ def labor_law_guidance_main(conversation_file: str = "conversation.json"):
             return
         
         # 创建指导系统实例
-        guidance_system = LaborLawGuidance()
+        case_index = CaseSimilarityIndex(case_index_file) if case_index_file else None
+        output_budget = OutputLengthBudget(output_budget_file) if output_budget_file else None
+        profiler = (StageProfiler(profile_dir, sample_every=profile_every, trace_memory=profile_memory)
+                    if profile_dir else None)
+        guidance_system = LaborLawGuidance(case_index=case_index, output_budget=output_budget, profiler=profiler)
         
         # 运行指导会话
-        guidance_system.run_guidance_session(conversation_file)
+        try:
+            guidance_system.run_guidance_session(conversation_file, deadline_seconds=deadline_seconds)
+        finally:
+            if case_index is not None:
+                case_index.flush()
+            if output_budget is not None:
+                output_budget.flush()
+            if profiler is not None:
+                profiler.dump()
+                profiler.close()
+                print_profile_summary(profiler)
+
+        if case_index is not None:
+            stats = case_index.stats()
+            print(f"相似案例索引：共{stats['cases']}个案例，命中率 {stats['hit_rate']:.0%}")
+
+        if output_budget is not None:
+            print("各环节输出长度预算：")
+            for stage, info in output_budget.report().items():
+                capped = info['mean_latency_capped']
+                uncapped = info['mean_latency_uncapped']
+                print(f"   • {stage}: max_tokens={info['max_tokens']}，截断重试{info['truncations']}次，"
+                      f"平均延迟 设上限 {f'{capped:.2f}s' if capped is not None else '-'} / "
+                      f"未设上限 {f'{uncapped:.2f}s' if uncapped is not None else '-'}")
         
     except KeyboardInterrupt:
         print("\n\n用户中断操作")
@@ -787,5 +1510,10 @@ def labor_law_guidance_main(conversation_file: str = "conversation.json"):
 
 
 if __name__ == "__main__":
-    # 直接运行时使用默认配置
-    labor_law_guidance_main()
\ No newline at end of file
+    # 直接运行时使用默认配置；设置LABOR_LAW_PROFILE_DIR环境变量时开启环节剖析，
+    # LABOR_LAW_PROFILE_EVERY设置抽样间隔，LABOR_LAW_PROFILE_MEMORY=1时同时统计内存分配
+    labor_law_guidance_main(
+        profile_dir=os.getenv("LABOR_LAW_PROFILE_DIR"),
+        profile_every=int(os.getenv("LABOR_LAW_PROFILE_EVERY", DEFAULT_SAMPLE_EVERY)),
+        profile_memory=os.getenv("LABOR_LAW_PROFILE_MEMORY") == "1",
+    )
\ No newline at end of file
@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+劳动法维权举证指导 - 并发会话压测
+
+模拟N个并发的完整指导会话，评估单机可同时服务的用户数：
+- 本地替身模型服务（独立进程中的OpenAI兼容HTTP接口），按环节采样对数正态的首包延迟，
+  并按输出长度叠加生成时间，遵守max_tokens（超出时返回finish_reason=length）；
+- 会话使用 ScriptedGuidance：以脚本化的证据回答代替input()（回答取自多种表述，含否定、
+  部分持有与补充更正），会话内的print输出在压测期间丢弃；
+- 并发数逐级递增，每级报告吞吐、各环节延迟分位数、每会话内存峰值，
+  并以吞吐不再明显增长的并发数作为饱和点。
+"""
+
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional
+
+from openai import OpenAI
+
+from labor_law_guidance import (
+    LaborLawGuidance, DEFAULT_EVIDENCE_ITEMS, STAGE_ANALYSIS, STAGE_EXTRACTION,
+    STAGE_EVIDENCE_PARSE, STAGE_KEY_POINTS, STAGE_ADVICE
+)
+from conversation_dataset import ConversationDataset
+from output_budget import OutputLengthBudget
+
+
+STAGE_SESSION = "session"
+# 从会话开始到展示证据清单、等待用户第一次回答的时间
+STAGE_FIRST_CHECKLIST = "first_checklist"
+
+# 替身服务各环节的延迟分布：首包延迟为对数正态（中位数秒、sigma），生成速度为 tokens/秒；
+# 输出长度为 [最少, 最多] 个token（按字数近似）
+STAGE_LATENCY_PROFILES: Dict[str, Dict[str, Any]] = {
+    STAGE_ANALYSIS: {"median": 0.8, "sigma": 0.5, "tokens_per_second": 40, "tokens": [400, 900]},
+    STAGE_EXTRACTION: {"median": 0.5, "sigma": 0.4, "tokens_per_second": 60, "tokens": [200, 500]},
+    STAGE_EVIDENCE_PARSE: {"median": 0.4, "sigma": 0.4, "tokens_per_second": 60, "tokens": [30, 120]},
+    STAGE_KEY_POINTS: {"median": 0.5, "sigma": 0.4, "tokens_per_second": 50, "tokens": [60, 100]},
+    STAGE_ADVICE: {"median": 0.6, "sigma": 0.4, "tokens_per_second": 50, "tokens": [120, 200]},
+}
+
+# 脚本化回答的表述：{a}/{b}为证据名称
+POSITIVE_ANSWERS = [
+    "我有{a}和{b}",
+    "目前持有{a}、{b}",
+    "{a}在我手上，{b}也有",
+    "我这边有{a}",
+    "{a}有原件，{b}有复印件",
+    "手上只有{a}",
+]
+PARTIAL_ANSWERS = [
+    "{a}只有部分截图",
+    "{a}只有复印件",
+    "{a}只有最近几个月的",
+]
+NEGATED_ANSWERS = [
+    "没有{a}",
+    "{a}有，但是没有{b}",
+    "公司从来没给过{a}，我有{b}",
+    "我没有{a}也没有{b}",
+    "{a}暂时没有",
+]
+SUPPLEMENT_ANSWERS = [
+    "还有{a}",
+    "刚找到了{a}",
+    "更正一下，其实没有{a}",
+    "补充：{a}也有，不过只有截图",
+    "其他的都没有了",
+]
+
+
+class _DiscardOutput(io.TextIOBase):
+    """压测期间丢弃会话输出"""
+
+    def write(self, text: str) -> int:
+        return len(text)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """最近秩分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(q * len(ordered) + 0.999999) - 1))
+    return ordered[rank]
+
+
+# ---------- 替身模型服务 ----------
+
+def detect_stage(body: Dict[str, Any]) -> str:
+    """由请求内容判断所属环节"""
+    messages = body.get("messages") or []
+    system = messages[0].get("content", "") if messages else ""
+    if "证据清单解析器" in system:
+        return STAGE_EXTRACTION
+    if "已持有/部分持有" in system:
+        return STAGE_EVIDENCE_PARSE
+    if "个性化的维权建议" in system:
+        return STAGE_ADVICE
+    if "关键法律要点" in system or "每一类证据" in system:
+        return STAGE_KEY_POINTS
+    return STAGE_ANALYSIS
+
+
+def _pad(text: str, tokens: int) -> str:
+    filler = "请注意保存原件并核对日期、签章与金额等信息。"
+    while len(text) < tokens:
+        text += filler
+    return text[:tokens]
+
+
+def stand_in_content(stage: str, body: Dict[str, Any], rng: random.Random) -> str:
+    """按环节生成格式与真实输出一致的替身内容"""
+    low, high = STAGE_LATENCY_PROFILES[stage]["tokens"]
+    tokens = rng.randint(low, high)
+    messages = body.get("messages") or []
+    user = messages[-1].get("content", "") if messages else ""
+    if stage == STAGE_ANALYSIS:
+        items = rng.sample(DEFAULT_EVIDENCE_ITEMS, rng.randint(3, len(DEFAULT_EVIDENCE_ITEMS)))
+        lines = ["### 劳动者需要准备的证据材料"]
+        lines += [f"- **{e['evidence_type']}**：{e['description']}（{e['importance']}）" for e in items]
+        return _pad("\n".join(lines) + "\n", tokens)
+    if stage == STAGE_EXTRACTION:
+        items = rng.sample(DEFAULT_EVIDENCE_ITEMS, rng.randint(3, len(DEFAULT_EVIDENCE_ITEMS)))
+        return json.dumps(items, ensure_ascii=False)
+    if stage == STAGE_EVIDENCE_PARSE:
+        head, _, text = user.partition("\n用户输入：")
+        try:
+            names = json.loads(head.split("：", 1)[1])
+        except (IndexError, ValueError):
+            names = []
+        owned = {}
+        for name in names:
+            if name in text and f"没有{name}" not in text and f"{name}暂时没有" not in text:
+                status = "部分" if "部分" in text or "复印件" in text or "截图" in text else "是"
+                owned[name] = {"status": status, "justification": f"用户提到{name}"}
+        return json.dumps(owned, ensure_ascii=False)
+    if stage == STAGE_KEY_POINTS and body.get("response_format"):
+        try:
+            items = json.loads(user)
+        except ValueError:
+            items = []
+        return json.dumps({e.get("evidence_type"): _pad("重点核对", min(tokens, 100))
+                           for e in items if isinstance(e, dict)}, ensure_ascii=False)
+    return _pad("", tokens)
+
+
+def _make_handler(latency_scale: float, error_rate: float, semaphore: Optional[threading.Semaphore], seed: int):
+    rng_lock = threading.Lock()
+    rng = random.Random(seed)
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            stage = detect_stage(body)
+            profile = STAGE_LATENCY_PROFILES[stage]
+            with rng_lock:
+                request_rng = random.Random(rng.random())
+            if semaphore is not None:
+                semaphore.acquire()
+            try:
+                if request_rng.random() < error_rate:
+                    time.sleep(request_rng.lognormvariate(0, profile["sigma"]) * profile["median"] * latency_scale)
+                    self._reply(500, {"error": {"message": "替身服务模拟的失败请求", "type": "server_error"}})
+                    return
+                content = stand_in_content(stage, body, request_rng)
+                finish_reason = "stop"
+                max_tokens = body.get("max_tokens")
+                if max_tokens and len(content) > max_tokens:
+                    content, finish_reason = content[:max_tokens], "length"
+                first_token = request_rng.lognormvariate(0, profile["sigma"]) * profile["median"]
+                generation = len(content) / profile["tokens_per_second"]
+                time.sleep((first_token + generation) * latency_scale)
+            finally:
+                if semaphore is not None:
+                    semaphore.release()
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages") or [])
+            self._reply(200, {
+                "id": f"chatcmpl-standin-{request_rng.getrandbits(32):08x}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stand-in"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(content),
+                    "total_tokens": prompt_tokens + len(content),
+                },
+            })
+
+        def _reply(self, status: int, payload: Dict[str, Any]):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return StandInHandler
+
+
+def _serve_stand_in(conn, latency_scale: float, error_rate: float, max_concurrency: Optional[int], seed: int):
+    semaphore = threading.Semaphore(max_concurrency) if max_concurrency else None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(latency_scale, error_rate, semaphore, seed))
+    server.daemon_threads = True
+    conn.send(server.server_address[1])
+    conn.close()
+    server.serve_forever()
+
+
+class StandInLLMServer:
+    """本地替身模型服务（独立进程，避免与被测会话争用解释器锁）"""
+
+    def __init__(self, latency_scale: float = 1.0, error_rate: float = 0.0,
+                 max_concurrency: Optional[int] = None, seed: int = 2024):
+        """初始化
+
+        Args:
+            latency_scale: 延迟缩放系数（如0.1表示按真实延迟的十分之一运行）
+            error_rate: 模拟失败请求（HTTP 500）的比例
+            max_concurrency: 替身服务同时处理的请求上限，模拟服务商的并发限制；None为不限
+            seed: 随机种子
+        """
+        self.latency_scale = latency_scale
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.seed = seed
+        self.port: Optional[int] = None
+        self._process: Optional[multiprocessing.Process] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self) -> "StandInLLMServer":
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(
+            target=_serve_stand_in,
+            args=(child_conn, self.latency_scale, self.error_rate, self.max_concurrency, self.seed),
+            daemon=True,
+        )
+        self._process.start()
+        self.port = parent_conn.recv()
+        return self
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self) -> "StandInLLMServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+# ---------- 脚本化会话 ----------
+
+class AnswerScript:
+    """按证据清单生成一次会话的多轮回答（首轮、若干补充，最后以空回答结束）"""
+
+    def __init__(self, rng: random.Random, max_supplements: int = 2):
+        self.rng = rng
+        self.supplements = rng.randint(0, max_supplements)
+        self.answers: List[str] = []
+
+    def next_answer(self, evidence_list: List[Dict]) -> str:
+        names = [e['evidence_type'] for e in evidence_list] or ["劳动合同"]
+        if not self.answers:
+            templates = self.rng.choice([POSITIVE_ANSWERS, PARTIAL_ANSWERS, NEGATED_ANSWERS])
+        elif len(self.answers) <= self.supplements:
+            templates = SUPPLEMENT_ANSWERS
+        else:
+            self.answers.append("")
+            return ""
+        a, b = self.rng.sample(names, 2) if len(names) > 1 else (names[0], names[0])
+        answer = self.rng.choice(templates).format(a=a, b=b)
+        self.answers.append(answer)
+        return answer
+
+
+class SessionRecorder:
+    """汇总一级并发下各会话的环节延迟"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.latencies.setdefault(stage, []).append(seconds)
+
+
+class ScriptedGuidance(LaborLawGuidance):
+    """以脚本化回答代替终端输入的指导会话，并记录各环节模型调用延迟"""
+
+    def __init__(self, script: AnswerScript, recorder: SessionRecorder, think_time: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.script = script
+        self.recorder = recorder
+        self.think_time = think_time
+        self._session_started: Optional[float] = None
+
+    def run_guidance_session(self, *args, **kwargs):
+        self._session_started = time.monotonic()
+        return super().run_guidance_session(*args, **kwargs)
+
+    def _create_completion(self, stage: str, output_scale: int = 1, **request):
+        start = time.monotonic()
+        try:
+            return super()._create_completion(stage, output_scale, **request)
+        finally:
+            self.recorder.record(stage, time.monotonic() - start)
+
+    def _read_user_input(self, prompt: str) -> str:
+        if not self.script.answers and self._session_started is not None:
+            self.recorder.record(STAGE_FIRST_CHECKLIST, time.monotonic() - self._session_started)
+        if self.think_time:
+            time.sleep(self.script.rng.expovariate(1 / self.think_time))
+        evidence_list = self.evidence_state.evidence_list if self.evidence_state else []
+        return self.script.next_answer(evidence_list)
+
+
+# ---------- 压测 ----------
+
+class LoadTest:
+    """逐级增加并发会话数，测量吞吐、延迟分位数与内存，确定饱和点"""
+
+    def __init__(self, base_url: str, dataset_file: str = "conversation.json",
+                 think_time: float = 0.0, min_gain: float = 0.1, trace_memory: bool = True, seed: int = 2024):
+        """初始化
+
+        Args:
+            base_url: OpenAI兼容接口地址（通常为StandInLLMServer.base_url）
+            dataset_file: 会话使用的对话数据集，各会话依次使用其中的案例
+            think_time: 用户每次作答前的平均思考时间（秒，指数分布）；计入会话时长
+            min_gain: 并发翻级后吞吐增幅低于该比例即视为饱和
+            trace_memory: 是否用tracemalloc统计每会话内存峰值（会降低吞吐）
+            seed: 脚本化回答的随机种子
+        """
+        self.client = OpenAI(api_key="load-test", base_url=base_url, max_retries=0)
+        self.dataset_file = dataset_file
+        self.think_time = think_time
+        self.min_gain = min_gain
+        self.trace_memory = trace_memory
+        self.seed = seed
+        with ConversationDataset(dataset_file) as dataset:
+            self.case_count = len(dataset)
+
+    def _run_session(self, session_id: int, recorder: SessionRecorder,
+                     output_budget: OutputLengthBudget) -> Dict[str, Any]:
+        rng = random.Random(self.seed * 100003 + session_id)
+        guidance = ScriptedGuidance(AnswerScript(rng), recorder, think_time=self.think_time,
+                                    client=self.client, output_budget=output_budget)
+        start = time.monotonic()
+        try:
+            guidance.run_guidance_session(self.dataset_file, case_index=session_id % self.case_count)
+            error = None
+        except Exception as e:
+            error = str(e)
+        recorder.record(STAGE_SESSION, time.monotonic() - start)
+        return {"error": error, "degraded": sorted(guidance.degraded_stages),
+                "rounds": len([a for a in guidance.script.answers if a])}
+
+    def run_level(self, concurrency: int, sessions: int) -> Dict[str, Any]:
+        """以给定并发数运行若干会话"""
+        recorder = SessionRecorder()
+        output_budget = OutputLengthBudget()
+        if self.trace_memory:
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda i: self._run_session(i, recorder, output_budget), range(sessions)))
+        elapsed = time.monotonic() - start
+        memory_per_session = None
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            memory_per_session = max(0, peak - baseline) / concurrency
+
+        stages = {}
+        for stage, values in sorted(recorder.latencies.items()):
+            stages[stage] = {
+                "calls": len(values),
+                "p50": percentile(values, 0.5),
+                "p95": percentile(values, 0.95),
+                "p99": percentile(values, 0.99),
+            }
+        degraded: Dict[str, int] = {}
+        for result in results:
+            for stage in result["degraded"]:
+                degraded[stage] = degraded.get(stage, 0) + 1
+        return {
+            "concurrency": concurrency,
+            "sessions": sessions,
+            "elapsed_seconds": elapsed,
+            "throughput": sessions / elapsed if elapsed else 0.0,
+            "errors": sum(1 for r in results if r["error"]),
+            "degraded_sessions": degraded,
+            "answer_rounds": sum(r["rounds"] for r in results),
+            "memory_per_session_bytes": memory_per_session,
+            "stages": stages,
+        }
+
+    def ramp(self, levels: List[int], sessions_per_level: Optional[int] = None) -> Dict[str, Any]:
+        """逐级运行并确定饱和点
+
+        sessions_per_level 未指定时每级运行 2×并发数 个会话（至少4个）。
+        饱和点为吞吐增幅首次低于min_gain前的那一级并发数；各级均明显增长时为None（尚未饱和）。
+        """
+        results = []
+        saturation = None
+        # 预热一个会话，避免首次导入与建立连接的开销计入第一级
+        stdout = sys.stdout
+        sys.stdout = _DiscardOutput()
+        try:
+            self._run_session(-1, SessionRecorder(), OutputLengthBudget())
+        finally:
+            sys.stdout = stdout
+        for concurrency in levels:
+            sessions = sessions_per_level or max(4, concurrency * 2)
+            sys.stdout = _DiscardOutput()
+            try:
+                level = self.run_level(concurrency, sessions)
+            finally:
+                sys.stdout = stdout
+            results.append(level)
+            print_level(level)
+            if saturation is None and len(results) > 1:
+                previous = results[-2]
+                if level["throughput"] < previous["throughput"] * (1 + self.min_gain):
+                    saturation = previous["concurrency"]
+        return {"levels": results, "saturation_concurrency": saturation}
+
+
+def _fmt_seconds(value: Optional[float]) -> str:
+    return f"{value:.2f}s" if value is not None else "-"
+
+
+def print_level(level: Dict[str, Any]):
+    """打印一级并发的结果"""
+    memory = level["memory_per_session_bytes"]
+    memory_text = f"{memory / 1024:.0f} KB" if memory is not None else "-"
+    print(f"\n并发 {level['concurrency']}：{level['sessions']} 个会话，用时 {level['elapsed_seconds']:.1f} 秒，"
+          f"吞吐 {level['throughput']:.2f} 会话/秒，失败 {level['errors']}，每会话内存峰值 {memory_text}")
+    for stage, stats in level["stages"].items():
+        print(f"   • {stage}: {stats['calls']} 次，p50 {_fmt_seconds(stats['p50'])} / "
+              f"p95 {_fmt_seconds(stats['p95'])} / p99 {_fmt_seconds(stats['p99'])}")
+    if level["degraded_sessions"]:
+        degraded = "，".join(f"{stage} {count}" for stage, count in level["degraded_sessions"].items())
+        print(f"   ⚠️  降级会话数：{degraded}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="劳动法维权举证指导 - 并发会话压测")
+    parser.add_argument("--dataset", default="conversation.json", help="会话使用的对话数据集")
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="逐级的并发会话数，逗号分隔")
+    parser.add_argument("--sessions-per-level", type=int, help="每级会话数，默认2×并发数")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="替身服务延迟缩放系数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="替身服务失败请求比例")
+    parser.add_argument("--server-concurrency", type=int, help="替身服务同时处理的请求上限")
+    parser.add_argument("--think-time", type=float, default=0.0, help="用户平均思考时间（秒）")
+    parser.add_argument("--min-gain", type=float, default=0.1, help="判定饱和的吞吐增幅阈值")
+    parser.add_argument("--no-memory", action="store_true", help="不统计内存（避免tracemalloc开销）")
+    parser.add_argument("--seed", type=int, default=2024, help="随机种子")
+    parser.add_argument("--output", help="将结果保存为JSON文件")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    with StandInLLMServer(args.latency_scale, args.error_rate, args.server_concurrency, args.seed) as server:
+        print(f"替身模型服务：{server.base_url}（延迟缩放 {args.latency_scale}）")
+        load_test = LoadTest(server.base_url, args.dataset, think_time=args.think_time,
+                             min_gain=args.min_gain, trace_memory=not args.no_memory, seed=args.seed)
+        report = load_test.ramp(levels, args.sessions_per_level)
+
+    saturation = report["saturation_concurrency"]
+    if saturation is None:
+        print(f"\n在测试的并发范围内吞吐仍在增长，尚未饱和（最高并发 {levels[-1]}）")
+    else:
+        print(f"\n饱和点：并发 {saturation}（继续增加并发吞吐增幅低于 {args.min_gain:.0%}）")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ 结果已保存至 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
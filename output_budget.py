@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+各环节输出长度预算
+
+生成长度决定了大部分调用延迟。OutputLengthBudget 记录各环节实际的输出token数，
+以 p99 加余量作为该环节的 max_tokens；样本不足时使用按提示词字数要求设定的初始值。
+观测数据可保存到本地文件（每记录 save_every 次观测保存一次，结束时调用 flush()），
+跨会话持续学习；同时按是否设置上限分别统计各环节延迟。
+"""
+
+import os
+import json
+import math
+import threading
+from typing import Dict, List, Optional
+
+
+# 样本不足时的初始上限（None表示不设上限，仅观测）
+DEFAULT_STAGE_MAX_TOKENS: Dict[str, Optional[int]] = {
+    "analysis": None,
+    "extraction": None,
+    "evidence_parse": 400,   # 只需一个简短的JSON对象
+    "key_points": 300,       # 提示词要求不超过100字（批量请求按条目数放大）
+    "advice": 500,           # 提示词要求不超过200字
+}
+
+
+class OutputLengthBudget:
+    """按环节学习的输出长度上限"""
+
+    def __init__(self, budget_file: Optional[str] = None, percentile: float = 0.99,
+                 margin: float = 0.2, min_samples: int = 20, window: int = 500, min_tokens: int = 64,
+                 save_every: int = 50):
+        """初始化
+
+        Args:
+            budget_file: 观测数据文件；存在时加载
+            percentile: 用于确定上限的分位数
+            margin: 在分位数基础上增加的比例余量
+            min_samples: 开始使用学习值所需的最少样本数
+            window: 每个环节保留的最近样本数
+            min_tokens: 上限的最小值
+            save_every: 每记录多少次观测自动保存一次，0表示只在flush()时保存
+        """
+        self.budget_file = budget_file
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.window = window
+        self.min_tokens = min_tokens
+        self.save_every = save_every
+        self.samples: Dict[str, List[int]] = {}
+        # 延迟统计：{环节: {"capped"/"uncapped": [秒, ...]}}，以及截断重试次数
+        self.latencies: Dict[str, Dict[str, List[float]]] = {}
+        self.truncations: Dict[str, int] = {}
+        # 并发会话共享同一预算时保护观测数据
+        self._lock = threading.RLock()
+        # 写文件单独加锁，不阻塞并发调用记录观测
+        self._save_lock = threading.Lock()
+        # 观测次数与已保存到文件的观测次数
+        self._generation = 0
+        self._saved_generation = 0
+
+        if budget_file and os.path.exists(budget_file):
+            self.load(budget_file)
+
+    def max_tokens_for(self, stage: str, scale: int = 1) -> Optional[int]:
+        """环节的max_tokens；scale用于一次请求包含多项输出的场景（如批量关键要点）"""
+        with self._lock:
+            samples = list(self.samples.get(stage, []))
+        if len(samples) >= self.min_samples:
+            ordered = sorted(samples)
+            rank = max(0, math.ceil(self.percentile * len(ordered)) - 1)
+            limit = max(self.min_tokens, math.ceil(ordered[rank] * (1 + self.margin)))
+        else:
+            limit = DEFAULT_STAGE_MAX_TOKENS.get(stage)
+        if limit is None:
+            return None
+        return limit * scale
+
+    def observe(self, stage: str, completion_tokens: int, scale: int = 1):
+        """记录一次未截断调用的输出token数（按scale折算为单项）"""
+        with self._lock:
+            samples = self.samples.setdefault(stage, [])
+            samples.append(math.ceil(completion_tokens / max(scale, 1)))
+            del samples[:-self.window]
+            self._generation += 1
+            autosave = (bool(self.budget_file) and self.save_every > 0
+                        and self._generation - self._saved_generation >= self.save_every)
+        if autosave:
+            self.save(self.budget_file)
+
+    def observe_latency(self, stage: str, seconds: float, capped: bool):
+        with self._lock:
+            self.latencies.setdefault(stage, {"capped": [], "uncapped": []})[
+                "capped" if capped else "uncapped"].append(seconds)
+
+    def observe_truncation(self, stage: str):
+        with self._lock:
+            self.truncations[stage] = self.truncations.get(stage, 0) + 1
+
+    def report(self) -> Dict[str, Dict[str, object]]:
+        """各环节的当前上限、样本数、截断次数及设/未设上限时的平均延迟"""
+        def mean(values: List[float]) -> Optional[float]:
+            return sum(values) / len(values) if values else None
+
+        stages = set(self.samples) | set(self.latencies) | set(self.truncations)
+        result = {}
+        for stage in sorted(stages):
+            latencies = self.latencies.get(stage, {"capped": [], "uncapped": []})
+            result[stage] = {
+                "max_tokens": self.max_tokens_for(stage),
+                "samples": len(self.samples.get(stage, [])),
+                "truncations": self.truncations.get(stage, 0),
+                "calls_capped": len(latencies["capped"]),
+                "mean_latency_capped": mean(latencies["capped"]),
+                "calls_uncapped": len(latencies["uncapped"]),
+                "mean_latency_uncapped": mean(latencies["uncapped"]),
+            }
+        return result
+
+    def save(self, budget_file: str):
+        """保存观测数据（先写临时文件再替换；锁内只复制样本）"""
+        with self._lock:
+            generation = self._generation
+            samples = {stage: list(values) for stage, values in self.samples.items()}
+        tmp_file = budget_file + ".tmp"
+        with self._save_lock:
+            # 其他线程已写出更新的观测时不再用旧快照覆盖
+            if budget_file == self.budget_file and generation < self._saved_generation:
+                return
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"samples": samples}, f)
+            os.replace(tmp_file, budget_file)
+            if budget_file == self.budget_file:
+                self._saved_generation = generation
+
+    def flush(self):
+        """将尚未保存的观测写入数据文件（运行结束时调用）"""
+        if self.budget_file and self._generation != self._saved_generation:
+            self.save(self.budget_file)
+
+    def load(self, budget_file: str):
+        with open(budget_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.samples = {k: list(v)[-self.window:] for k, v in data.get("samples", {}).items()}
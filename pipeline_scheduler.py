@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+劳动法维权举证指导 - 分阶段流水线批处理
+
+各环节的延迟与token消耗差异很大（案例分析耗时长，证据清单提取多为本地解析），
+按案例整体并发会让短环节的处理能力闲置。StagedPipeline 将案例分析、证据清单提取、
+关键要点分析、个性化建议拆为独立环节，每个环节有各自的工作线程数，
+环节之间以有界队列连接：下游积压时上游阻塞（背压），读取数据集也随之放缓。
+这样案例 i+1 的长分析调用可以与案例 i 的提取、解析并行进行。
+
+结果按案例序号顺序写出为JSONL，并提供各环节的队列深度与吞吐指标。
+同时处理中的案例数（含写出器等待前序案例时暂存的结果）有上限，
+某个案例长时间未完成时读取随之暂停，内存占用不随数据集规模增长。
+"""
+
+import json
+import time
+import queue
+import argparse
+import threading
+from typing import List, Dict, Any, Optional, Callable, Iterable, Tuple
+
+from labor_law_guidance import (
+    LaborLawGuidance, STAGE_ANALYSIS, STAGE_EXTRACTION, STAGE_KEY_POINTS, STAGE_ADVICE
+)
+from conversation_dataset import iter_conversation_records
+from stage_profiler import StageProfiler, DEFAULT_SAMPLE_EVERY, print_profile_summary
+
+
+# 各环节默认工作线程数：分析调用最慢，提取大多在本地完成
+DEFAULT_STAGE_WORKERS: Dict[str, int] = {
+    STAGE_ANALYSIS: 4,
+    STAGE_EXTRACTION: 2,
+    STAGE_KEY_POINTS: 4,
+    STAGE_ADVICE: 2,
+}
+
+# 环节结束标记
+_DONE = object()
+
+
+class PipelineJob:
+    """流水线中的单个案例"""
+
+    def __init__(self, case_index: int, conversation: List[Dict], guidance: LaborLawGuidance):
+        self.case_index = case_index
+        self.conversation = conversation
+        # 每个案例使用独立的会话状态（共享客户端、索引、熔断器与输出长度预算）
+        self.guidance = guidance
+        self.analysis: Optional[str] = None
+        self.evidence_list: List[Dict] = []
+        self.key_points: Dict[str, str] = {}
+        self.advice: Optional[str] = None
+        self.error: Optional[str] = None
+
+    def to_record(self) -> Dict[str, Any]:
+        """输出行：案例序号、各环节结果、降级环节及错误"""
+        return {
+            "case_index": self.case_index,
+            "analysis": self.analysis,
+            "evidence_list": self.evidence_list,
+            "key_points": self.key_points,
+            "advice": self.advice,
+            "degraded_stages": self.guidance.degraded_stages,
+            "error": self.error,
+        }
+
+
+class _StageStats:
+    """单个环节的运行统计"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+
+
+class StagedPipeline:
+    """分阶段流水线：各环节独立并发，环节间有界队列背压，按序写出结果"""
+
+    def __init__(self, guidance: Optional[LaborLawGuidance] = None,
+                 stage_workers: Optional[Dict[str, int]] = None, queue_size: int = 8,
+                 include_key_points: bool = False, include_advice: bool = False,
+                 max_in_flight: Optional[int] = None):
+        """初始化
+
+        Args:
+            guidance: 指导系统实例，各案例使用其fork()得到的独立实例
+            stage_workers: 各环节工作线程数，未指定的环节使用DEFAULT_STAGE_WORKERS
+            queue_size: 每个环节输入队列的容量（背压阈值）
+            include_key_points: 是否分析证据清单中各项证据的关键要点
+            include_advice: 是否生成个性化建议（按全部证据尚未持有生成）
+            max_in_flight: 已读取但尚未写出的案例数上限，默认为各队列容量与工作线程数之和
+        """
+        self.guidance = guidance or LaborLawGuidance()
+        self.queue_size = queue_size
+        self.stages: List[str] = [STAGE_ANALYSIS, STAGE_EXTRACTION]
+        if include_key_points:
+            self.stages.append(STAGE_KEY_POINTS)
+        if include_advice:
+            self.stages.append(STAGE_ADVICE)
+
+        workers = dict(DEFAULT_STAGE_WORKERS)
+        workers.update(stage_workers or {})
+        self._handlers: Dict[str, Callable[[PipelineJob], None]] = {
+            STAGE_ANALYSIS: self._run_analysis,
+            STAGE_EXTRACTION: self._run_extraction,
+            STAGE_KEY_POINTS: self._run_key_points,
+            STAGE_ADVICE: self._run_advice,
+        }
+        self._queues: Dict[str, queue.Queue] = {}
+        self._stats: Dict[str, _StageStats] = {}
+        for stage in self.stages:
+            self._queues[stage] = queue.Queue(maxsize=queue_size)
+            self._stats[stage] = _StageStats(max(1, workers[stage]))
+        # 最后一个环节与有序写出之间的队列
+        self._output_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        if max_in_flight is None:
+            max_in_flight = queue_size * (len(self.stages) + 1) + sum(s.workers for s in self._stats.values())
+        self.max_in_flight = max(1, max_in_flight)
+        # 读取案例时获取，写出（或写出失败丢弃）时释放
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        # 写出器等待前序案例时暂存的结果
+        self._pending: Dict[int, PipelineJob] = {}
+        self._lock = threading.Lock()
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self.cases_read = 0
+        self.cases_written = 0
+        # 写出器等待中的乱序结果数峰值
+        self.max_reorder_buffer = 0
+        # 读取数据集或写出结果时的错误（不影响流水线正常结束）
+        self.errors: List[str] = []
+        self._writer_done = False
+
+    # ---------- 各环节 ----------
+
+    def _run_analysis(self, job: PipelineJob):
+        job.analysis = job.guidance.analyze_case_with_ai(job.conversation)
+
+    def _run_extraction(self, job: PipelineJob):
+        job.evidence_list = job.guidance.extract_required_evidence(job.analysis)
+        job.guidance.remember_case(job.conversation, job.analysis, job.evidence_list)
+
+    def _run_key_points(self, job: PipelineJob):
+        if job.evidence_list:
+            job.key_points = job.guidance._analyze_evidence_key_points_batch(job.evidence_list)
+
+    def _run_advice(self, job: PipelineJob):
+        # 批处理没有用户回答，按清单中的证据均尚未持有生成建议
+        user_evidence = {e['evidence_type']: {'status': '否'} for e in job.evidence_list}
+        job.advice = job.guidance.generate_personalized_advice(user_evidence, job.evidence_list)
+
+    # ---------- 调度 ----------
+
+    def _next_queue(self, stage: str) -> queue.Queue:
+        index = self.stages.index(stage)
+        if index + 1 < len(self.stages):
+            return self._queues[self.stages[index + 1]]
+        return self._output_queue
+
+    def _feed(self, records: Iterable[Tuple[Optional[List[Dict]], Optional[str]]]):
+        """读取案例放入第一个环节的队列（队列满时阻塞，读取随之放缓）
+
+        单条记录的格式错误作为该案例的错误写出；读取中断时记录错误并结束流水线，
+        无论如何都会向下游发送结束标记。
+        """
+        first = self._queues[self.stages[0]]
+        try:
+            for case_index, (conversation, error) in enumerate(records):
+                self._in_flight.acquire()
+                self.cases_read += 1
+                job = PipelineJob(case_index, conversation or [], self.guidance.fork())
+                if error:
+                    job.error = error
+                elif not conversation:
+                    job.error = "空对话"
+                self._put(self.stages[0], first, job)
+        except Exception as e:
+            self._record_error(f"读取数据集失败（已读取 {self.cases_read} 个案例）: {e}")
+        finally:
+            first.put(_DONE)
+
+    def _record_error(self, message: str):
+        with self._lock:
+            self.errors.append(message)
+
+    def _put(self, stage: str, target: queue.Queue, job: PipelineJob):
+        target.put(job)
+        stats = self._stats.get(stage)
+        if stats is not None:
+            with self._lock:
+                stats.max_queue_depth = max(stats.max_queue_depth, target.qsize())
+
+    def _worker(self, stage: str, remaining: List[int]):
+        """环节工作线程；本环节最后一个线程退出时向下游传递结束标记"""
+        source = self._queues[stage]
+        target = self._next_queue(stage)
+        next_stage = self.stages[self.stages.index(stage) + 1] if target is not self._output_queue else None
+        handler = self._handlers[stage]
+        stats = self._stats[stage]
+        while True:
+            job = source.get()
+            if job is _DONE:
+                # 让同环节的其他线程也能收到结束标记
+                source.put(_DONE)
+                break
+            if job.error is None:
+                start = time.monotonic()
+                try:
+                    handler(job)
+                except Exception as e:
+                    # 出错的案例跳过后续环节，结果中记录错误
+                    job.error = f"{stage}: {e}"
+                    with self._lock:
+                        stats.failed += 1
+                elapsed = time.monotonic() - start
+                with self._lock:
+                    stats.processed += 1
+                    stats.busy_seconds += elapsed
+            if next_stage is None:
+                target.put(job)
+            else:
+                self._put(next_stage, target, job)
+
+        with self._lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            # 取出留在本环节队列中的结束标记，再通知下游
+            source.get_nowait()
+            target.put(_DONE)
+
+    def _write_ordered(self, output_file: str):
+        """按案例序号顺序写出结果；写出失败时记录错误并继续取出剩余结果，避免上游阻塞"""
+        try:
+            self._write_results(output_file)
+        except Exception as e:
+            self._record_error(f"写出结果失败（已写出 {self.cases_written} 个案例）: {e}")
+            for _ in range(len(self._pending)):
+                self._in_flight.release()
+            self._pending.clear()
+            while not self._writer_done:
+                job = self._output_queue.get()
+                if job is _DONE:
+                    self._writer_done = True
+                else:
+                    self._in_flight.release()
+
+    def _write_results(self, output_file: str):
+        """先完成的后续案例暂存，等待前面的案例"""
+        pending = self._pending
+        next_index = 0
+        with open(output_file, 'w', encoding='utf-8') as f:
+            while True:
+                job = self._output_queue.get()
+                if job is _DONE:
+                    self._writer_done = True
+                    break
+                pending[job.case_index] = job
+                self.max_reorder_buffer = max(self.max_reorder_buffer, len(pending))
+                while next_index in pending:
+                    done = pending[next_index]
+                    f.write(json.dumps(done.to_record(), ensure_ascii=False) + "\n")
+                    f.flush()
+                    del pending[next_index]
+                    self._in_flight.release()
+                    self._merge_metrics(done.guidance)
+                    self.cases_written += 1
+                    next_index += 1
+            # 正常情况下此时已无暂存结果
+            for case_index in sorted(pending):
+                done = pending[case_index]
+                f.write(json.dumps(done.to_record(), ensure_ascii=False) + "\n")
+                del pending[case_index]
+                self._in_flight.release()
+                self._merge_metrics(done.guidance)
+                self.cases_written += 1
+
+    def _merge_metrics(self, forked: LaborLawGuidance):
+        """将案例实例的提取来源与关键要点统计汇总到主实例"""
+        for key, value in forked.extraction_metrics.items():
+            self.guidance.extraction_metrics[key] = self.guidance.extraction_metrics.get(key, 0) + value
+        for key, value in forked.key_points_metrics.items():
+            self.guidance.key_points_metrics[key] = self.guidance.key_points_metrics.get(key, 0) + value
+
+    def run(self, cases: Iterable[List[Dict]], output_file: str) -> Dict[str, Any]:
+        """运行流水线直至全部案例写出
+
+        Args:
+            cases: 案例迭代器（如iter_conversation_cases，流式读取）
+            output_file: 结果JSONL文件路径
+
+        Returns:
+            运行结束时的指标（同metrics()）
+        """
+        return self._run(((conversation, None) for conversation in cases), output_file)
+
+    def run_dataset(self, dataset_file: str, output_file: str, validate: bool = True) -> Dict[str, Any]:
+        """流式读取数据集文件运行流水线；格式错误的记录在结果中记为错误，不中断其余案例"""
+        return self._run(iter_conversation_records(dataset_file, validate=validate), output_file)
+
+    def _run(self, records: Iterable[Tuple[Optional[List[Dict]], Optional[str]]],
+             output_file: str) -> Dict[str, Any]:
+        self._started_at = time.monotonic()
+        self._finished_at = None
+        self._writer_done = False
+        self._pending.clear()
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        threads = [threading.Thread(target=self._feed, args=(records,), name="pipeline-feed", daemon=True)]
+        for stage in self.stages:
+            remaining = [self._stats[stage].workers]
+            for i in range(self._stats[stage].workers):
+                threads.append(threading.Thread(target=self._worker, args=(stage, remaining),
+                                                name=f"pipeline-{stage}-{i}", daemon=True))
+        writer = threading.Thread(target=self._write_ordered, args=(output_file,),
+                                  name="pipeline-writer", daemon=True)
+        for thread in threads:
+            thread.start()
+        writer.start()
+        for thread in threads:
+            thread.join()
+        writer.join()
+        if self.guidance.case_index is not None:
+            self.guidance.case_index.flush()
+        self.guidance.output_budget.flush()
+        self._finished_at = time.monotonic()
+        return self.metrics()
+
+    # ---------- 指标 ----------
+
+    def metrics(self) -> Dict[str, Any]:
+        """各环节的队列深度、处理数、忙碌时间、吞吐与利用率（运行中也可调用）"""
+        end = self._finished_at or time.monotonic()
+        elapsed = end - self._started_at if self._started_at is not None else 0.0
+        stages = {}
+        with self._lock:
+            for stage in self.stages:
+                stats = self._stats[stage]
+                stages[stage] = {
+                    "workers": stats.workers,
+                    "queue_depth": max(0, self._queues[stage].qsize()),
+                    "max_queue_depth": stats.max_queue_depth,
+                    "processed": stats.processed,
+                    "failed": stats.failed,
+                    "busy_seconds": round(stats.busy_seconds, 3),
+                    "throughput": stats.processed / elapsed if elapsed else 0.0,
+                    "utilization": stats.busy_seconds / (elapsed * stats.workers) if elapsed else 0.0,
+                }
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "cases_read": self.cases_read,
+            "cases_written": self.cases_written,
+            "throughput": self.cases_written / elapsed if elapsed else 0.0,
+            "max_reorder_buffer": self.max_reorder_buffer,
+            "errors": list(self.errors),
+            "stages": stages,
+        }
+
+
+def print_pipeline_metrics(metrics: Dict[str, Any]):
+    """打印流水线指标"""
+    print("\n=== 流水线指标 ===")
+    print(f"用时 {metrics['elapsed_seconds']:.1f} 秒，读取 {metrics['cases_read']} 个案例，"
+          f"写出 {metrics['cases_written']} 个（{metrics['throughput']:.2f} 个/秒）")
+    for stage, stats in metrics["stages"].items():
+        print(f"- {stage}: {stats['workers']} 线程，处理 {stats['processed']}（失败 {stats['failed']}），"
+              f"吞吐 {stats['throughput']:.2f} 个/秒，利用率 {stats['utilization']:.0%}，"
+              f"队列峰值 {stats['max_queue_depth']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="劳动法维权举证指导 - 分阶段流水线批处理")
+    parser.add_argument("dataset", help="对话数据集（JSON数组或JSONL）")
+    parser.add_argument("output", help="结果JSONL文件路径")
+    parser.add_argument("--key-points", action="store_true", help="分析各项证据的关键要点")
+    parser.add_argument("--advice", action="store_true", help="生成个性化建议")
+    parser.add_argument("--queue-size", type=int, default=8, help="环节间队列容量")
+    parser.add_argument("--profile-dir", help="环节剖析报告目录；提供时记录各环节的本地CPU与内存开销")
+    parser.add_argument("--profile-every", type=int, default=DEFAULT_SAMPLE_EVERY, help="每个环节每N次调用剖析一次")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="抽样调用时同时用tracemalloc统计分配（全进程快照，开销较大）")
+    for stage, workers in DEFAULT_STAGE_WORKERS.items():
+        parser.add_argument(f"--{stage.replace('_', '-')}-workers", type=int, default=workers,
+                            help=f"{stage} 环节工作线程数")
+    args = parser.parse_args()
+
+    stage_workers = {stage: getattr(args, f"{stage}_workers") for stage in DEFAULT_STAGE_WORKERS}
+    profiler = (StageProfiler(args.profile_dir, sample_every=args.profile_every, trace_memory=args.profile_memory)
+                if args.profile_dir else None)
+    pipeline = StagedPipeline(LaborLawGuidance(profiler=profiler), stage_workers=stage_workers,
+                              queue_size=args.queue_size, include_key_points=args.key_points,
+                              include_advice=args.advice)
+    metrics = pipeline.run_dataset(args.dataset, args.output)
+    print(f"✅ 已写出 {metrics['cases_written']} 个案例的结果至 {args.output}")
+    print_pipeline_metrics(metrics)
+    for error in metrics["errors"]:
+        print(f"❌ {error}")
+
+    if profiler is not None:
+        profiler.dump()
+        profiler.close()
+        print_profile_summary(profiler)
+
+
+if __name__ == "__main__":
+    main()
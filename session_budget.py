@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+会话时间预算与熔断
+
+- SessionDeadline：单次指导会话的总时间预算，可在等待用户输入期间暂停计时；
+- CircuitBreaker：模型接口连续失败后熔断，冷却期内直接走本地默认路径。
+剩余预算不足或熔断打开时，LaborLawGuidance 的各环节会立即改用本地默认结果并标记为降级。
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+# 各环节发起模型调用所需的最低剩余预算（秒），低于该值时直接降级
+DEFAULT_STAGE_MIN_BUDGET: Dict[str, float] = {
+    "analysis": 8.0,
+    "extraction": 4.0,
+    "evidence_parse": 2.0,
+    "key_points": 2.0,
+    "advice": 3.0,
+}
+
+
+class DegradedModeError(Exception):
+    """预算不足或熔断打开，环节应改用本地默认结果"""
+
+
+class SessionDeadline:
+    """会话级时间预算"""
+
+    def __init__(self, budget_seconds: float, stage_min_budget: Optional[Dict[str, float]] = None):
+        """初始化
+
+        Args:
+            budget_seconds: 会话内模型调用可用的总秒数
+            stage_min_budget: 各环节最低剩余预算，默认使用DEFAULT_STAGE_MIN_BUDGET
+        """
+        self.budget_seconds = budget_seconds
+        self.stage_min_budget = {**DEFAULT_STAGE_MIN_BUDGET, **(stage_min_budget or {})}
+        self._start = time.monotonic()
+        self._paused_total = 0.0
+        self._paused_at: Optional[float] = None
+
+    def elapsed(self) -> float:
+        now = self._paused_at if self._paused_at is not None else time.monotonic()
+        return now - self._start - self._paused_total
+
+    def remaining(self) -> float:
+        return max(0.0, self.budget_seconds - self.elapsed())
+
+    def allows(self, stage: str) -> bool:
+        """剩余预算是否足以发起该环节的模型调用"""
+        return self.remaining() >= self.stage_min_budget.get(stage, 0.0)
+
+    @contextmanager
+    def paused(self):
+        """暂停计时（用于等待用户输入，用户思考时间不计入预算）"""
+        if self._paused_at is not None:
+            yield
+            return
+        self._paused_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self._paused_total += time.monotonic() - self._paused_at
+            self._paused_at = None
+
+
+class CircuitBreaker:
+    """模型接口熔断器（关闭 → 打开 → 半开）"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        """初始化
+
+        Args:
+            failure_threshold: 连续失败多少次后熔断
+            reset_timeout: 熔断后多少秒放行一次试探调用
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """是否放行一次调用；半开状态下仅放行一次试探调用"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
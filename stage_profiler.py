@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+各环节本地CPU与内存剖析
+
+除模型延迟外，输入规模增大（超长的用户回答、数百轮的对话、很长的证据清单）时，
+本地的字符串拼接、规则解析与正则回溯也会消耗可观的CPU和内存。
+StageProfiler 挂载到 LaborLawGuidance 实例后，按环节包装各方法：
+- 每次调用记录墙钟时间与线程CPU时间；
+- 按 sample_every 抽样（默认每50次调用一次），用cProfile记录调用剖析；
+- 开启 trace_memory 时，抽样调用还用tracemalloc快照对比记录分配最多的代码行。
+  快照覆盖全进程，开销随进程内存增长，因此默认关闭；
+- dump() 将各环节的剖析文件（.prof，可用 python -m pstats 或 snakeviz 查看）、
+  文本报告与分配Top-N报告写入目录，并生成 summary.json。
+
+同一线程内嵌套的环节方法（如案例分析内部构建请求）计入最外层环节。
+tracemalloc统计的是全进程的分配，多个会话并发时会混入其他线程的分配，宜在单会话下分析；
+剖析期间出现过多线程同时调用时，不报告内存峰值（峰值计数为全进程共享）。
+"""
+
+import os
+import json
+import time
+import pstats
+import cProfile
+import threading
+import functools
+import tracemalloc
+from typing import List, Dict, Any, Optional, Callable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from labor_law_guidance import LaborLawGuidance
+
+
+# 默认每个环节每N次调用抽样剖析一次
+DEFAULT_SAMPLE_EVERY = 50
+
+# 被包装的方法 → 所属环节
+PROFILED_METHODS: Dict[str, str] = {
+    "load_conversation_history": "load",
+    "build_case_analysis_request": "analysis",
+    "analyze_case_with_ai": "analysis",
+    "build_evidence_extraction_request": "extraction",
+    "extract_required_evidence": "extraction",
+    "parse_evidence_extraction_result": "extraction",
+    "_parse_user_evidence_input": "evidence_parse_rules",
+    "_parse_user_evidence_with_llm": "evidence_parse",
+    "build_key_points_request": "key_points",
+    "build_key_points_batch_request": "key_points",
+    "_analyze_evidence_key_points": "key_points",
+    "_analyze_evidence_key_points_batch": "key_points",
+    "provide_collection_guidance": "guidance",
+    "generate_personalized_advice": "advice",
+    "provide_personalized_advice": "advice",
+}
+
+# 分配统计中忽略的文件
+_IGNORED_ALLOCATION_FILES = [tracemalloc.__file__, cProfile.__file__, __file__,
+                             "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>"]
+
+
+class _StageRecord:
+    """单个环节的累计统计"""
+
+    def __init__(self):
+        self.calls = 0
+        self.profiled_calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.max_wall_seconds = 0.0
+        self.peak_bytes = 0
+        self.profile_stats: Optional[pstats.Stats] = None
+        # {代码行: [新增字节数, 新增分配次数]}
+        self.allocations: Dict[str, List[int]] = {}
+
+
+class StageProfiler:
+    """按环节抽样的cProfile/tracemalloc剖析器"""
+
+    def __init__(self, output_dir: str, sample_every: int = DEFAULT_SAMPLE_EVERY, top_n: int = 25,
+                 trace_memory: bool = False, stages: Optional[List[str]] = None):
+        """初始化
+
+        Args:
+            output_dir: 报告输出目录
+            sample_every: 每个环节每N次调用剖析一次（其余调用只计时），1表示每次调用都剖析
+            top_n: 文本报告与分配报告列出的条目数
+            trace_memory: 是否在抽样调用时用tracemalloc统计分配（全进程快照对比，开销较大）
+            stages: 只剖析这些环节，默认全部
+        """
+        self.output_dir = output_dir
+        self.sample_every = max(1, sample_every)
+        self.top_n = top_n
+        self.trace_memory = trace_memory
+        self.stages = set(stages) if stages else None
+        self._records: Dict[str, _StageRecord] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # 正在执行的环节调用数；出现并发调用后内存峰值不再可靠
+        self._active_calls = 0
+        self._concurrent = False
+        self._started_tracing = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def attach(self, guidance: "LaborLawGuidance") -> "LaborLawGuidance":
+        """包装实例上的各环节方法（只影响该实例）"""
+        for method_name, stage in PROFILED_METHODS.items():
+            if self.stages is not None and stage not in self.stages:
+                continue
+            method = getattr(guidance, method_name, None)
+            if method is None or getattr(method, "_profiled_stage", None):
+                continue
+            setattr(guidance, method_name, self._wrap(stage, method))
+        return guidance
+
+    def _wrap(self, stage: str, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            return self._call(stage, method, args, kwargs)
+        wrapper._profiled_stage = stage
+        return wrapper
+
+    def _call(self, stage: str, method: Callable, args: tuple, kwargs: dict) -> Any:
+        if getattr(self._local, "active", None):
+            return method(*args, **kwargs)
+
+        with self._lock:
+            record = self._records.setdefault(stage, _StageRecord())
+            record.calls += 1
+            sampled = (record.calls - 1) % self.sample_every == 0
+            self._active_calls += 1
+            if self._active_calls > 1:
+                self._concurrent = True
+            track_peak = not self._concurrent
+
+        self._local.active = stage
+        profile = None
+        before = None
+        if sampled:
+            if self.trace_memory:
+                before = self._snapshot()
+                if track_peak:
+                    tracemalloc.reset_peak()
+                    memory_start = tracemalloc.get_traced_memory()[0]
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # 其他线程的剖析尚未结束（部分Python版本同一时间只允许一个剖析器）
+                profile = None
+
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.disable()
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            self._local.active = None
+
+            peak = None
+            diffs = []
+            if before is not None:
+                if track_peak:
+                    peak = tracemalloc.get_traced_memory()[1] - memory_start
+                diffs = self._snapshot().compare_to(before, "lineno")
+
+            with self._lock:
+                self._active_calls -= 1
+                record.wall_seconds += wall
+                record.cpu_seconds += cpu
+                record.max_wall_seconds = max(record.max_wall_seconds, wall)
+                if profile is not None:
+                    record.profiled_calls += 1
+                    if record.profile_stats is None:
+                        record.profile_stats = pstats.Stats(profile)
+                    else:
+                        record.profile_stats.add(profile)
+                if peak is not None:
+                    record.peak_bytes = max(record.peak_bytes, peak)
+                for diff in diffs:
+                    if diff.size_diff <= 0:
+                        continue
+                    entry = record.allocations.setdefault(str(diff.traceback[0]), [0, 0])
+                    entry[0] += diff.size_diff
+                    entry[1] += max(diff.count_diff, 0)
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, path) for path in _IGNORED_ALLOCATION_FILES]
+        )
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """各环节的调用次数、剖析次数、总/平均/最长墙钟时间、CPU时间与内存峰值
+
+        未开启trace_memory或出现过并发调用时，内存峰值为None。
+        """
+        result = {}
+        with self._lock:
+            report_peak = self.trace_memory and not self._concurrent
+            for stage, record in sorted(self._records.items()):
+                result[stage] = {
+                    "calls": record.calls,
+                    "profiled_calls": record.profiled_calls,
+                    "wall_seconds": round(record.wall_seconds, 6),
+                    "mean_wall_seconds": round(record.wall_seconds / record.calls, 6) if record.calls else 0.0,
+                    "max_wall_seconds": round(record.max_wall_seconds, 6),
+                    "cpu_seconds": round(record.cpu_seconds, 6),
+                    "peak_bytes": record.peak_bytes if report_peak else None,
+                }
+        return result
+
+    def top_allocations(self, stage: str) -> List[Dict[str, Any]]:
+        """环节中新增分配最多的代码行"""
+        with self._lock:
+            record = self._records.get(stage)
+            items = list(record.allocations.items()) if record else []
+        items.sort(key=lambda item: item[1][0], reverse=True)
+        return [{"line": line, "size_bytes": size, "count": count}
+                for line, (size, count) in items[:self.top_n]]
+
+    def dump(self) -> str:
+        """写出各环节报告，返回输出目录
+
+        每个环节生成 <环节>.prof、<环节>.txt（按累计耗时排序的Top-N）
+        以及 <环节>.alloc.txt（分配Top-N），另生成 summary.json。
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        summary = self.summary()
+        for stage in summary:
+            base = os.path.join(self.output_dir, stage)
+            with self._lock:
+                stats = self._records[stage].profile_stats
+                if stats is not None:
+                    stats.dump_stats(base + ".prof")
+            if stats is not None:
+                with open(base + ".txt", 'w', encoding='utf-8') as f:
+                    pstats.Stats(base + ".prof", stream=f).sort_stats("cumulative").print_stats(self.top_n)
+
+            allocations = self.top_allocations(stage)
+            summary[stage]["top_allocations"] = allocations
+            if self.trace_memory:
+                with open(base + ".alloc.txt", 'w', encoding='utf-8') as f:
+                    f.write(f"# {stage}：剖析 {summary[stage]['profiled_calls']} 次调用中新增分配最多的代码行\n")
+                    for item in allocations:
+                        f.write(f"{item['size_bytes'] / 1024:10.1f} KB  {item['count']:8d} 次  {item['line']}\n")
+
+        with open(os.path.join(self.output_dir, "summary.json"), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return self.output_dir
+
+    def close(self):
+        """停止由本剖析器启动的tracemalloc"""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+def print_profile_summary(profiler: StageProfiler):
+    """打印各环节的本地耗时与内存峰值"""
+    print(f"\n各环节本地剖析（报告目录：{profiler.output_dir}）：")
+    for stage, info in profiler.summary().items():
+        peak = info["peak_bytes"]
+        peak_text = f"，内存峰值 {peak / 1024:.0f} KB" if peak is not None else ""
+        print(f"   • {stage}: {info['calls']} 次，墙钟 {info['wall_seconds']:.3f}s，"
+              f"CPU {info['cpu_seconds']:.3f}s，最长 {info['max_wall_seconds']:.3f}s{peak_text}")
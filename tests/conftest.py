@@ -0,0 +1,36 @@
+import os
+import sys
+
+# 项目模块位于仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import types
+
+import pytest
+
+
+class FakeClient:
+    """按请求返回固定内容的模型客户端替身，记录每次调用的参数"""
+
+    def __init__(self, responder):
+        self.calls = []
+        self.responder = responder
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._create))
+
+    def with_options(self, **options):
+        self.options = options
+        return self
+
+    def _create(self, **request):
+        self.calls.append(request)
+        content = self.responder(request)
+        message = types.SimpleNamespace(role="assistant", content=content)
+        choice = types.SimpleNamespace(index=0, message=message, finish_reason="stop")
+        usage = types.SimpleNamespace(prompt_tokens=0, completion_tokens=len(content or ""), total_tokens=0)
+        return types.SimpleNamespace(choices=[choice], usage=usage)
+
+
+@pytest.fixture
+def fake_client():
+    """fake_client(responder) 构造模型客户端替身"""
+    return FakeClient
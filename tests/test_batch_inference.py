@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""batch_inference 导出 → 替身结果 → 导入 的往返测试"""
+
+import json
+
+import pytest
+
+pytest.importorskip("openai")
+
+from batch_inference import (  # noqa: E402
+    LaborLawBatchInference, iter_dataset_cases, make_custom_id, parse_custom_id, read_jsonl,
+    write_stub_results,
+)
+from labor_law_guidance import (  # noqa: E402
+    LaborLawGuidance, DEFAULT_EVIDENCE_ITEMS, STAGE_ANALYSIS, STAGE_EXTRACTION, STAGE_KEY_POINTS,
+)
+
+
+def _case(text):
+    return {"conversations": [{"from": "human", "value": text}]}
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    lines = [json.dumps(_case("公司把我辞退了"), ensure_ascii=False),
+             "{broken json",
+             json.dumps(_case("公司拖欠三个月工资"), ensure_ascii=False),
+             json.dumps({"conversations": [{"from": "human"}]}),
+             json.dumps(_case("加班没有加班费"), ensure_ascii=False)]
+    path = tmp_path / "cases.jsonl"
+    path.write_text("\n".join(lines), encoding="utf-8")
+    return str(path)
+
+
+def test_custom_id_round_trip():
+    assert parse_custom_id(make_custom_id(12, STAGE_ANALYSIS)) == (12, STAGE_ANALYSIS, None)
+    assert parse_custom_id(make_custom_id(3, STAGE_KEY_POINTS, 7)) == (3, STAGE_KEY_POINTS, 7)
+    with pytest.raises(ValueError):
+        parse_custom_id("request-1")
+
+
+def test_export_skips_bad_records_and_keeps_source_indexes(tmp_path, dataset):
+    batch = LaborLawBatchInference(LaborLawGuidance())
+    errors = []
+    requests_file = str(tmp_path / "analysis_requests.jsonl")
+    count = batch.export_batch_requests(STAGE_ANALYSIS, iter_dataset_cases(dataset, errors), requests_file)
+
+    assert count == 3
+    assert [line["custom_id"] for line in read_jsonl(requests_file)] == [
+        make_custom_id(0, STAGE_ANALYSIS), make_custom_id(2, STAGE_ANALYSIS), make_custom_id(4, STAGE_ANALYSIS)]
+    assert len(errors) == 2
+    assert "第1个案例" in errors[0] and "第3个案例" in errors[1]
+
+
+def test_stub_round_trip_maps_results_and_handles_failures(tmp_path, dataset):
+    batch = LaborLawBatchInference(LaborLawGuidance())
+    requests_file = str(tmp_path / "analysis_requests.jsonl")
+    results_file = str(tmp_path / "analysis_results.jsonl")
+    batch.export_batch_requests(STAGE_ANALYSIS, iter_dataset_cases(dataset, []), requests_file)
+
+    def responder(request_line):
+        case_index, _, _ = parse_custom_id(request_line["custom_id"])
+        if case_index == 2:
+            return None
+        return f"案例{case_index}：\n- **劳动合同**：证明劳动关系\n- **考勤记录**：证明出勤"
+
+    assert write_stub_results(requests_file, results_file, responder) == 3
+    result_lines = read_jsonl(results_file)
+    assert [line["error"] is None for line in result_lines] == [True, False, True]
+
+    # 结果文件中缺少案例4的结果
+    with open(results_file, "w", encoding="utf-8") as f:
+        for line in result_lines[:2]:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    analyses = batch.import_batch_results(STAGE_ANALYSIS, results_file)
+    assert sorted(analyses) == [0, 2]
+    assert analyses[0].startswith("案例0：")
+    assert analyses[2].startswith("AI分析失败")
+
+    extraction_file = str(tmp_path / "extraction_requests.jsonl")
+    assert batch.export_batch_requests(STAGE_EXTRACTION, analyses, extraction_file) == 1
+    extraction_results = str(tmp_path / "extraction_results.jsonl")
+    write_stub_results(extraction_file, extraction_results)
+    evidence_lists = batch.import_batch_results(STAGE_EXTRACTION, extraction_results, analyses)
+    assert len(evidence_lists[0]) == len(DEFAULT_EVIDENCE_ITEMS)
+    assert len(evidence_lists[2]) == len(DEFAULT_EVIDENCE_ITEMS)
+
+    key_points_file = str(tmp_path / "key_points_requests.jsonl")
+    count = batch.export_batch_requests(STAGE_KEY_POINTS, {0: evidence_lists[0][:2]}, key_points_file)
+    assert count == 2
+    key_points_results = str(tmp_path / "key_points_results.jsonl")
+    write_stub_results(key_points_file, key_points_results,
+                       lambda line: None if line["custom_id"].endswith("-001") else "要点")
+    key_points = batch.import_batch_results(STAGE_KEY_POINTS, key_points_results, {0: evidence_lists[0][:2]})
+    first, second = (item["evidence_type"] for item in evidence_lists[0][:2])
+    assert key_points[0][first] == "要点"
+    assert key_points[0][second] and key_points[0][second] != "要点"  # 失败的请求使用默认关键要点
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""case_similarity 近似案例检索测试"""
+
+import json
+
+import pytest
+
+from case_similarity import CaseSimilarityIndex, REUSE_SERVE, REUSE_WARM_START
+
+
+BASE = ("我在一家互联网公司做了三年的软件工程师，上个月公司以不能胜任工作为由把我辞退了，"
+        "没有提前三十天通知，也没有支付任何经济补偿，解除通知书上只写了绩效不达标，"
+        "但我之前的绩效考核一直是良好，也从来没有给我安排过培训或者调岗。")
+NEAR_DUPLICATE = BASE.replace("三年", "3年").replace("，", " ")
+MEDIUM = BASE[:len(BASE) * 2 // 3] + "另外公司还拖欠了两个月的加班费，周末加班从来没有调休。"
+UNRELATED = "入职半年一直没签劳动合同，想要主张二倍工资，同时公司未给缴纳社会保险和公积金。"
+
+EVIDENCE = [{"evidence_type": "劳动合同", "importance": "关键证据"}]
+
+
+def _conversation(text):
+    return [{"from": "human", "value": text}, {"from": "gpt", "value": "请详细说明"}]
+
+
+@pytest.fixture
+def index():
+    index = CaseSimilarityIndex(threshold=0.85, warm_start_threshold=0.4)
+    index.add(_conversation(BASE), "已有分析", EVIDENCE)
+    return index
+
+
+def test_near_duplicate_is_served(index):
+    match = index.lookup(_conversation(NEAR_DUPLICATE))
+    assert match["reuse"] == REUSE_SERVE
+    assert match["analysis"] == "已有分析"
+    assert match["evidence_list"] == EVIDENCE
+    match["evidence_list"][0]["importance"] = "辅助证据"
+    assert index.entries[match["case_id"]]["evidence_list"] == EVIDENCE
+
+
+def test_medium_similarity_warm_starts(index):
+    match = index.lookup(_conversation(MEDIUM))
+    assert match["reuse"] == REUSE_WARM_START
+    assert 0.4 <= match["similarity"] < 0.85
+
+
+def test_unrelated_case_misses(index):
+    assert index.lookup(_conversation(UNRELATED)) is None
+    stats = index.stats()
+    assert stats["lookups"] == 1 and stats["misses"] == 1 and stats["hit_rate"] == 0.0
+
+
+def test_lawyer_wording_does_not_affect_similarity(index):
+    conversation = [{"from": "human", "value": BASE}, {"from": "gpt", "value": "完全不同的律师回复内容"}]
+    assert index.lookup(conversation)["similarity"] == 1.0
+
+
+def test_re_adding_a_case_id_replaces_its_buckets(index):
+    case_id = next(iter(index.entries))
+    index.add(_conversation(UNRELATED), "新分析", EVIDENCE, case_id=case_id)
+    assert len(index) == 1
+    assert index.lookup(_conversation(BASE)) is None
+    assert index.lookup(_conversation(UNRELATED))["analysis"] == "新分析"
+
+
+def test_save_and_load_round_trip(tmp_path, index):
+    index_file = str(tmp_path / "index.json")
+    index.save(index_file)
+    loaded = CaseSimilarityIndex(index_file, threshold=0.85, warm_start_threshold=0.4)
+    assert loaded.lookup(_conversation(NEAR_DUPLICATE))["reuse"] == REUSE_SERVE
+
+
+@pytest.mark.parametrize("params", [{"num_perm": 32, "bands": 8}, {"seed": 7}, {"shingle_size": 2}])
+def test_mismatched_index_params_are_rejected(tmp_path, index, params):
+    index_file = str(tmp_path / "index.json")
+    index.save(index_file)
+    with pytest.raises(ValueError):
+        CaseSimilarityIndex(index_file, **params)
+
+
+def test_autosave_every_k_adds_and_flush(tmp_path):
+    index_file = tmp_path / "index.json"
+    index = CaseSimilarityIndex(str(index_file), save_every=3)
+    for i in range(2):
+        index.add(_conversation(f"{UNRELATED}第{i}个"), "分析", EVIDENCE)
+    assert not index_file.exists()
+    index.add(_conversation(BASE), "分析", EVIDENCE)
+    assert len(json.loads(index_file.read_text(encoding="utf-8"))["entries"]) == 3
+    index.add(_conversation(MEDIUM), "分析", EVIDENCE)
+    index.flush()
+    assert len(json.loads(index_file.read_text(encoding="utf-8"))["entries"]) == 4
+
+
+def test_bands_must_divide_num_perm():
+    with pytest.raises(ValueError):
+        CaseSimilarityIndex(num_perm=64, bands=10)
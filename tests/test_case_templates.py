@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""case_templates 案例分类、清单合并与后台修正测试"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from case_templates import (
+    CASE_ILLEGAL_TERMINATION, CASE_UNPAID_WAGES, CASE_NO_CONTRACT,
+    build_template_checklist, classify_case, merge_refined_checklist,
+)
+
+
+def _human(*texts):
+    return [{"from": "human", "value": text} for text in texts]
+
+
+def test_merge_matches_aliases_instead_of_adding_duplicates():
+    template = [dict(item, importance="重要证据") for item in build_template_checklist([CASE_ILLEGAL_TERMINATION])]
+    refined = [
+        {"evidence_type": "书面劳动合同", "importance": "重要证据"},
+        {"evidence_type": "工资条/银行流水", "importance": "关键证据"},
+        {"evidence_type": "证人证言", "importance": "辅助证据"},
+    ]
+    merged, diff = merge_refined_checklist(template, refined)
+    assert diff == {"added": ["证人证言"], "changed": ["工资发放记录"]}
+    names = [item["evidence_type"] for item in merged]
+    assert "书面劳动合同" not in names and "工资条/银行流水" not in names
+    assert len(merged) == len(template) + 1
+
+
+def _analysis_request(request):
+    return "请分析以下劳动争议对话" in request["messages"][-1]["content"]
+
+
+def test_slow_background_analysis_does_not_block_or_touch_session(tmp_path, monkeypatch, fake_client):
+    pytest.importorskip("openai")
+    import session_budget
+    from labor_law_guidance import LaborLawGuidance, STAGE_ANALYSIS
+
+    monkeypatch.setattr(session_budget, "DEFAULT_STAGE_MIN_BUDGET", {})
+    analysis_done = threading.Event()
+
+    def responder(request):
+        if _analysis_request(request):
+            time.sleep(2.0)
+            analysis_done.set()
+            return "- **证人证言**：同事证明解除经过"
+        if "候选证据类型" in request["messages"][-1]["content"]:
+            return "{}"
+        return json.dumps([{"evidence_type": "证人证言", "importance": "关键证据"}], ensure_ascii=False)
+
+    conversation_file = tmp_path / "conversation.json"
+    conversation_file.write_text(json.dumps(
+        [{"conversations": _human("公司以不能胜任为由把我辞退了，给了解除通知书")}], ensure_ascii=False),
+        encoding="utf-8")
+    answers = iter(["我有劳动合同", ""])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+
+    guidance = LaborLawGuidance(client=fake_client(responder))
+    start = time.monotonic()
+    guidance.run_guidance_session(str(conversation_file), deadline_seconds=0.5)
+    assert time.monotonic() - start < 1.5
+    assert not analysis_done.is_set()
+
+    snapshot = (dict(guidance.degraded_stages), dict(guidance.extraction_metrics),
+                guidance.matched_case, [e["evidence_type"] for e in guidance.required_evidence])
+    assert STAGE_ANALYSIS in snapshot[0]
+    assert "证人证言" not in snapshot[3]
+
+    assert analysis_done.wait(5)
+    time.sleep(0.2)
+    assert (dict(guidance.degraded_stages), dict(guidance.extraction_metrics),
+            guidance.matched_case, [e["evidence_type"] for e in guidance.required_evidence]) == snapshot
+
+
+@pytest.mark.parametrize("texts, expected", [
+    (["公司以不能胜任为由把我辞退了", "解除通知书上写的是违法解除"], [CASE_ILLEGAL_TERMINATION]),
+    (["公司以不能胜任为由把我辞退了，解除通知书已经收到", "顺便问一下今年的年假还能折算吗"],
+     [CASE_ILLEGAL_TERMINATION]),
+    (["公司拖欠了我三个月工资，克扣工资也很严重", "上个月又把我辞退了，解除通知书都没给"],
+     [CASE_UNPAID_WAGES, CASE_ILLEGAL_TERMINATION]),
+    (["入职一年了一直没签合同", "想主张双倍工资"], [CASE_NO_CONTRACT]),
+])
+def test_classify_mixed_cases(texts, expected):
+    assert [case_type for case_type, _ in classify_case(_human(*texts))] == expected
+
+
+@pytest.mark.parametrize("conversation", [
+    _human("我在工地上受伤了，公司不给认定工伤"),
+    _human("想咨询一下竞业限制协议是否有效"),
+    _human("我该怎么办？"),
+    [{"from": "gpt", "value": "请问公司有没有拖欠工资、安排加班或者辞退您？"},
+     {"from": "human", "value": "我想问问社保断缴的事"}],
+    [],
+])
+def test_classify_without_matching_template(conversation):
+    assert classify_case(conversation) == []
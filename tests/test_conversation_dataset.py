@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""conversation_dataset 流式读取与偏移索引测试"""
+
+import json
+import os
+
+import pytest
+
+from conversation_dataset import (
+    ConversationDataset, ConversationFormatError, FORMAT_ARRAY, FORMAT_JSONL,
+    iter_conversation_cases, iter_conversation_records,
+)
+
+
+def _case(text):
+    return {"conversations": [{"from": "human", "value": text}, {"from": "gpt", "value": "收到"}]}
+
+
+TRICKY_CASES = [
+    _case('他说"公司要[裁员]"，还给了{补偿}'),
+    _case('反斜杠结尾\\'),
+    _case('转义引号 \\" 和 ]} 以及 \\\\"'),
+    {"conversations": [{"from": "human", "value": "嵌套"}], "meta": {"tags": [["a", "]"], [{"b": "["}]]}},
+    _case("中文与emoji 🙂"),
+]
+
+
+def _write(path, text, bom=False):
+    with open(path, "wb") as f:
+        if bom:
+            f.write(b"\xef\xbb\xbf")
+        f.write(text.encode("utf-8"))
+    return str(path)
+
+
+def _read_all(path):
+    with ConversationDataset(path) as dataset:
+        return dataset.format, list(dataset)
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_array_matches_json_load(tmp_path, indent):
+    path = _write(tmp_path / "cases.json", json.dumps(TRICKY_CASES, ensure_ascii=False, indent=indent))
+    fmt, cases = _read_all(path)
+    assert fmt == FORMAT_ARRAY
+    with open(path, encoding="utf-8") as f:
+        assert cases == [record["conversations"] for record in json.load(f)]
+
+
+def test_array_with_bom(tmp_path):
+    path = _write(tmp_path / "cases.json", json.dumps(TRICKY_CASES, ensure_ascii=False), bom=True)
+    fmt, cases = _read_all(path)
+    assert fmt == FORMAT_ARRAY
+    assert cases == [record["conversations"] for record in TRICKY_CASES]
+
+
+def test_jsonl_with_bom_and_blank_lines(tmp_path):
+    lines = [json.dumps(record, ensure_ascii=False) for record in TRICKY_CASES]
+    text = "\n\n".join(lines[:2]) + "\n   \n\t\n" + "\r\n".join(lines[2:]) + "\n\n"
+    path = _write(tmp_path / "cases.jsonl", text, bom=True)
+    fmt, cases = _read_all(path)
+    assert fmt == FORMAT_JSONL
+    assert cases == [record["conversations"] for record in TRICKY_CASES]
+
+
+@pytest.mark.parametrize("text", ["", "   \n\t\n"])
+def test_empty_and_whitespace_files(tmp_path, text):
+    path = _write(tmp_path / "empty.jsonl", text)
+    with ConversationDataset(path) as dataset:
+        assert list(dataset) == []
+        assert len(dataset) == 0
+        with pytest.raises(IndexError):
+            dataset.get_case(0)
+
+
+def test_empty_array(tmp_path):
+    path = _write(tmp_path / "empty.json", " [ ] ")
+    assert list(iter_conversation_cases(path)) == []
+
+
+def test_unclosed_array_raises(tmp_path):
+    path = _write(tmp_path / "broken.json", json.dumps(TRICKY_CASES[:2], ensure_ascii=False)[:-1])
+    with pytest.raises(ConversationFormatError):
+        list(iter_conversation_cases(path))
+
+
+def test_get_case_matches_json_load_order(tmp_path):
+    records = [_case(f"第{i}个案例") for i in range(30)] + TRICKY_CASES
+    path = _write(tmp_path / "cases.json", json.dumps(records, ensure_ascii=False, indent=1))
+    with ConversationDataset(path) as dataset:
+        assert len(dataset) == len(records)
+        for i in [len(records) - 1, 0, 17, 31, 5]:
+            assert dataset.get_case(i) == records[i]["conversations"]
+        with pytest.raises(IndexError):
+            dataset.get_case(len(records))
+
+
+def test_index_save_and_load(tmp_path):
+    records = [_case(f"案例{i}") for i in range(10)]
+    path = _write(tmp_path / "cases.jsonl", "\n".join(json.dumps(r, ensure_ascii=False) for r in records))
+    index_file = str(tmp_path / "cases.idx")
+    with ConversationDataset(path, index_file=index_file) as dataset:
+        assert dataset.get_case(3) == records[3]["conversations"]
+    assert os.path.exists(index_file)
+
+    with ConversationDataset(path, index_file=index_file) as dataset:
+        assert dataset.load_index(index_file)
+        assert dataset.get_case(9) == records[9]["conversations"]
+
+
+def test_index_invalidated_when_data_changes(tmp_path):
+    records = [_case(f"案例{i}") for i in range(5)]
+    path = _write(tmp_path / "cases.jsonl", "\n".join(json.dumps(r, ensure_ascii=False) for r in records))
+    index_file = str(tmp_path / "cases.idx")
+    with ConversationDataset(path, index_file=index_file) as dataset:
+        dataset.build_index()
+
+    records.insert(0, _case("新插入的较长案例" * 5))
+    _write(tmp_path / "cases.jsonl", "\n".join(json.dumps(r, ensure_ascii=False) for r in records))
+    with ConversationDataset(path, index_file=index_file) as dataset:
+        assert not dataset.load_index(index_file)
+        assert len(dataset) == 6
+        assert dataset.get_case(0) == records[0]["conversations"]
+
+
+def test_index_file_corrupt_is_rebuilt(tmp_path):
+    path = _write(tmp_path / "cases.jsonl", json.dumps(_case("唯一案例"), ensure_ascii=False))
+    index_file = _write(tmp_path / "cases.idx", "{not json")
+    with ConversationDataset(path, index_file=index_file) as dataset:
+        assert dataset.get_case(0) == _case("唯一案例")["conversations"]
+
+
+def test_iter_records_reports_bad_records(tmp_path):
+    lines = [
+        json.dumps(_case("正常"), ensure_ascii=False),
+        "{broken json",
+        json.dumps({"conversations": [{"from": "human"}]}),
+        json.dumps(_case("之后的记录"), ensure_ascii=False),
+    ]
+    path = _write(tmp_path / "cases.jsonl", "\n".join(lines))
+    records = list(iter_conversation_records(path))
+    assert [error is None for _, error in records] == [True, False, False, True]
+    assert records[3][0] == _case("之后的记录")["conversations"]
+    assert "第1个案例" in records[1][1]
+    assert "第2个案例" in records[2][1]
+
+
+def test_array_scalars_keep_their_case_index(tmp_path):
+    text = json.dumps([_case("a"), 5, None, True, -1.5e3, _case("b")], ensure_ascii=False)
+    path = _write(tmp_path / "cases.json", text)
+    records = list(iter_conversation_records(path))
+    assert len(records) == 6
+    assert records[0][1] is None and records[5] == (_case("b")["conversations"], None)
+    for case_index in range(1, 5):
+        assert records[case_index][0] is None
+        assert f"第{case_index}个案例" in records[case_index][1]
+    with ConversationDataset(path) as dataset:
+        assert len(dataset) == 6
+        assert dataset.get_case(5) == _case("b")["conversations"]
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""evidence_state 多轮证据核查的逐轮比对测试"""
+
+import json
+
+import pytest
+
+pytest.importorskip("openai")
+
+from labor_law_guidance import LaborLawGuidance  # noqa: E402
+from evidence_state import EvidenceState  # noqa: E402
+
+
+EVIDENCE_TYPES = ["劳动合同", "工资条", "考勤记录", "社保缴纳记录"]
+
+
+def _is_evidence_parse(request):
+    return "候选证据类型" in request["messages"][-1]["content"]
+
+
+def _make_state(fake_client, llm_holdings=None):
+    """llm_holdings: {回答中的关键词: {证据类型: 状态}}，模型解析按回答返回，默认不识别任何证据"""
+    def responder(request):
+        if _is_evidence_parse(request):
+            content = request["messages"][-1]["content"]
+            holdings = {}
+            for keyword, statuses in (llm_holdings or {}).items():
+                if keyword in content:
+                    holdings.update(statuses)
+            return json.dumps({k: {"status": v, "justification": ""} for k, v in holdings.items()},
+                              ensure_ascii=False)
+        return "重点关注证据的真实性与关联性。"
+
+    client = fake_client(responder)
+    guidance = LaborLawGuidance(client=client)
+    evidence_list = guidance._normalize_evidence_items(
+        [{"evidence_type": t, "importance": "关键证据"} for t in EVIDENCE_TYPES])
+    return EvidenceState(guidance, evidence_list), client
+
+
+def _statuses(state):
+    return {k: v["status"] for k, v in state.holdings.items()}
+
+
+def test_rounds_report_added_changed_removed(fake_client):
+    state, _ = _make_state(fake_client)
+
+    diff = state.apply_answer("我有劳动合同和工资条")
+    assert diff == {"added": ["劳动合同", "工资条"], "changed": [], "removed": []}
+
+    diff = state.apply_answer("工资条只有部分月份的截图，还有打卡记录")
+    assert diff == {"added": ["考勤记录"], "changed": ["工资条"], "removed": []}
+    assert _statuses(state) == {"劳动合同": "是", "工资条": "部分", "考勤记录": "是"}
+
+    diff = state.apply_answer("其实没有劳动合同")
+    assert diff == {"added": [], "changed": [], "removed": ["劳动合同"]}
+    assert state.status_of("劳动合同") is None
+    assert [e["evidence_type"] for e in state.missing_evidence()] == ["劳动合同", "社保缴纳记录"]
+    assert state.rounds == 3
+
+
+def test_repeated_answer_has_no_changes(fake_client):
+    state, _ = _make_state(fake_client)
+    state.apply_answer("我有劳动合同")
+    assert state.apply_answer("我有劳动合同") == {"added": [], "changed": [], "removed": []}
+
+
+def test_llm_only_sees_evidence_not_fully_held(fake_client):
+    state, client = _make_state(fake_client, llm_holdings={"网上查到": {"社保缴纳记录": "部分"}})
+    state.apply_answer("我有劳动合同")
+    client.calls.clear()
+
+    diff = state.apply_answer("社保能在网上查到一部分")
+    assert diff["added"] == ["社保缴纳记录"]
+    parse_calls = [c for c in client.calls if _is_evidence_parse(c)]
+    assert len(parse_calls) == 1
+    candidates = parse_calls[0]["messages"][-1]["content"]
+    assert "劳动合同" not in candidates and "社保缴纳记录" in candidates
+
+
+def test_key_points_reused_across_rounds(fake_client):
+    state, client = _make_state(fake_client)
+    state.apply_answer("我有劳动合同和工资条")
+    state.prefetch_key_points(list(state.holdings))
+    assert state.metrics["key_points_computed"] == 2
+
+    state.apply_answer("还有打卡记录")
+    state.prefetch_key_points(list(state.holdings))
+    assert state.metrics["key_points_computed"] == 3
+    state.key_points_for("劳动合同")
+    assert state.metrics["key_points_reused"] == 1
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""labor_law_guidance 证据清单本地提取测试"""
+
+import json
+
+import pytest
+
+pytest.importorskip("openai")
+
+from labor_law_guidance import LaborLawGuidance, STAGE_EXTRACTION  # noqa: E402
+
+
+STRUCTURED_ANALYSIS = """## 一、案例类型
+违法解除劳动合同
+
+## 二、所需证据材料
+1. **劳动合同**：证明劳动关系
+   - 法律要件：载明用人单位与岗位
+2. **解除劳动合同通知书**：证明解除事实与理由
+3. **工资条**：证明工资标准
+4. **考勤记录**：证明出勤情况
+
+## 三、证明标准
+1. **证明标准**：高度盖然性
+2. **举证责任**：用人单位对解除理由举证
+"""
+
+NON_EVIDENCE_ANALYSIS = """## 争议分析
+- **争议焦点**：解除是否合法
+- **证明责任**：用人单位
+- **法律依据**：劳动合同法第三十九条
+"""
+
+PLAIN_LIST_ANALYSIS = """- 劳动合同：证明劳动关系
+- 争议焦点：解除是否合法
+- 工资条：证明工资标准
+"""
+
+MODEL_CHECKLIST = [{"evidence_type": "证人证言", "importance": "辅助证据", "description": "同事证明"}]
+
+
+def _guidance(fake_client, **kwargs):
+    client = fake_client(lambda request: json.dumps(MODEL_CHECKLIST, ensure_ascii=False))
+    return LaborLawGuidance(client=client, **kwargs), client
+
+
+def test_structured_section_is_confident_and_stops_at_next_heading(fake_client):
+    guidance, _ = _guidance(fake_client)
+    items, confidence = guidance._local_extract_evidence(STRUCTURED_ANALYSIS)
+    assert [item["evidence_type"] for item in items] == ["劳动合同", "解除劳动合同通知书", "工资条", "考勤记录"]
+    assert items[0]["legal_requirements"] == "载明用人单位与岗位"
+    assert confidence >= guidance.local_extraction_threshold
+
+
+def test_non_evidence_points_are_rejected(fake_client):
+    guidance, _ = _guidance(fake_client)
+    assert guidance._local_extract_evidence(NON_EVIDENCE_ANALYSIS) == ([], 0.0)
+
+
+def test_fallback_parse_filters_names_and_caps_confidence(fake_client):
+    guidance, _ = _guidance(fake_client)
+    items, confidence = guidance._local_extract_evidence(PLAIN_LIST_ANALYSIS)
+    assert [item["evidence_type"] for item in items] == ["劳动合同", "工资条"]
+    assert 0 < confidence <= 0.5 < guidance.local_extraction_threshold
+
+
+def test_confident_local_extraction_skips_the_model(fake_client):
+    guidance, client = _guidance(fake_client)
+    evidence = guidance.extract_required_evidence(STRUCTURED_ANALYSIS)
+    assert len(evidence) == 4 and client.calls == []
+    assert guidance.extraction_metrics == {"local": 1, "llm": 0}
+
+
+@pytest.mark.parametrize("analysis", [NON_EVIDENCE_ANALYSIS, PLAIN_LIST_ANALYSIS])
+def test_low_confidence_falls_back_to_the_model(fake_client, analysis):
+    guidance, client = _guidance(fake_client)
+    evidence = guidance.extract_required_evidence(analysis)
+    assert [item["evidence_type"] for item in evidence] == ["证人证言"]
+    assert len(client.calls) == 1
+    assert guidance.extraction_metrics == {"local": 0, "llm": 1}
+    assert STAGE_EXTRACTION not in guidance.degraded_stages
+
+
+def test_threshold_above_one_always_uses_the_model(fake_client):
+    guidance, client = _guidance(fake_client, local_extraction_threshold=1.01)
+    guidance.extract_required_evidence(STRUCTURED_ANALYSIS)
+    assert len(client.calls) == 1
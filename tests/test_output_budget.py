@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""output_budget 输出长度预算与截断重试测试"""
+
+import types
+
+import pytest
+
+from output_budget import OutputLengthBudget, DEFAULT_STAGE_MAX_TOKENS
+
+
+def test_initial_cap_until_enough_samples():
+    budget = OutputLengthBudget(min_samples=5)
+    for _ in range(4):
+        budget.observe("advice", 100)
+    assert budget.max_tokens_for("advice") == DEFAULT_STAGE_MAX_TOKENS["advice"]
+    assert budget.max_tokens_for("analysis") is None
+
+
+def test_learned_cap_is_percentile_plus_margin():
+    budget = OutputLengthBudget(min_samples=5, percentile=0.99, margin=0.2, min_tokens=10)
+    for tokens in [100, 120, 80, 150, 90, 110]:
+        budget.observe("analysis", tokens)
+    assert budget.max_tokens_for("analysis") == 180
+    assert budget.max_tokens_for("analysis", scale=3) == 540
+
+
+def test_learned_cap_respects_minimum_and_scaled_samples():
+    budget = OutputLengthBudget(min_samples=3, min_tokens=64)
+    for _ in range(3):
+        budget.observe("key_points", 60, scale=3)
+    assert budget.samples["key_points"] == [20, 20, 20]
+    assert budget.max_tokens_for("key_points") == 64
+
+
+def test_window_keeps_recent_samples_and_round_trips(tmp_path):
+    budget_file = str(tmp_path / "budget.json")
+    budget = OutputLengthBudget(budget_file, window=3, save_every=0)
+    for tokens in [10, 20, 30, 40]:
+        budget.observe("advice", tokens)
+    assert budget.samples["advice"] == [20, 30, 40]
+    budget.flush()
+    assert OutputLengthBudget(budget_file).samples == {"advice": [20, 30, 40]}
+
+
+def _completion(content, finish_reason, completion_tokens):
+    message = types.SimpleNamespace(role="assistant", content=content)
+    choice = types.SimpleNamespace(index=0, message=message, finish_reason=finish_reason)
+    return types.SimpleNamespace(choices=[choice], usage=types.SimpleNamespace(completion_tokens=completion_tokens))
+
+
+class _TruncatingClient:
+    """前 truncated 次调用返回因长度截断的结果"""
+
+    def __init__(self, truncated):
+        self.truncated = truncated
+        self.calls = []
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._create))
+
+    def _create(self, **request):
+        self.calls.append(dict(request))
+        if len(self.calls) <= self.truncated:
+            return _completion("截断", "length", request["max_tokens"])
+        return _completion("完整", "stop", 150)
+
+
+@pytest.mark.parametrize("truncated, expected", [(0, "完整"), (1, "完整"), (5, "截断")])
+def test_truncation_is_retried_once_with_double_cap(truncated, expected):
+    pytest.importorskip("openai")
+    from labor_law_guidance import LaborLawGuidance, STAGE_ADVICE
+
+    client = _TruncatingClient(truncated)
+    budget = OutputLengthBudget()
+    guidance = LaborLawGuidance(client=client, output_budget=budget)
+    completion = guidance._create_completion(STAGE_ADVICE, model="m", messages=[{"role": "user", "content": "x"}])
+
+    cap = DEFAULT_STAGE_MAX_TOKENS[STAGE_ADVICE]
+    assert completion.choices[0].message.content == expected
+    assert [call["max_tokens"] for call in client.calls] == [cap, cap * 2][:min(truncated, 1) + 1]
+    assert budget.truncations.get(STAGE_ADVICE, 0) == min(truncated, 1)
+    # 截断的结果不计入输出长度样本
+    assert budget.samples.get(STAGE_ADVICE, []) == ([150] if expected == "完整" else [])
+
+
+def test_explicit_max_tokens_is_not_overridden_or_retried():
+    pytest.importorskip("openai")
+    from labor_law_guidance import LaborLawGuidance, STAGE_ADVICE
+
+    client = _TruncatingClient(1)
+    guidance = LaborLawGuidance(client=client)
+    guidance._create_completion(STAGE_ADVICE, model="m", messages=[], max_tokens=42)
+    assert [call["max_tokens"] for call in client.calls] == [42]
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""pipeline_scheduler 分阶段流水线的有序写出与结束测试"""
+
+import json
+import random
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("openai")
+
+from labor_law_guidance import LaborLawGuidance  # noqa: E402
+from pipeline_scheduler import StagedPipeline  # noqa: E402
+
+
+def _conversation(i):
+    return [{"from": "human", "value": f"案例编号{i}：公司以不能胜任为由解除劳动合同"},
+            {"from": "gpt", "value": "请提供更多信息"}]
+
+
+def _analysis_responder(request):
+    """分析调用随机耗时，使各案例乱序完成；分析文本带上案例编号"""
+    content = request["messages"][-1]["content"]
+    case_no = content.split("案例编号", 1)[1].split("：", 1)[0] if "案例编号" in content else "?"
+    time.sleep(random.uniform(0, 0.02))
+    return (f"案例{case_no}分析\n"
+            "- **劳动合同**：证明劳动关系\n"
+            "- **解除劳动合同通知书**：证明解除事实\n"
+            "- **工资条**：证明工资标准\n")
+
+
+def _make_pipeline(fake_client, **kwargs):
+    guidance = LaborLawGuidance(client=fake_client(_analysis_responder))
+    return StagedPipeline(guidance, stage_workers={"analysis": 4, "extraction": 2}, queue_size=2, **kwargs)
+
+
+def _run_with_timeout(target, timeout=20):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(metrics=target()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "流水线未能结束"
+    return result["metrics"]
+
+
+def _read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_results_written_in_case_order(tmp_path, fake_client):
+    output = str(tmp_path / "out.jsonl")
+    pipeline = _make_pipeline(fake_client)
+    metrics = _run_with_timeout(lambda: pipeline.run((_conversation(i) for i in range(20)), output))
+
+    lines = _read_lines(output)
+    assert [line["case_index"] for line in lines] == list(range(20))
+    for line in lines:
+        assert line["analysis"].startswith(f"案例{line['case_index']}分析")
+        assert line["evidence_list"] and line["error"] is None
+    assert metrics["cases_read"] == metrics["cases_written"] == 20
+    assert metrics["errors"] == []
+
+
+def test_bad_records_become_error_jobs(tmp_path, fake_client):
+    dataset = tmp_path / "cases.jsonl"
+    records = [json.dumps({"conversations": _conversation(0)}, ensure_ascii=False),
+               "{broken json",
+               json.dumps({"conversations": []}),
+               json.dumps({"conversations": _conversation(3)}, ensure_ascii=False)]
+    dataset.write_text("\n".join(records), encoding="utf-8")
+    output = str(tmp_path / "out.jsonl")
+    pipeline = _make_pipeline(fake_client)
+    metrics = _run_with_timeout(lambda: pipeline.run_dataset(str(dataset), output))
+
+    lines = _read_lines(output)
+    assert [line["case_index"] for line in lines] == [0, 1, 2, 3]
+    assert lines[0]["error"] is None and lines[3]["error"] is None
+    assert "第1个案例" in lines[1]["error"]
+    assert lines[2]["error"] == "空对话"
+    assert lines[1]["analysis"] is None
+    assert metrics["errors"] == []
+
+
+def test_failing_case_iterator_ends_pipeline(tmp_path, fake_client):
+    def cases():
+        for i in range(3):
+            yield _conversation(i)
+        raise OSError("磁盘读取失败")
+
+    output = str(tmp_path / "out.jsonl")
+    pipeline = _make_pipeline(fake_client)
+    metrics = _run_with_timeout(lambda: pipeline.run(cases(), output))
+
+    assert [line["case_index"] for line in _read_lines(output)] == [0, 1, 2]
+    assert len(metrics["errors"]) == 1 and "磁盘读取失败" in metrics["errors"][0]
+
+
+def test_writer_failure_ends_pipeline(tmp_path, fake_client):
+    output = str(tmp_path / "missing" / "out.jsonl")
+    pipeline = _make_pipeline(fake_client, include_key_points=True)
+    metrics = _run_with_timeout(lambda: pipeline.run((_conversation(i) for i in range(30)), output))
+
+    assert metrics["cases_read"] == 30
+    assert metrics["cases_written"] == 0
+    assert len(metrics["errors"]) == 1 and "写出结果失败" in metrics["errors"][0]
+
+
+def test_forked_instances_create_client_lazily(tmp_path):
+    created = []
+
+    class _Guidance(LaborLawGuidance):
+        @property
+        def client(self):
+            created.append(self)
+            return super().client
+
+    pipeline = StagedPipeline(_Guidance(), stage_workers={"analysis": 1, "extraction": 1})
+    metrics = _run_with_timeout(lambda: pipeline.run([[]], str(tmp_path / "out.jsonl")))
+    assert metrics["cases_written"] == 1
+    assert created == []
+
+
+def test_in_flight_cases_are_bounded_while_a_case_stalls(tmp_path, fake_client):
+    release = threading.Event()
+
+    def responder(request):
+        if "案例编号0：" in request["messages"][-1]["content"]:
+            release.wait(10)
+        return _analysis_responder(request)
+
+    guidance = LaborLawGuidance(client=fake_client(responder))
+    pipeline = StagedPipeline(guidance, stage_workers={"analysis": 4, "extraction": 2}, queue_size=2)
+    output = str(tmp_path / "out.jsonl")
+    runner = threading.Thread(target=lambda: pipeline.run((_conversation(i) for i in range(200)), output),
+                              daemon=True)
+    runner.start()
+    time.sleep(0.5)
+    assert pipeline.cases_read <= pipeline.max_in_flight
+    release.set()
+    runner.join(20)
+    assert not runner.is_alive()
+    assert pipeline.max_reorder_buffer <= pipeline.max_in_flight
+    assert [line["case_index"] for line in _read_lines(output)] == list(range(200))
+
+
+def test_concurrent_forks_share_one_lazily_created_client(monkeypatch):
+    import labor_law_guidance
+
+    created = []
+
+    def make_client(**kwargs):
+        time.sleep(0.05)
+        created.append(kwargs)
+        return object()
+
+    monkeypatch.setattr(labor_law_guidance, "OpenAI", make_client)
+    parent = LaborLawGuidance()
+    forks = [parent.fork() for _ in range(8)]
+    clients = []
+    threads = [threading.Thread(target=lambda f=f: clients.append(f.client)) for f in forks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+    assert all(client is parent.client for client in clients)
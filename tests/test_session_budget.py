@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""session_budget 会话预算、熔断与降级测试（真实客户端连接本地HTTP替身服务）"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+openai = pytest.importorskip("openai")
+
+from labor_law_guidance import LaborLawGuidance, DEFAULT_EVIDENCE_ITEMS, STAGE_ANALYSIS  # noqa: E402
+from session_budget import SessionDeadline, CircuitBreaker, DegradedModeError  # noqa: E402
+
+
+def _serve(status, delay=0.0):
+    """启动按固定状态码与延迟应答的本地服务，返回 (server, base_url, 请求计数)"""
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            requests.append(self.path)
+            time.sleep(delay)
+            body = {"error": {"message": "bad request", "type": "invalid_request_error"}}
+            if status == 200:
+                body = {"id": "x", "object": "chat.completion", "created": 0, "model": "m",
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": "ok"}}]}
+            data = json.dumps(body).encode("utf-8")
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except OSError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/v1", requests
+
+
+def _guidance(base_url, **kwargs):
+    # 客户端保持默认的 max_retries=2，预算内的调用须自行关闭重试
+    client = openai.OpenAI(api_key="test", base_url=base_url)
+    return LaborLawGuidance(client=client, **kwargs)
+
+
+def test_deadline_bounds_slow_calls_without_client_retries():
+    server, base_url, requests = _serve(200, delay=5.0)
+    try:
+        guidance = _guidance(base_url)
+        guidance.deadline = SessionDeadline(1.0, stage_min_budget={STAGE_ANALYSIS: 0.0})
+        start = time.monotonic()
+        analysis = guidance.analyze_case_with_ai([{"from": "human", "value": "公司辞退了我"}])
+        assert time.monotonic() - start < 2.5
+        assert STAGE_ANALYSIS in guidance.degraded_stages
+        assert analysis.startswith("AI分析失败")
+        assert len(requests) == 1
+    finally:
+        server.shutdown()
+
+
+def test_bad_requests_do_not_open_the_breaker():
+    server, base_url, _ = _serve(400)
+    try:
+        breaker = CircuitBreaker(failure_threshold=2)
+        guidance = _guidance(base_url, circuit_breaker=breaker)
+        for _ in range(3):
+            with pytest.raises(openai.BadRequestError):
+                guidance._create_completion(STAGE_ANALYSIS, model="m", messages=[{"role": "user", "content": "x"}])
+        assert breaker.state == CircuitBreaker.CLOSED
+    finally:
+        server.shutdown()
+
+
+def test_server_errors_open_the_breaker():
+    server, base_url, _ = _serve(500)
+    try:
+        breaker = CircuitBreaker(failure_threshold=2)
+        guidance = _guidance(base_url, circuit_breaker=breaker)
+        guidance.deadline = SessionDeadline(30.0, stage_min_budget={STAGE_ANALYSIS: 0.0})
+        for _ in range(2):
+            with pytest.raises(openai.InternalServerError):
+                guidance._create_completion(STAGE_ANALYSIS, model="m", messages=[{"role": "user", "content": "x"}])
+        with pytest.raises(DegradedModeError):
+            guidance._create_completion(STAGE_ANALYSIS, model="m", messages=[{"role": "user", "content": "x"}])
+    finally:
+        server.shutdown()
+
+
+def test_extraction_uses_analysis_text_not_earlier_degradation(fake_client):
+    client = fake_client(lambda request: json.dumps(
+        [{"evidence_type": "考勤记录", "importance": "关键证据"}], ensure_ascii=False))
+    guidance = LaborLawGuidance(client=client, local_extraction_threshold=1.1)
+    guidance._mark_degraded(STAGE_ANALYSIS, "上一个案例分析超时")
+
+    evidence = guidance.extract_required_evidence("有效的案例分析：需要考勤记录证明加班")
+    assert [e["evidence_type"] for e in evidence] == ["考勤记录"]
+    assert len(client.calls) == 1
+
+    client.calls.clear()
+    fallback = guidance.extract_required_evidence("AI分析失败: 超时")
+    assert len(fallback) == len(DEFAULT_EVIDENCE_ITEMS) and client.calls == []
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""stage_profiler 抽样剖析测试"""
+
+import json
+import os
+import threading
+import time
+
+from stage_profiler import StageProfiler
+
+
+class _Target:
+    """带有被剖析方法名的最小对象"""
+
+    def analyze_case_with_ai(self, conversation):
+        return "".join(str(i) for i in range(200))
+
+    def extract_required_evidence(self, analysis):
+        time.sleep(0.02)
+        return []
+
+
+def test_samples_every_nth_call_without_memory_by_default(tmp_path):
+    profiler = StageProfiler(str(tmp_path), sample_every=10)
+    target = profiler.attach(_Target())
+    for _ in range(25):
+        target.analyze_case_with_ai([])
+
+    info = profiler.summary()["analysis"]
+    assert info["calls"] == 25
+    assert info["profiled_calls"] == 3
+    assert info["peak_bytes"] is None
+
+    profiler.dump()
+    assert os.path.exists(tmp_path / "analysis.prof")
+    assert not os.path.exists(tmp_path / "analysis.alloc.txt")
+    with open(tmp_path / "summary.json", encoding="utf-8") as f:
+        assert json.load(f)["analysis"]["calls"] == 25
+
+
+def test_peak_only_reported_without_concurrent_calls(tmp_path):
+    profiler = StageProfiler(str(tmp_path), sample_every=1, trace_memory=True)
+    try:
+        target = profiler.attach(_Target())
+        target.analyze_case_with_ai([])
+        assert profiler.summary()["analysis"]["peak_bytes"] is not None
+
+        threads = [threading.Thread(target=target.extract_required_evidence, args=("",)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert all(info["peak_bytes"] is None for info in profiler.summary().values())
+    finally:
+        profiler.close()